@@ -0,0 +1,157 @@
+"""Running aggregates behind the admin dashboard.
+
+``RunningAggregates`` keeps counts per department and tool plus answer
+distributions for the summary questions. It is updated in O(1) per committed
+response by a store listener, so the dashboard never has to scan the stored
+responses. The counts live in a small SQLite table and each committed batch is
+added with one upsert, so every server process sharing the store (the
+segments backend runs one per replica) adds to the same counts.
+"""
+import collections
+import math
+import threading
+
+from storage import connect_shared, frame_records, transaction
+
+AGGREGATES_DB = 'survey_aggregates.db'
+
+# Answer distributions the dashboard summarises
+LIKERT_COLUMNS = ('satisfaction', 'ptw_ui_satisfaction', 'inv_ui_satisfaction')
+TIME_SAVED_COLUMNS = ('time_saved', 'ptw_time_saved', 'inv_time_saved')
+RECOMMENDATION_COLUMNS = ('ptw_recommendation',)
+TECHNICAL_ISSUE_COLUMNS = ('ptw_technical_issues', 'inv_technical_issues')
+TRACKED_COLUMNS = LIKERT_COLUMNS + TIME_SAVED_COLUMNS + RECOMMENDATION_COLUMNS + TECHNICAL_ISSUE_COLUMNS
+
+# Dimension of the single row counting every response
+TOTAL = 'total'
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS aggregates (
+        dimension TEXT NOT NULL,
+        answer TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (dimension, answer)
+    ) WITHOUT ROWID;
+"""
+
+UPSERT = """
+    INSERT INTO aggregates (dimension, answer, count) VALUES (?, ?, ?)
+    ON CONFLICT (dimension, answer) DO UPDATE SET count = count + excluded.count
+"""
+
+
+def answer_key(value):
+    """Return the answer as a count key, or None if it is missing
+
+    Answers read back from CSV may be numbers (``4`` or ``4.0``) or NaN, so
+    they are folded onto the strings the survey stores.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            value = int(value)
+    return str(value)
+
+
+class RunningAggregates:
+    """Counts over every stored response, updated incrementally"""
+
+    def __init__(self, path=AGGREGATES_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect_shared(path)
+        self._conn.executescript(SCHEMA)
+
+    def update(self, responses):
+        """Add a batch of committed responses to the counts"""
+        rows = count_rows(responses)
+        with self._lock, transaction(self._conn):
+            self._conn.executemany(UPSERT, rows)
+
+    def rebuild(self, store, chunk_size=10000):
+        """Recompute every count from the stored responses; returns the number read
+
+        The counts are taken before the table is written, so other processes'
+        updates wait only for the short transaction that replaces them.
+        """
+        counts = collections.Counter()
+        read = 0
+        for chunk in store.iter_chunks(chunk_size=chunk_size):
+            if chunk.empty:
+                continue
+            for dimension, answer, count in count_rows(frame_records(chunk)):
+                counts[dimension, answer] += count
+            read += len(chunk)
+        with self._lock, transaction(self._conn):
+            self._conn.execute('DELETE FROM aggregates')
+            self._conn.executemany(UPSERT, [key + (count,) for key, count in counts.items()])
+        return read
+
+    def is_empty(self):
+        """Check whether nothing has been counted yet"""
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM aggregates LIMIT 1').fetchone() is None
+
+    def total(self):
+        """Return the number of responses counted"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT count FROM aggregates WHERE dimension = ? AND answer = ''", (TOTAL,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def snapshot(self):
+        """Return a consistent copy of the counts as plain dicts"""
+        with self._lock:
+            rows = self._conn.execute('SELECT dimension, answer, count FROM aggregates').fetchall()
+        counts = {TOTAL: {}, 'department': {}, 'tool': {}}
+        counts.update({column: {} for column in TRACKED_COLUMNS})
+        for dimension, answer, count in rows:
+            if dimension in counts:
+                counts[dimension][answer] = count
+        return {
+            'total': counts[TOTAL].get('', 0),
+            'by_department': counts['department'],
+            'by_tool': counts['tool'],
+            'answers': {column: counts[column] for column in TRACKED_COLUMNS},
+        }
+
+
+def count_rows(records):
+    """Return upsert rows counting a batch of response dicts"""
+    counts = collections.Counter()
+    for record in records:
+        counts[TOTAL, ''] += 1
+        for dimension in ('department', 'tool') + TRACKED_COLUMNS:
+            answer = answer_key(record.get(dimension))
+            if answer is not None:
+                counts[dimension, answer] += 1
+    return [(dimension, answer, count) for (dimension, answer), count in counts.items()]
+
+
+def attach(store, path=AGGREGATES_DB):
+    """Open the aggregates (rebuilding them if empty) and keep them in sync with the store"""
+    aggregates = RunningAggregates(path)
+    if aggregates.is_empty():
+        aggregates.rebuild(store)
+    store.add_listener(aggregates.update, rebuild=aggregates.rebuild)
+    return aggregates
+
+
+def rate(counts, answers):
+    """Return the share of counted answers that are in ``answers``, or None"""
+    total = sum(counts.values())
+    if not total:
+        return None
+    return sum(counts.get(answer, 0) for answer in answers) / total
+
+
+def mean_score(counts):
+    """Return the mean of a Likert distribution keyed by score, or None"""
+    total = sum(counts.values())
+    if not total:
+        return None
+    return sum(int(score) * n for score, n in counts.items()) / total
@@ -0,0 +1,145 @@
+"""Survey KPIs computed with vectorized operations over coded answers.
+
+``coded_frame`` turns every closed-choice answer into an ordered Categorical
+over its question's options, so an answer is a small integer code rather
+than a string. KPI questions declare a numeric value per option in
+``questionnaires.json``; looking codes up in those value arrays scores a
+whole column with one NumPy indexing operation, and per-group KPIs are
+weighted ``bincount``s over the group codes.
+
+KPIs:
+
+``csat``
+    Share of satisfaction answers of 4 or 5, as a percentage.
+``recommendation``
+    NPS-style score: percentage answering Yes minus percentage answering No.
+``error_reduction``
+    Mean error-reduction value, from -100 (errors increased) to 100.
+``hours_saved``
+    Estimated hours saved from the time-saved buckets' midpoints, per
+    question, since questions ask about different periods.
+"""
+import numpy as np
+import pandas as pd
+
+from questionnaires import QUESTIONNAIRES
+
+# Satisfaction scores that count as satisfied
+CSAT_MIN_SCORE = 4
+
+# Closed-choice questions by response column
+CHOICE_QUESTIONS = {
+    q.column: q
+    for questionnaire in QUESTIONNAIRES.values()
+    for q in questionnaire.questions if q.widget == 'radio'
+}
+
+KPI_COLUMNS = {}
+for _question in CHOICE_QUESTIONS.values():
+    if _question.kpi:
+        KPI_COLUMNS.setdefault(_question.kpi, []).append(_question.column)
+
+
+def coded_frame(df):
+    """Return the responses with each closed-choice answer as an ordered Categorical
+
+    Answers that are not one of the question's options become missing.
+    """
+    coded = {}
+    for column, question in CHOICE_QUESTIONS.items():
+        if column not in df.columns:
+            continue
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            if question.value_type == 'int':
+                values = values.cat.rename_categories(str)
+            # Only the category list is rewritten, not every row
+            coded[column] = values.cat.set_categories(question.options, ordered=True)
+            continue
+        if question.value_type == 'int' and pd.api.types.is_numeric_dtype(values.dtype):
+            # Scores read back as numbers (CSV floats, Parquet Int8) map straight to codes
+            codes = pd.Index(question.values).get_indexer(values.to_numpy(dtype=float, na_value=np.nan))
+            coded[column] = pd.Categorical.from_codes(codes, categories=question.options, ordered=True)
+        else:
+            coded[column] = pd.Categorical(values, categories=question.options, ordered=True)
+    return df.assign(**coded) if coded else df
+
+
+def answer_values(df, column):
+    """Return a column's option values per row, NaN where it is unanswered"""
+    question = CHOICE_QUESTIONS[column]
+    if column not in df.columns:
+        return np.full(len(df), np.nan)
+    codes = df[column].cat.codes.to_numpy()
+    # Code -1 (missing) indexes the appended NaN
+    return np.append(np.asarray(question.values), np.nan)[codes]
+
+
+def first_answered(df, columns):
+    """Combine columns that no row answers more than one of into one value array"""
+    combined = np.full(len(df), np.nan)
+    for column in columns:
+        values = answer_values(df, column)
+        combined = np.where(np.isnan(combined), values, combined)
+    return combined
+
+
+def kpi_arrays(df):
+    """Return ``{name: per-row float array}`` for every KPI, NaN where unanswered"""
+    satisfaction = first_answered(df, KPI_COLUMNS.get('satisfaction', []))
+    arrays = {
+        'satisfaction': satisfaction,
+        'csat': np.where(np.isnan(satisfaction), np.nan, (satisfaction >= CSAT_MIN_SCORE) * 100.0),
+        'recommendation': first_answered(df, KPI_COLUMNS.get('recommendation', [])) * 100,
+        'error_reduction': first_answered(df, KPI_COLUMNS.get('error_reduction', [])) * 100,
+    }
+    for column in KPI_COLUMNS.get('hours_saved', []):
+        arrays[f'hours_saved:{column}'] = answer_values(df, column)
+    return arrays
+
+
+def _summarize(values):
+    answered = ~np.isnan(values)
+    count = int(answered.sum())
+    total = float(values[answered].sum())
+    return {'mean': total / count if count else None, 'total': total, 'answers': count}
+
+
+def compute_kpis(df):
+    """Return every KPI over a frame of responses
+
+    ``df`` may be raw or already coded. The result maps each KPI name to
+    ``{'mean', 'total', 'answers'}``; hours saved are keyed
+    ``hours_saved:<column>``.
+    """
+    df = coded_frame(df)
+    result = {'responses': len(df)}
+    for name, values in kpi_arrays(df).items():
+        result[name] = _summarize(values)
+    return result
+
+
+def kpis_by(df, by='tool'):
+    """Return a DataFrame of mean KPIs (and response counts) per department or tool"""
+    df = coded_frame(df)
+    if df.empty:
+        return pd.DataFrame()
+    groups = df[by].astype('category')
+    codes = groups.cat.codes.to_numpy()
+    size = len(groups.cat.categories)
+    table = {'responses': np.bincount(codes[codes >= 0], minlength=size)}
+    for name, values in kpi_arrays(df).items():
+        answered = (codes >= 0) & ~np.isnan(values)
+        sums = np.bincount(codes[answered], weights=values[answered], minlength=size)
+        counts = np.bincount(codes[answered], minlength=size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            table[name] = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    return pd.DataFrame(table, index=pd.Index(groups.cat.categories, name=by))
+
+
+def kpi_columns():
+    """Return the response columns ``compute_kpis`` and ``kpis_by`` read"""
+    columns = ['department', 'tool']
+    for names in KPI_COLUMNS.values():
+        columns.extend(names)
+    return columns
@@ -1,17 +1,32 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-import time
+from collections import deque
+from concurrent import futures
 import os
+import queue
+import re
+import time
+import uuid
+from contextlib import contextmanager
+
+import aggregates
+import analytics
+import assets
+import directory
+import duplicates
+import exports
+import imports
+import metrics
+import questionnaires
+import rollups
+import search
+import storage
+import timings
 
 # Initialize session state variables
 if 'current_step' not in st.session_state:
     st.session_state.current_step = 1
-if 'responses' not in st.session_state:
-    if os.path.exists('survey_responses.csv'):
-        st.session_state.responses = pd.read_csv('survey_responses.csv').to_dict('records')
-    else:
-        st.session_state.responses = []
 if 'admin_authenticated' not in st.session_state:
     st.session_state.admin_authenticated = False
 
@@ -22,219 +37,654 @@ st.set_page_config(
     layout="centered"
 )
 
-# Add custom CSS
-st.markdown("""
-    <style>
-    .main {
-        background-color: #f0f2f6;
-        padding: 20px;
-    }
-    
-    .stButton>button {
-        border-radius: 20px;
-        padding: 10px 24px;
-        font-weight: 500;
-        transition: all 0.3s ease;
-    }
-    
-    .stButton>button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 5px 15px rgba(0,0,0,0.1);
-    }
-    
-    h1, h2 {
-        font-family: 'Helvetica Neue', Arial, sans-serif;
-        text-align: center;
-        animation: fadeIn 1.5s ease-in;
-    }
+def get_setting(section, key, default):
+    """Read a value from secrets.toml, falling back to the default if it is not set"""
+    try:
+        return st.secrets[section][key]
+    except Exception:
+        # No secrets file, or the section/key is missing
+        return default
 
-    .title-wrapper {
-        background: white;
-        padding: 2rem;
-        border-radius: 10px;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-        margin-bottom: 2rem;
-    }
-    
-    .step-container {
-        padding: 20px;
-        border-radius: 10px;
-        background: white;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-        margin: 20px 0;
-        animation: slideIn 0.5s ease-out;
-    }
-    
-    @keyframes fadeIn {
-        0% { opacity: 0; }
-        100% { opacity: 1; }
-    }
-    
-    @keyframes slideIn {
-        0% { transform: translateY(20px); opacity: 0; }
-        100% { transform: translateY(0); opacity: 1; }
-    }
-    
-    .stProgress > div > div {
-        background-color: #2ecc71;
-        transition: all 0.3s ease;
-    }
-    
-    .success-message {
-        text-align: center;
-        padding: 40px;
-        background: linear-gradient(135deg, #a8e6cf 0%, #dcedc1 100%);
-        border-radius: 15px;
-        animation: popIn 0.5s cubic-bezier(0.68, -0.55, 0.265, 1.55);
-    }
-    
-    @keyframes popIn {
-        0% { transform: scale(0.8); opacity: 0; }
-        100% { transform: scale(1); opacity: 1; }
-    }
-    
-    .info-box {
-        background-color: #e8f4f8;
-        border-left: 5px solid #1f77b4;
-        padding: 10px 15px;
-        margin: 10px 0;
-        border-radius: 0 5px 5px 0;
-    }
+# Default password if secrets are not set up
+ADMIN_PASSWORD = get_setting("general", "admin_password", "@RVsolutions@1234")
 
-    .question-text {
-        font-size: 1.1rem;
-        font-weight: 500;
-        color: #2c3e50;
-        margin: 1.5rem 0 1rem 0;
-    }
+# Departments, tools, users and system numbers; edits are picked up without a restart
+DIRECTORY_FILE = get_setting("directory", "path", directory.DIRECTORY_FILE)
 
-    .stTextArea textarea {
-        border: 1px solid #ccc !important;
-        border-radius: 5px !important;
-        padding: 10px !important;
-        background-color: white !important;
-    }
+# Storage backend for responses: "csv" (append log + compacted CSV), "sqlite",
+# "parquet" (append log + per-questionnaire monthly Parquet partitions) or
+# "segments" (one append-only segment per server process, for replicas)
+STORAGE_BACKEND = get_setting("storage", "backend", "csv")
 
-    .stTextArea textarea:focus {
-        border-color: #1f77b4 !important;
-        box-shadow: 0 0 0 1px #1f77b4 !important;
-    }
+# Fold pending writes into the main store this often, in seconds; 0 leaves it
+# to the admin's Compact Storage button
+COMPACT_INTERVAL_S = get_setting("storage", "compact_interval_s", 0)
 
-    .stRadio > div {
-        display: flex !important;
-        flex-direction: column !important;
-        gap: 10px !important;
-        padding: 10px 0 !important;
-    }
-    
-    .stRadio > div > label {
-        padding: 8px 15px !important;
-        cursor: pointer !important;
-        border-radius: 4px !important;
-        transition: background-color 0.2s !important;
-        margin: 0 !important;
-    }
+# Running totals for the admin dashboard, shared by every server process
+AGGREGATES_FILE = get_setting("storage", "aggregates_path", aggregates.AGGREGATES_DB)
 
-    .stRadio > div > label:hover {
-        background-color: #f0f7ff !important;
-    }
+# Turn away a second response for the same department, tool, user and system
+# within this many hours; 0 only catches resubmissions of the same survey
+DUPLICATE_WINDOW_HOURS = get_setting("general", "duplicate_window_hours", duplicates.DUPLICATE_WINDOW_HOURS)
 
-    .stMultiSelect {
-        margin-top: 10px;
-    }
+# Last response each named export consumer has downloaded
+EXPORT_CURSORS_FILE = get_setting("storage", "cursors_path", exports.CURSORS_FILE)
 
-    .stMultiSelect > div {
-        background-color: white !important;
-        border: 1px solid #ddd !important;
-        border-radius: 5px !important;
-    }
+# Hourly/daily/weekly rollups behind the admin trend charts
+ROLLUPS_FILE = get_setting("storage", "rollups_path", rollups.ROLLUPS_DB)
 
-    .section-title {
-        color: #1f77b4;
-        font-size: 1.3rem;
-        font-weight: 600;
-        margin: 30px 0 20px 0;
-        padding-bottom: 10px;
-        border-bottom: 2px solid #edf2f7;
-    }
-    </style>
-""", unsafe_allow_html=True)
+# Full-text index of the free-text answers for the admin search
+SEARCH_INDEX_FILE = get_setting("storage", "search_path", search.SEARCH_DB)
 
-# Default password if secrets are not set up
-ADMIN_PASSWORD = "@RVsolutions@1234"
+# Rows per page in the admin response browser
+ADMIN_PAGE_SIZE = 100
+
+# Background writer: how long to gather submissions into one commit, how many
+# may be waiting, and how long Submit / the thank-you page wait on it
+COMMIT_INTERVAL_MS = get_setting("storage", "commit_interval_ms", 5)
+WRITE_QUEUE_SIZE = get_setting("storage", "write_queue_size", 1000)
+SUBMIT_TIMEOUT = 2.0
+DURABILITY_TIMEOUT = 10.0
+
+# Keep transition messages on screen for at least this long; the browser
+# fades them out, so the server never waits. 0 disables the notice.
+SPINNER_MIN_DISPLAY_MS = get_setting("general", "spinner_min_display_ms", 0)
+
+# Time the rerun phases, saves and commits into histograms shown in the
+# admin's Performance tab; off, the instrumentation does nothing at all
+PERFORMANCE_TIMING = get_setting("performance", "timing", False)
+
+# Keep each session's timings of its last this many reruns; 0 keeps none
+TRACE_RERUNS = get_setting("performance", "trace_reruns", 20)
+
+# Prometheus metrics of this process, served over HTTP on this port (0 for
+# none) and/or rewritten to this .prom file for node exporter's textfile
+# collector every METRICS_INTERVAL_S seconds
+METRICS_HOST = get_setting("metrics", "host", "127.0.0.1")
+METRICS_PORT = get_setting("metrics", "port", 0)
+METRICS_TEXTFILE = get_setting("metrics", "textfile", "")
+METRICS_INTERVAL_S = get_setting("metrics", "interval_s", metrics.TEXTFILE_INTERVAL_S)
+METRICS_ENABLED = bool(METRICS_PORT or METRICS_TEXTFILE)
+
+@st.cache_resource
+def get_timings():
+    """Return the phase timings shared by every session in this process"""
+    # The latency histograms of the metrics come from the timings
+    return timings.Timings(enabled=PERFORMANCE_TIMING or METRICS_ENABLED)
+
+TIMINGS = get_timings()
+
+# Link to the logo in static/ so browsers cache it, when Streamlit's static
+# file serving is on ([server] enableStaticServing)
+STATIC_SERVING = st.get_option("server.enableStaticServing")
+
+LOGO_WIDTH = 300
+
+TITLE_HTML = """
+    <div style='padding: 1.5rem 0; text-align: center;'>
+        <h2 style='
+            font-size: 1.8rem;
+            font-weight: 600;
+            color: #2ecc71;
+            margin-bottom: 2rem;
+        '>
+            🤖 Automation Tools Survey
+        </h2>
+    </div>
+"""
+
+@st.cache_resource
+def get_page_assets(static_serving):
+    """Return the stylesheet and title markup and the logo (bytes, or a URL when served statically)"""
+    if static_serving:
+        logo = assets.static_url(assets.LOGO)
+    else:
+        logo = assets.scaled_image(assets.LOGO, LOGO_WIDTH)
+    return assets.style_tag(), assets.compact_html(TITLE_HTML), logo
+
+@st.cache_resource
+def get_store():
+    """Return the response store shared by every session in this process"""
+    return storage.create_store(STORAGE_BACKEND)
+
+@st.cache_resource
+def get_aggregates():
+    """Return the running dashboard aggregates, kept in sync with the store"""
+    return aggregates.attach(get_store(), AGGREGATES_FILE)
+
+@st.cache_resource
+def get_rollups():
+    """Return the trend rollups, kept in sync with the store"""
+    return rollups.attach(get_store(), ROLLUPS_FILE)
 
-# Try to get password from secrets if available
-if hasattr(st, 'secrets') and 'general' in st.secrets:
+@st.cache_resource
+def get_search_index():
+    """Return the full-text index of free-text answers, kept in sync with the store"""
+    return search.attach(get_store(), SEARCH_INDEX_FILE)
+
+@st.cache_resource
+def get_duplicate_index():
+    """Return the index of recent submissions, kept in sync with the store"""
+    return duplicates.attach(get_store(), DUPLICATE_WINDOW_HOURS, is_shared=is_shared_identity)
+
+def is_shared_identity(response):
+    """Check if a response comes from a placeholder user or system many people answer as"""
+    return get_directory().is_shared(
+        response['department'], response['tool'], response['user'], response['system_number']
+    )
+
+@st.cache_resource
+def get_export_cursors():
+    """Return the registry of export consumers' cursors"""
+    return exports.ExportCursors(EXPORT_CURSORS_FILE)
+
+@st.cache_resource
+def get_compactor():
+    """Return the background compaction job, if one is configured"""
+    if COMPACT_INTERVAL_S:
+        return storage.PeriodicCompactor(get_store(), COMPACT_INTERVAL_S)
+    return None
+
+@st.cache_resource
+def get_metrics():
+    """Return this process's metrics registry, exposed as configured"""
+    registry = metrics.Registry()
+    registry.counter(
+        'survey_system_number_rejections_total',
+        "System numbers turned away because the tool is not installed on them",
+        ('department', 'tool')
+    )
+    registry.counter('survey_admin_logins_total', "Successful admin logins")
+    registry.counter('survey_admin_login_failures_total', "Admin logins with a wrong password")
+    metrics.attach(get_store(), registry, get_aggregates())
+    registry.add_collector(metrics.timings_collector(TIMINGS, {
+        'rerun': ('survey_rerun_duration_seconds', "Time to run the app script once"),
+        'commit': ('survey_commit_duration_seconds', "Time to durably commit a batch of responses"),
+    }))
     try:
-        ADMIN_PASSWORD = st.secrets["general"]["admin_password"]
-    except:
-        pass
-
-# Function to save responses to CSV
-def save_responses_to_csv():
-    df = pd.DataFrame(st.session_state.responses)
-    df.to_csv('survey_responses.csv', index=False)
-
-# Add system-tool mapping
-SYSTEM_TOOL_MAPPING = {
-    'TSG': {
-        'RA Invoice Tracker': ['RVS0F5C', 'RVS0F42', 'RVS1034'],
-        'RA PO Extraction Tool': ['Not Installed', 'Not Installed', 'Not Installed'],
-        'Telecom RAN KPI': ['Developed but Not Installed', 'Developed but Not Installed'],
-        'RV PermitFlow (PTW App)': ['RVS104C', 'RV Employee', 'Partner']
-    },
-    'Finance': {
-        'SMS & Tally Fnf Reco': ['RVS120A', 'RVS1094'],
-        'Samsung Collections Reco': ['Not Installed', 'Not Installed', 'Not Installed']
-    },
-    'CSD': {
-        'STN MIS Update Tool': ['RVSBF0', 'RVS0E77'],
-        'Realme Claim Update Tool': ['In Development', 'In Development'],
-        'RV SMS Claim Update Tool': ['In Development', 'In Development'],
-        'GR Invoice Generator': ['RVS0E7F'],
-        'Inventory & OOW Report Automation': ['RVS0E7F'],
-        'IW Invoice Generator': ['RVS0E7F']
-    }
-}
-
-# Your company data
-DEPARTMENT_DATA = {
-    'Finance': {
-        'tools': {
-            'SMS & Tally Fnf Reco': ['Anmol Dubey', 'Shruti Dixit'],
-            'Samsung Collections Reco': ['NA', 'NA']
-        }
-    },
-    'CSD': {
-        'tools': {
-            'STN MIS Update Tool': ['Inderjeet', 'Dushyant Kumar'],
-            'Realme Claim Update Tool': ['Hari Kishan', 'Mohit Senger'],
-            'RV SMS Claim Update Tool': ['Hari Kishan', 'Mohit Senger'],
-            'GR Invoice Generator': ['Zasim'],
-            'Inventory & OOW Report Automation': ['Zasim'],
-            'IW Invoice Generator': ['Zasim']
-        }
-    },
-    'TSG': {
-        'tools': {
-            'RA Invoice Tracker': ['Rekha Pujari', 'Kokil Goswami', 'Sonika'],
-            'RA PO Extraction Tool': ['NA', 'NA'],
-            'Telecom RAN KPI': ['NA', 'NA'],
-            'RV PermitFlow (PTW App)': ['Richa Babbar', 'RV Employee', 'Partner']
-        }
-    }
-}
+        if METRICS_PORT:
+            metrics.MetricsServer(registry, METRICS_HOST, METRICS_PORT)
+        if METRICS_TEXTFILE:
+            metrics.TextfileWriter(registry, METRICS_TEXTFILE, METRICS_INTERVAL_S)
+    except OSError:
+        # The survey works without its metrics
+        metrics.logger.exception("Could not expose the metrics")
+    return registry
+
+@st.cache_resource
+def get_writer():
+    """Return the background writer that group-commits submissions to the store"""
+    # Derived data must be listening before the first commit
+    get_aggregates()
+    get_rollups()
+    get_search_index()
+    get_duplicate_index()
+    get_compactor()
+    registry = get_metrics()
+    writer = storage.GroupCommitWriter(
+        get_store(),
+        max_pending=WRITE_QUEUE_SIZE,
+        commit_interval=COMMIT_INTERVAL_MS / 1000,
+        timings=TIMINGS
+    )
+    registry.gauge('survey_write_queue_pending', "Submissions waiting to be committed", function=writer.pending)
+    return writer
+
+# Function to persist a single submitted response
+@TIMINGS.timed('save_response')
+def save_response(response):
+    """Queue the response for the background writer; False if it is a duplicate or the queue stays full"""
+    writer = get_writer()
+    index = get_duplicate_index()
+    claim = index.claim(response)
+    if claim == duplicates.DUPLICATE:
+        st.error(
+            f"A response for {response['tool']} on system {response['system_number']} was already "
+            f"submitted by {response['user']} recently. Please contact the survey team if it needs changing."
+        )
+        return False
+    if claim == duplicates.ALREADY_SUBMITTED:
+        # The same survey sent again: keep waiting on the original save
+        if st.session_state.get('submission') is None:
+            future = futures.Future()
+            future.set_result(0)
+            st.session_state.submission = future
+        st.session_state.submitted_response = response
+        return True
+    try:
+        future = writer.submit(response, timeout=SUBMIT_TIMEOUT)
+    except queue.Full:
+        index.release(response)
+        st.error("The server is busy saving other responses. Please press Submit again in a moment.")
+        return False
+    future.add_done_callback(lambda done: done.exception() and index.release(response))
+    st.session_state.submitted_response = response
+    st.session_state.submission = future
+    return True
 
-def show_spinner_with_message(message, duration=0.5):
+@st.cache_resource
+def get_directory_source():
+    """Return the directory loader shared by every session in this process"""
+    return directory.DirectorySource(DIRECTORY_FILE)
+
+def get_directory():
+    """Return the current department/tool/user/system directory"""
+    return get_directory_source().get()
+
+@contextmanager
+def show_spinner_with_message(message):
+    """Show a spinner for exactly as long as the wrapped work takes"""
     with st.spinner(message):
-        time.sleep(duration)
+        yield
+    if SPINNER_MIN_DISPLAY_MS:
+        # Shown on the next run and faded out client-side
+        st.session_state.transition_notice = message
+
+def show_transition_notice():
+    """Render the pending transition message, if any, as a self-hiding notice"""
+    message = st.session_state.pop('transition_notice', None)
+    if message:
+        st.markdown(
+            f'<div class="transition-notice" style="animation-duration: {SPINNER_MIN_DISPLAY_MS}ms;">'
+            f'{message}</div>',
+            unsafe_allow_html=True
+        )
 
+@TIMINGS.timed('check_system_number')
 def check_system_number(department, tool, system_number):
     """Check if the system number is valid for the selected department and tool"""
-    if department in SYSTEM_TOOL_MAPPING and tool in SYSTEM_TOOL_MAPPING[department]:
-        valid_systems = SYSTEM_TOOL_MAPPING[department][tool]
-        return system_number in valid_systems
-    return False
+    valid = get_directory().has_system(department, tool, system_number)
+    if not valid:
+        get_metrics()['survey_system_number_rejections_total'].inc(department=department, tool=tool)
+    return valid
+
+def render_questionnaire(questionnaire):
+    """Render a compiled questionnaire's widgets and return the answers by column"""
+    answers = {}
+    for section in questionnaire.sections:
+        st.markdown(f'<div class="section-title">{section.title}</div>', unsafe_allow_html=True)
+        for question in section.questions:
+            st.markdown(f'<div class="question-text">{question.label}</div>', unsafe_allow_html=True)
+            if question.widget == 'radio':
+                answers[question.column] = st.radio(
+                    " ",
+                    question.options,
+                    key=question.key,
+                    index=None
+                )
+            elif question.widget == 'multiselect':
+                answers[question.column] = st.multiselect(
+                    " ",
+                    options=question.options,
+                    key=question.key
+                )
+            else:
+                answers[question.column] = st.text_area(
+                    " ",
+                    height=100,
+                    placeholder=question.placeholder,
+                    key=question.key
+                )
+    return answers
+
+def format_rate(value):
+    """Format a share as a percentage, or a dash when there is no data"""
+    return "—" if value is None else f"{value:.0%}"
+
+@TIMINGS.timed('admin.dashboard')
+def render_dashboard(summary):
+    """Render summary tiles and charts from the running aggregates"""
+    answers = summary['answers']
+    likert = {}
+    for column in aggregates.LIKERT_COLUMNS:
+        for score, n in answers[column].items():
+            likert[score] = likert.get(score, 0) + n
+    satisfaction = aggregates.mean_score(likert)
+    recommendation = {}
+    for column in aggregates.RECOMMENDATION_COLUMNS:
+        for answer, n in answers[column].items():
+            recommendation[answer] = recommendation.get(answer, 0) + n
+    issues = {}
+    for column in aggregates.TECHNICAL_ISSUE_COLUMNS:
+        for answer, n in answers[column].items():
+            issues[answer] = issues.get(answer, 0) + n
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Responses", summary['total'])
+    col2.metric("Avg. satisfaction", "—" if satisfaction is None else f"{satisfaction:.2f} / 5")
+    col3.metric("Would recommend", format_rate(aggregates.rate(recommendation, ['Yes'])))
+    col4.metric("Report tech issues", format_rate(
+        aggregates.rate(issues, ['Yes, frequently', 'Yes, occasionally'])
+    ))
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.caption("Responses per department")
+        st.bar_chart(pd.Series(summary['by_department'], dtype='int64'))
+    with col2:
+        st.caption("Responses per tool")
+        st.bar_chart(pd.Series(summary['by_tool'], dtype='int64'))
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.caption("Satisfaction scores (1-5)")
+        st.bar_chart(pd.DataFrame(
+            {column: answers[column] for column in aggregates.LIKERT_COLUMNS}
+        ).reindex(['1', '2', '3', '4', '5']).fillna(0))
+    with col2:
+        st.caption("Time saved")
+        st.bar_chart(pd.DataFrame(
+            {column: answers[column] for column in aggregates.TIME_SAVED_COLUMNS}
+        ).fillna(0))
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def get_kpis(_store, fingerprint):
+    """Return the KPI summary and per-tool table; recomputed only when the stored data changes"""
+    df = analytics.coded_frame(_store.load(columns=analytics.kpi_columns()))
+    return analytics.compute_kpis(df), analytics.kpis_by(df, 'tool')
+
+def format_score(kpi, suffix=""):
+    """Format a KPI mean for a metric tile"""
+    return "—" if kpi['mean'] is None else f"{kpi['mean']:.1f}{suffix}"
+
+def render_kpis(kpis, by_tool):
+    """Render the survey KPIs computed by the analytics module"""
+    col1, col2, col3 = st.columns(3)
+    col1.metric("CSAT (4-5 of 5)", format_score(kpis['csat'], "%"))
+    col2.metric("Recommendation score", format_score(kpis['recommendation']))
+    col3.metric("Error-reduction index", format_score(kpis['error_reduction']))
+
+    # Each questionnaire asks about a different period, given in the tooltip
+    hours = [
+        (questionnaire.label, q)
+        for questionnaire in questionnaires.QUESTIONNAIRES.values()
+        for q in questionnaire.questions if q.kpi == 'hours_saved'
+    ]
+    for col, (label, question) in zip(st.columns(len(hours)), hours):
+        col.metric(f"Hours saved: {label}", format_score(kpis[f'hours_saved:{question.column}'], " h"), help=question.text)
+
+    if not by_tool.empty:
+        st.caption("KPIs per tool")
+        st.dataframe(by_tool.rename(columns=lambda name: name.replace('hours_saved:', 'hours: ')).round(2))
+
+@TIMINGS.timed('admin.trends')
+def render_trends(trend_rollups):
+    """Render a trend chart read from the precomputed rollups"""
+    trend_metrics = {"Responses": rollups.RESPONSES}
+    for questionnaire in questionnaires.QUESTIONNAIRES.values():
+        for q in questionnaire.questions:
+            if q.value_type == 'int':
+                # Drop the scale explanation in brackets
+                trend_metrics[f"Mean score: {questionnaire.label} - {q.text.split(' (')[0]}"] = q.column
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        metric = trend_metrics[st.selectbox("Trend of:", options=list(trend_metrics), key="trend_metric")]
+    with col2:
+        granularity = st.selectbox("Per:", options=rollups.GRANULARITIES, index=1, key="trend_granularity")
+    with col3:
+        by = st.selectbox("By:", options=['tool', 'department'], key="trend_by")
+
+    trend = trend_rollups.trend(granularity, metric, by)
+    if trend.empty:
+        st.info("No responses to chart yet.")
+    else:
+        st.line_chart(trend)
+
+def highlight_snippet(snippet):
+    """Escape a search snippet for markdown and bold its matched terms"""
+    snippet = re.sub(r'([\\`*_{}\[\]()#+\-.!|<>~$])', r'\\\1', snippet.replace('\n', ' '))
+    return snippet.replace(search.HIGHLIGHT_START, '**').replace(search.HIGHLIGHT_END, '**')
+
+@TIMINGS.timed('admin.search')
+def render_feedback_search(index):
+    """Search the free-text answers through the full-text index"""
+    questions = {
+        q.column: q.text
+        for questionnaire in questionnaires.QUESTIONNAIRES.values()
+        for q in questionnaire.questions
+    }
+    org_directory = get_directory()
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        text = st.text_input(
+            "Search feedback:",
+            key="search_text",
+            placeholder='e.g. slow login, "offline mode", report*'
+        )
+    with col2:
+        department = st.selectbox("Department:", options=["All"] + list(org_directory.departments), key="search_department")
+    with col3:
+        tools = sorted({tool for d in org_directory.departments for tool in org_directory.tools(d)})
+        tool = st.selectbox("Tool:", options=["All"] + tools, key="search_tool")
+    if not text.strip():
+        return
+
+    started = time.perf_counter()
+    total, results = index.search(
+        text,
+        department=None if department == "All" else department,
+        tool=None if tool == "All" else tool
+    )
+    elapsed = (time.perf_counter() - started) * 1000
+    st.caption(f"{total} matching answers ({elapsed:.0f} ms)" + (f", best {len(results)} shown" if total > len(results) else ""))
+    for result in results:
+        st.markdown(
+            f"**{result['tool']}** · {result['department']} · {result['user']} · {result['timestamp']}  \n"
+            f"_{questions.get(result['question'], result['question'])}_  \n"
+            f"{highlight_snippet(result['snippet'])}"
+        )
+
+@TIMINGS.timed('admin.browser')
+def render_response_browser(store):
+    """Render the filtered, paged response table; return the match count and filters"""
+    st.markdown("#### 🔎 Browse Responses")
+    org_directory = get_directory()
+    col1, col2 = st.columns(2)
+    with col1:
+        questionnaire = st.selectbox(
+            "Questionnaire:",
+            options=[None] + list(questionnaires.QUESTIONNAIRES),
+            format_func=lambda name: questionnaires.QUESTIONNAIRES[name].label if name else "All questionnaires",
+            key="admin_questionnaire"
+        )
+        department = st.selectbox(
+            "Department:",
+            options=[None] + list(org_directory.departments),
+            format_func=lambda name: name or "All departments",
+            key="admin_department"
+        )
+        dates = st.date_input("Submitted between:", value=(), key="admin_dates")
+    with col2:
+        departments = [department] if department else org_directory.departments
+        tools = list(dict.fromkeys(tool for name in departments for tool in org_directory.tools(name)))
+        tool = st.selectbox(
+            "Tool:",
+            options=[None] + tools,
+            format_func=lambda name: name or "All tools",
+            key="admin_tool"
+        )
+        users = list(dict.fromkeys(
+            user for name in departments for tool_name in org_directory.tools(name)
+            if tool in (None, tool_name) for user in org_directory.users(name, tool_name)
+        ))
+        user = st.selectbox(
+            "User:",
+            options=[None] + users,
+            format_func=lambda name: name or "All users",
+            key="admin_user"
+        )
+        sort_col, order_col = st.columns(2)
+        with sort_col:
+            sort = st.selectbox("Sort by:", options=storage.BASE_COLUMNS[::-1], key="admin_sort")
+        with order_col:
+            descending = st.radio("Order:", ["Newest first", "Oldest first"], key="admin_order") == "Newest first"
+
+    filters = {
+        'questionnaire': questionnaire,
+        'department': department,
+        'tool': tool,
+        'user': user,
+        'start': dates[0] if len(dates) > 0 else None,
+        'end': dates[1] if len(dates) > 1 else None,
+    }
+    page_number = st.session_state.get('admin_page', 1)
+    with TIMINGS.phase('admin.query'):
+        total, page = store.query(filters, sort, descending, limit=ADMIN_PAGE_SIZE,
+                                  offset=(page_number - 1) * ADMIN_PAGE_SIZE)
+        pages = max(1, -(-total // ADMIN_PAGE_SIZE))
+        if page_number > pages:
+            # The filters changed and the old page no longer exists
+            page_number = st.session_state.admin_page = pages
+            total, page = store.query(filters, sort, descending, limit=ADMIN_PAGE_SIZE,
+                                      offset=(page_number - 1) * ADMIN_PAGE_SIZE)
+
+    if not total:
+        st.info("📊 No responses collected yet." if not any(filters.values()) else "No responses match these filters.")
+        return total, filters
+
+    with TIMINGS.phase('admin.table'):
+        st.dataframe(page, hide_index=True)
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        st.number_input("Page", min_value=1, max_value=pages, step=1, key="admin_page")
+    with col2:
+        first = (page_number - 1) * ADMIN_PAGE_SIZE + 1
+        st.caption(f"Showing responses {first}–{first + len(page) - 1} of {total}")
+    return total, filters
+
+@TIMINGS.timed('admin.export')
+def render_export(store, questionnaire):
+    """Build the requested export only when asked, then offer it for download"""
+    mode = st.radio(
+        "Export:",
+        options=["All matching responses", "New since consumer's cursor"],
+        horizontal=True,
+        key="export_mode"
+    )
+    delta = mode != "All matching responses"
+    col1, col2 = st.columns(2)
+    with col1:
+        fmt = st.selectbox(
+            "Export format:",
+            options=exports.available_formats(),
+            key="export_format"
+        )
+    with col2:
+        compress = st.checkbox("Gzip", key="export_gzip", disabled=fmt != 'csv') and fmt == 'csv'
+
+    if delta:
+        cursors = get_export_cursors()
+        known = cursors.all()
+        if known:
+            st.caption("Cursors: " + ", ".join(
+                f"{name} at #{cursor['seq']} ({cursor['updated']})" for name, cursor in known.items()
+            ))
+        consumer = st.text_input("Consumer name:", key="export_consumer", placeholder="e.g. nightly-bi").strip()
+        if not consumer:
+            st.info("Enter a consumer name; its cursor moves forward when the export is downloaded")
+            return
+        after = cursors.get(consumer)
+        request = ('delta', fmt, compress, consumer, after)
+    else:
+        request = ('all', fmt, questionnaire, compress)
+
+    if st.button("📦 Prepare Export", key="prepare-export"):
+        with st.spinner("Preparing export..."):
+            if delta:
+                path, upto = exports.get_delta_export(store, after, fmt, compress)
+                filename = exports.delta_filename(fmt, after, upto, compress)
+            else:
+                path, upto = exports.get_export(store, fmt, questionnaire, compress), None
+                filename = exports.export_filename(fmt, questionnaire, compress)
+            st.session_state.export = (request, path, filename, upto)
+
+    prepared = st.session_state.get('export')
+    if not prepared or prepared[0] != request:
+        return
+    _, path, filename, upto = prepared
+    if path is None:
+        st.info(f"No new responses for {consumer} since #{after}")
+    elif os.path.exists(path):
+        # The download button sends the whole file with every rerun, so only
+        # render it once the admin asks for it and drop it after the download
+        if st.button("⬇️ Prepare Download", key="prepare-download"):
+            st.session_state.export_download = request
+        if st.session_state.get('export_download') != request:
+            return
+        with open(path, 'rb') as f:
+            downloaded = st.download_button(
+                f"📅 Download Responses ({fmt.upper()})",
+                f,
+                filename,
+                exports.mime_type(fmt, compress),
+                key='download-export'
+            )
+        if downloaded:
+            del st.session_state.export_download
+            if delta:
+                cursors.advance(consumer, upto)
+                st.success(f"Cursor for {consumer} moved to #{upto}")
+
+@TIMINGS.timed('admin.import')
+def render_import(store):
+    """Store the valid rows of an uploaded file of offline responses and report the rest"""
+    st.markdown("#### 📥 Import Offline Responses")
+    st.download_button(
+        "📄 Download Import Template",
+        ','.join(imports.template_columns()) + '\n',
+        'survey_import_template.csv',
+        'text/csv',
+        key='download-import-template'
+    )
+    upload = st.file_uploader("Responses file:", type=imports.available_formats(), key="import_file")
+    if upload is not None and st.button("📥 Import Responses", key="import-responses"):
+        with st.spinner("Validating and storing responses..."):
+            # Derived data must be listening before the rows are committed
+            get_writer()
+            try:
+                df = imports.read_upload(upload, os.path.splitext(upload.name)[1].lstrip('.').lower())
+                imported, rejected = imports.import_responses(store, df, get_directory())
+            except ValueError as exc:
+                st.error(f"Could not import {upload.name}: {exc}")
+                return
+        st.session_state.import_report = (upload.name, imported, rejected)
+        st.rerun()
+
+    report = st.session_state.get('import_report')
+    if not report:
+        return
+    name, imported, rejected = report
+    st.success(f"Imported {imported} responses from {name}")
+    if len(rejected):
+        st.warning(f"{len(rejected)} rows were rejected")
+        st.dataframe(rejected.head(ADMIN_PAGE_SIZE), hide_index=True)
+        st.download_button(
+            "📅 Download Rejection Report",
+            rejected.to_csv(index=False),
+            os.path.splitext(name)[0] + '_rejected.csv',
+            'text/csv',
+            key='download-rejections'
+        )
+
+def render_performance():
+    """Render this process's phase timings and this session's recent reruns"""
+    if not TIMINGS.enabled:
+        st.info("Timing is off. Set timing = true under [performance] in secrets.toml to record it.")
+        return
+    summary = TIMINGS.summary()
+    if not summary:
+        st.info("No timings recorded yet.")
+        return
+    st.caption("Milliseconds per phase, across every session since the server started")
+    st.dataframe(pd.DataFrame(summary).round(1), hide_index=True)
+    if st.button("🧹 Reset Timings", key="reset-timings"):
+        TIMINGS.reset()
+        st.rerun()
+
+    reruns = st.session_state.get('rerun_trace')
+    if reruns:
+        st.caption(f"Milliseconds per phase in this session's last {len(reruns)} reruns, newest first")
+        st.dataframe(pd.DataFrame(list(reruns)[::-1]).round(1), hide_index=True)
 
 def check_admin_password():
     """Check if admin password is correct"""
@@ -242,9 +692,11 @@ def check_admin_password():
         password = st.text_input("Enter admin password:", type="password")
         if st.button("Login"):
             if password == ADMIN_PASSWORD:
+                get_metrics()['survey_admin_logins_total'].inc()
                 st.session_state.admin_authenticated = True
                 st.rerun()
             else:
+                get_metrics()['survey_admin_login_failures_total'].inc()
                 st.error("Incorrect password")
         return False
     return True
@@ -253,28 +705,29 @@ def reset_form():
     """Reset the form to initial state"""
     st.session_state.current_step = 1
     for key in list(st.session_state.keys()):
-        if key not in ['responses', 'current_step', 'admin_authenticated']:
+        if key not in ['current_step', 'admin_authenticated', 'rerun_trace']:
             del st.session_state[key]
 
+@TIMINGS.timed('rerun')
 def main():
+    # Starts the metrics exporter with the first session
+    get_metrics()
+
+    style, title, logo = get_page_assets(STATIC_SERVING)
+    with TIMINGS.phase('css'):
+        st.markdown(style, unsafe_allow_html=True)
+
     # Add Logo with controlled size
-    col1, col2, col3 = st.columns([1,2,1])
-    with col2:
-        st.image('logo.png', width=300)  # Adjust width to 200 pixels
+    with TIMINGS.phase('logo'):
+        col1, col2, col3 = st.columns([1,2,1])
+        with col2:
+            if STATIC_SERVING:
+                st.markdown(f'<img src="{logo}" width="{LOGO_WIDTH}" alt="Logo">', unsafe_allow_html=True)
+            else:
+                st.image(logo, width=LOGO_WIDTH)
     
     # Title and Heading
-    st.markdown("""
-        <div style='padding: 1.5rem 0; text-align: center;'>
-            <h2 style='
-                font-size: 1.8rem;
-                font-weight: 600;
-                color: #2ecc71;
-                margin-bottom: 2rem;
-            '>
-                🤖 Automation Tools Survey
-            </h2>
-        </div>
-    """, unsafe_allow_html=True)
+    st.markdown(title, unsafe_allow_html=True)
     
     # Progress indicator
     if st.session_state.current_step < 6:
@@ -284,559 +737,182 @@ def main():
         with col2:
             st.write(f"Step {st.session_state.current_step} of 5")
     
+    show_transition_notice()
+    
     # Main form container with animation
     st.markdown(f'<div class="step-container">', unsafe_allow_html=True)
     
-    if st.session_state.current_step == 1:
-        st.markdown("### 👥 Department Selection")
-        st.markdown('<div class="info-box">Please select your department to begin the survey.</div>', 
-                   unsafe_allow_html=True)
-        department = st.selectbox(
-            "Choose your department:",
-            options=list(DEPARTMENT_DATA.keys())
-        )
-        if st.button("Next →"):
-            show_spinner_with_message("Saving department selection...")
-            st.session_state.department = department
-            st.session_state.current_step = 2
-            st.rerun()
-            
-    elif st.session_state.current_step == 2:
-        st.markdown("### 🛠️ Tool Selection")
-        st.markdown(f'<div class="info-box">Department: {st.session_state.department}</div>', 
-                   unsafe_allow_html=True)
-        tool = st.selectbox(
-            "Which automation tool are you using?",
-            options=list(DEPARTMENT_DATA[st.session_state.department]['tools'].keys())
-        )
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("← Back"):
-                st.session_state.current_step = 1
+    with TIMINGS.phase(f"step.{st.session_state.current_step}"):
+        if st.session_state.current_step == 1:
+            st.markdown("### 👥 Department Selection")
+            st.markdown('<div class="info-box">Please select your department to begin the survey.</div>', 
+                       unsafe_allow_html=True)
+            department = st.selectbox(
+                "Choose your department:",
+                options=get_directory().departments
+            )
+            if st.button("Next →", key="department-next"):
+                with show_spinner_with_message("Saving department selection..."):
+                    st.session_state.department = department
+                    st.session_state.current_step = 2
                 st.rerun()
-        with col2:
-            if st.button("Next →"):
-                show_spinner_with_message("Loading tool information...")
-                st.session_state.tool = tool
-                st.session_state.current_step = 3
-                st.rerun()
-                
-    elif st.session_state.current_step == 3:
-        st.subheader("👤 User Selection")
-        st.info(f"Department: {st.session_state.department} | Tool: {st.session_state.tool}")
-        user = st.selectbox(
-            "Select your name:",
-            options=DEPARTMENT_DATA[st.session_state.department]['tools'][st.session_state.tool]
-        )
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("Back"):
-                st.session_state.current_step = 2
-                st.rerun()
-        with col2:
-            if st.button("Next"):
-                st.session_state.user = user
-                st.session_state.current_step = 4
-                st.rerun()
-                
-    elif st.session_state.current_step == 4:
-        st.subheader("💻 System Information")
-        st.info(f"Department: {st.session_state.department} | Tool: {st.session_state.tool} | User: {st.session_state.user}")
-        
-        system_number = st.text_input("Enter your system number:")
-        
-        is_valid_format = len(system_number) >= 5 if system_number else False
-        is_valid_system = check_system_number(st.session_state.department, st.session_state.tool, system_number)
-        
-        if system_number:
-            if not is_valid_format:
-                st.warning("System number should be at least 5 characters long")
-            elif not is_valid_system:
-                st.error(f"❌ The tool '{st.session_state.tool}' is not installed on system {system_number}. Please contact harpinder.singh@rvsolutions.in if you believe this is an error.")
-            
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("Back"):
-                st.session_state.current_step = 3
-                st.rerun()
-        with col2:
-            if st.button("Next", disabled=not (is_valid_format and is_valid_system)):
-                st.session_state.system_number = system_number
-                st.session_state.current_step = 5
-                st.rerun()
-    
-    elif st.session_state.current_step == 5:
-        st.markdown("### 📋 Survey Questions")
-        st.markdown(
-            f'<div class="info-box">'
-            f'Department: {st.session_state.department} | '
-            f'Tool: {st.session_state.tool} | '
-            f'User: {st.session_state.user}'
-            f'</div>', 
-            unsafe_allow_html=True
-        )
-
-        # Initialize response dictionary
-        response = {}
-
-        if st.session_state.tool == "RV PermitFlow (PTW App)":
-            # PTW-specific questions
-            # Tool Usage and Satisfaction
-            st.markdown('<div class="section-title">🛠 Tool Usage and Satisfaction</div>', unsafe_allow_html=True)
-            
-            st.markdown('<div class="question-text">How frequently do you use the PTW automation tool? *</div>', unsafe_allow_html=True)
-            ptw_frequency = st.radio(
-                " ", 
-                ['Daily', 'Weekly', 'Occasionally', 'Rarely', 'Never'],
-                key="ptw_frequency_radio",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">How satisfied are you with the PTW automation tool\'s user interface? (1 = Very Dissatisfied, 5 = Very Satisfied) *</div>', unsafe_allow_html=True)
-            ptw_ui_satisfaction = st.radio(
-                " ", 
-                ['1', '2', '3', '4', '5'],
-                key="ptw_ui_satisfaction_radio",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">What improvements would you suggest for the PTW automation tool\'s usability? *</div>', unsafe_allow_html=True)
-            ptw_usability_improvements = st.text_area(
-                " ", 
-                height=100,
-                placeholder="Please share your suggestions for usability improvements...",
-                key="ptw_usability_improvements"
-            )
-            
-            st.markdown('<div class="question-text">How well does the PTW automation tool handle the most common PTW processes? *</div>', unsafe_allow_html=True)
-            ptw_process_handling = st.radio(
-                " ", 
-                ['Very well', 'Adequately', 'Needs improvement', 'Not effective'],
-                key="ptw_process_handling_radio",
-                index=None
-            )
-            
-            # Time and Productivity Impact
-            st.markdown('<div class="section-title">⏱ Time and Productivity Impact</div>', unsafe_allow_html=True)
-            
-            st.markdown('<div class="question-text">On average, how much time do you save per PTW task due to automation? *</div>', unsafe_allow_html=True)
-            ptw_time_saved = st.radio(
-                " ", 
-                ['10-30 minutes', '30 minutes to 1 hour', '1-2 hours', 'More than 2 hours'],
-                key="ptw_time_saved_radio",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">Has the PTW automation tool helped in reducing manual errors or delays in PTW processing? *</div>', unsafe_allow_html=True)
-            ptw_error_reduction = st.radio(
-                " ", 
-                ['Significantly', 'Moderately', 'Slightly', 'Not at all'],
-                key="ptw_error_reduction_radio",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">How has the PTW automation impacted your overall workflow? *</div>', unsafe_allow_html=True)
-            ptw_workflow_impact = st.multiselect(
-                " ", 
-                options=['Improved efficiency', 'Streamlined communication', 'Reduced stress', 'No significant change'],
-                key="ptw_workflow_impact_multi"
-            )
-            
-            # System Performance & Support
-            st.markdown('<div class="section-title">⚙ System Performance & Support</div>', unsafe_allow_html=True)
-            
-            st.markdown('<div class="question-text">Have you encountered any technical issues or bugs while using the PTW automation tool? *</div>', unsafe_allow_html=True)
-            ptw_technical_issues = st.radio(
-                " ", 
-                ['Yes, frequently', 'Yes, occasionally', 'No issues encountered'],
-                key="ptw_technical_issues_radio",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">How would you rate the support provided for the PTW automation tool? *</div>', unsafe_allow_html=True)
-            ptw_support_rating = st.radio(
-                " ", 
-                ['Excellent', 'Good', 'Fair', 'Poor'],
-                key="ptw_support_rating_radio",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">How easy was it to adapt to the PTW automation tool compared to the manual process? *</div>', unsafe_allow_html=True)
-            ptw_adaptation_ease = st.radio(
-                " ", 
-                ['Very easy', 'Easy', 'Neutral', 'Difficult', 'Very difficult'],
-                key="ptw_adaptation_ease_radio",
-                index=None
-            )
-            
-            # Overall Feedback and Future Use
-            st.markdown('<div class="section-title">📝 Overall Feedback and Future Use</div>', unsafe_allow_html=True)
             
-            st.markdown('<div class="question-text">Do you feel that the PTW automation tool has improved the overall PTW process efficiency in your department? *</div>', unsafe_allow_html=True)
-            ptw_process_efficiency = st.radio(
-                " ", 
-                ['Strongly agree', 'Agree', 'Neutral', 'Disagree', 'Strongly disagree'],
-                key="ptw_process_efficiency_radio",
-                index=None
+        elif st.session_state.current_step == 2:
+            st.markdown("### 🛠️ Tool Selection")
+            st.markdown(f'<div class="info-box">Department: {st.session_state.department}</div>', 
+                       unsafe_allow_html=True)
+            tool = st.selectbox(
+                "Which automation tool are you using?",
+                options=get_directory().tools(st.session_state.department)
             )
-            
-            st.markdown('<div class="question-text">Would you recommend the PTW automation tool to others in your department or organization? *</div>', unsafe_allow_html=True)
-            ptw_recommendation = st.radio(
-                " ", 
-                ['Yes', 'No', 'Not sure'],
-                key="ptw_recommendation_radio",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">What additional features or improvements would you like to see in future versions of the PTW automation tool? *</div>', unsafe_allow_html=True)
-            ptw_future_improvements = st.text_area(
-                " ", 
-                height=100,
-                placeholder="Please share your suggestions for future improvements...",
-                key="ptw_future_improvements"
-            )
-            
-            # Navigation buttons
             col1, col2 = st.columns(2)
             with col1:
-                if st.button("← Back"):
-                    st.session_state.current_step = 4
+                if st.button("← Back", key="tool-back"):
+                    st.session_state.current_step = 1
                     st.rerun()
             with col2:
-                if st.button("Submit"):
-                    required_fields = [
-                        ptw_frequency, ptw_ui_satisfaction, ptw_usability_improvements, ptw_process_handling,
-                        ptw_time_saved, ptw_error_reduction, ptw_workflow_impact, ptw_technical_issues,
-                        ptw_support_rating, ptw_adaptation_ease, ptw_process_efficiency, ptw_recommendation,
-                        ptw_future_improvements
-                    ]
-                    if not all(required_fields):
-                        st.error("Please answer all required questions marked with *")
-                    else:
-                        response = {
-                            'department': st.session_state.department,
-                            'tool': st.session_state.tool,
-                            'user': st.session_state.user,
-                            'system_number': st.session_state.system_number,
-                            'ptw_frequency': ptw_frequency,
-                            'ptw_ui_satisfaction': ptw_ui_satisfaction,
-                            'ptw_usability_improvements': ptw_usability_improvements,
-                            'ptw_process_handling': ptw_process_handling,
-                            'ptw_time_saved': ptw_time_saved,
-                            'ptw_error_reduction': ptw_error_reduction,
-                            'ptw_workflow_impact': ', '.join(ptw_workflow_impact),
-                            'ptw_technical_issues': ptw_technical_issues,
-                            'ptw_support_rating': ptw_support_rating,
-                            'ptw_adaptation_ease': ptw_adaptation_ease,
-                            'ptw_process_efficiency': ptw_process_efficiency,
-                            'ptw_recommendation': ptw_recommendation,
-                            'ptw_future_improvements': ptw_future_improvements,
-                            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        }
-                        st.session_state.responses.append(response)
-                        st.session_state.current_step = 6
-                        st.rerun()
-
-        elif st.session_state.tool == "Inventory & OOW Report Automation":
-            # Inventory & OOW-specific questions
-            # Tool Usage and Satisfaction
-            st.markdown('<div class="section-title">🛠 Tool Usage and Satisfaction</div>', unsafe_allow_html=True)
-            
-            st.markdown('<div class="question-text">How frequently do you use the Inventory & OOW Report Automation tool? *</div>', unsafe_allow_html=True)
-            inv_frequency = st.radio(
-                " ", 
-                ['Daily', 'Weekly', 'Occasionally', 'Rarely', 'Never'],
-                key="inv_frequency_radio",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">How satisfied are you with the user interface of the Inventory & OOW Report Automation tool? (1 = Very Dissatisfied, 5 = Very Satisfied) *</div>', unsafe_allow_html=True)
-            inv_ui_satisfaction = st.radio(
-                " ", 
-                ['1', '2', '3', '4', '5'],
-                key="inv_ui_satisfaction_radio",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">What improvements would you suggest for the usability of the Inventory & OOW Report Automation tool? *</div>', unsafe_allow_html=True)
-            inv_usability_improvements = st.text_area(
-                " ", 
-                height=100,
-                placeholder="Please share your suggestions for improving the tool’s usability...",
-                key="inv_usability_improvements"
-            )
-            
-            st.markdown('<div class="question-text">How effective is the dashboard in providing insights into inventory and OOW data? *</div>', unsafe_allow_html=True)
-            inv_dashboard_effectiveness = st.radio(
-                " ", 
-                ['Very effective', 'Moderately effective', 'Slightly effective', 'Not effective'],
-                key="inv_dashboard_effectiveness_radio",
-                index=None
-            )
-            
-            # Time and Productivity Impact
-            st.markdown('<div class="section-title">⏱ Time and Productivity Impact</div>', unsafe_allow_html=True)
-            
-            st.markdown('<div class="question-text">On average, how much time do you save per inventory or OOW report task due to automation? *</div>', unsafe_allow_html=True)
-            inv_time_saved = st.radio(
-                " ", 
-                ['10-30 minutes', '30 minutes to 1 hour', '1-2 hours', 'More than 2 hours'],
-                key="inv_time_saved_radio",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">Has the Inventory & OOW Report Automation tool reduced manual errors in report generation or email distribution? *</div>', unsafe_allow_html=True)
-            inv_error_reduction = st.radio(
-                " ", 
-                ['Significantly', 'Moderately', 'Slightly', 'Not at all'],
-                key="inv_error_reduction_radio",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">Which aspects of your inventory and OOW reporting workflow have been improved by the automation tool? (Select all that apply) *</div>', unsafe_allow_html=True)
-            inv_workflow_impact = st.multiselect(
-                " ", 
-                options=['Faster report generation', 'Accurate data summaries', 'Simplified email distribution', 'Reduced manual data entry', 'No significant change'],
-                key="inv_workflow_impact_multi"
-            )
-            
-            # System Performance & Support
-            st.markdown('<div class="section-title">⚙ System Performance & Support</div>', unsafe_allow_html=True)
-            
-            st.markdown('<div class="question-text">Have you encountered any technical issues or bugs while using the Inventory & OOW Report Automation tool? *</div>', unsafe_allow_html=True)
-            inv_technical_issues = st.radio(
-                " ", 
-                ['Yes, frequently', 'Yes, occasionally', 'No issues encountered'],
-                key="inv_technical_issues_radio",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">How would you rate the support provided for the Inventory & OOW Report Automation tool? *</div>', unsafe_allow_html=True)
-            inv_support_rating = st.radio(
-                " ", 
-                ['Excellent', 'Good', 'Fair', 'Poor'],
-                key="inv_support_rating_radio",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">How easy was it to configure the tool (e.g., setting up Excel files, output folders, or email settings)? *</div>', unsafe_allow_html=True)
-            inv_config_ease = st.radio(
-                " ", 
-                ['Very easy', 'Easy', 'Neutral', 'Difficult', 'Very difficult'],
-                key="inv_config_ease_radio",
-                index=None
-            )
-            
-            # Overall Feedback and Future Use
-            st.markdown('<div class="section-title">📝 Overall Feedback and Future Use</div>', unsafe_allow_html=True)
-            
-            st.markdown('<div class="question-text">Do you agree that the Inventory & OOW Report Automation tool has improved the efficiency of inventory and OOW reporting in your department? *</div>', unsafe_allow_html=True)
-            inv_process_efficiency = st.radio(
-                " ", 
-                ['Strongly agree', 'Agree', 'Neutral', 'Disagree', 'Strongly disagree'],
-                key="inv_process_efficiency_radio",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">What additional features or improvements would you like to see in future versions of the Inventory & OOW Report Automation tool? *</div>', unsafe_allow_html=True)
-            inv_future_improvements = st.text_area(
-                " ", 
-                height=100,
-                placeholder="Please share your suggestions for future features or improvements...",
-                key="inv_future_improvements"
-            )
-            
-            st.markdown('<div class="question-text">Do you have any additional comments or feedback about the Inventory & OOW Report Automation tool? (Optional)</div>', unsafe_allow_html=True)
-            inv_additional_feedback = st.text_area(
-                " ", 
-                height=100,
-                placeholder="Please share any additional feedback...",
-                key="inv_additional_feedback"
+                if st.button("Next →", key="tool-next"):
+                    with show_spinner_with_message("Loading tool information..."):
+                        st.session_state.tool = tool
+                        st.session_state.current_step = 3
+                    st.rerun()
+                
+        elif st.session_state.current_step == 3:
+            st.subheader("👤 User Selection")
+            st.info(f"Department: {st.session_state.department} | Tool: {st.session_state.tool}")
+            user = st.selectbox(
+                "Select your name:",
+                options=get_directory().users(st.session_state.department, st.session_state.tool)
             )
-            
-            # Navigation buttons
             col1, col2 = st.columns(2)
             with col1:
-                if st.button("← Back"):
-                    st.session_state.current_step = 4
+                if st.button("Back", key="user-back"):
+                    st.session_state.current_step = 2
                     st.rerun()
             with col2:
-                if st.button("Submit"):
-                    required_fields = [
-                        inv_frequency, inv_ui_satisfaction, inv_usability_improvements, inv_dashboard_effectiveness,
-                        inv_time_saved, inv_error_reduction, inv_workflow_impact, inv_technical_issues,
-                        inv_support_rating, inv_config_ease, inv_process_efficiency,
-                        inv_future_improvements
-                    ]
-                    if not all(required_fields):
-                        st.error("Please answer all required questions marked with *")
-                    else:
-                        response = {
-                            'department': st.session_state.department,
-                            'tool': st.session_state.tool,
-                            'user': st.session_state.user,
-                            'system_number': st.session_state.system_number,
-                            'inv_frequency': inv_frequency,
-                            'inv_ui_satisfaction': inv_ui_satisfaction,
-                            'inv_usability_improvements': inv_usability_improvements,
-                            'inv_dashboard_effectiveness': inv_dashboard_effectiveness,
-                            'inv_time_saved': inv_time_saved,
-                            'inv_error_reduction': inv_error_reduction,
-                            'inv_workflow_impact': ', '.join(inv_workflow_impact),
-                            'inv_technical_issues': inv_technical_issues,
-                            'inv_support_rating': inv_support_rating,
-                            'inv_config_ease': inv_config_ease,
-                            'inv_process_efficiency': inv_process_efficiency,
-                            'inv_future_improvements': inv_future_improvements,
-                            'inv_additional_feedback': inv_additional_feedback,
-                            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        }
-                        st.session_state.responses.append(response)
-                        st.session_state.current_step = 6
-                        st.rerun()
-
-        else:
-            # General questions for other tools
-            st.markdown('<div class="section-title">🛠 Tool Usage and Satisfaction</div>', unsafe_allow_html=True)
-            
-            st.markdown('<div class="question-text">How long have you been using this tool? *</div>', unsafe_allow_html=True)
-            usage_duration = st.radio(
-                " ", 
-                ['Less than 1 month', '1-3 months', 'More than 3 months'],
-                key="duration_radio",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">On a scale of 1-5, how satisfied are you with the tool? (1 = Very Dissatisfied, 5 = Very Satisfied) *</div>', unsafe_allow_html=True)
-            satisfaction = st.radio(
-                " ", 
-                ['1', '2', '3', '4', '5'],
-                key="satisfaction_radio",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">What aspects of the tool do you find most valuable? (Select all that apply) *</div>', unsafe_allow_html=True)
-            features = st.multiselect(
-                " ", 
-                options=['Easy to use', 'Reduces manual work', 'Improves accuracy', 'Speeds up processes', 'Other'],
-                key="features_select"
-            )
-            
-            st.markdown('<div class="section-title">⏱ Time and Productivity Impact</div>', unsafe_allow_html=True)
-            
-            st.markdown('<div class="question-text">On average, how much time do you save daily using this tool? *</div>', unsafe_allow_html=True)
-            time_saved = st.radio(
-                " ", 
-                ['30-60 minutes', '1-2 hours', '2-4 hours', 'More than 4 hours'],
-                key="time_saved_radio",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">What percentage of your previous manual tasks has been automated? *</div>', unsafe_allow_html=True)
-            automation_percentage = st.radio(
-                " ", 
-                ['0-25%', '26-50%', '51-75%', '76-100%'],
-                key="automation_radio",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">How are you utilizing the time saved through automation? *</div>', unsafe_allow_html=True)
-            time_utilization = st.text_area(
-                " ", 
-                height=100,
-                placeholder="Please describe how you are using the time saved...",
-                key="time_util"
-            )
-            
-            st.markdown('<div class="section-title">📈 Process Improvement</div>', unsafe_allow_html=True)
-            
-            st.markdown('<div class="question-text">Have you noticed any reduction in errors since using the automation tool? *</div>', unsafe_allow_html=True)
-            error_reduction = st.radio(
-                " ", 
-                ['Yes', 'No', 'Errors have increased'],
-                key="error_red",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">Do you have any suggestions for improving the tool? *</div>', unsafe_allow_html=True)
-            suggestions = st.text_area(
-                " ", 
-                height=100,
-                placeholder="Please share your suggestions for improvement...",
-                key="suggestions"
-            )
-            
-            st.markdown('<div class="question-text">How has the automation tool affected your job satisfaction? *</div>', unsafe_allow_html=True)
-            job_satisfaction = st.radio(
-                " ", 
-                ['Positively', 'No Change', 'Negatively'],
-                key="job_satisfaction",
-                index=None
-            )
-            
-            st.markdown('<div class="question-text">Additional comments or feedback (Optional):</div>', unsafe_allow_html=True)
-            additional_feedback = st.text_area(
-                " ", 
-                height=100,
-                placeholder="Please share any additional feedback...",
-                key="feedback"
-            )
-            
-            # Navigation buttons
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.button("← Back"):
+                if st.button("Next", key="user-next"):
+                    st.session_state.user = user
                     st.session_state.current_step = 4
                     st.rerun()
-            with col2:
-                if st.button("Submit"):
-                    if not features:
-                        st.error("Please select at least one valuable feature")
-                    elif not usage_duration or not satisfaction or not time_saved or not automation_percentage or not time_utilization or not error_reduction or not job_satisfaction:
-                        st.error("Please answer all required questions marked with *")
+                
+        elif st.session_state.current_step == 4:
+            st.subheader("💻 System Information")
+            st.info(f"Department: {st.session_state.department} | Tool: {st.session_state.tool} | User: {st.session_state.user}")
+        
+            # Validated once when the form is submitted rather than on every keystroke
+            with st.form("system_form"):
+                system_number = st.text_input("Enter your system number:")
+            
+                col1, col2 = st.columns(2)
+                with col1:
+                    back = st.form_submit_button("Back")
+                with col2:
+                    next_step = st.form_submit_button("Next")
+        
+            if back:
+                st.session_state.current_step = 3
+                st.rerun()
+            if next_step:
+                if len(directory.normalize_system_number(system_number)) < directory.MIN_SYSTEM_NUMBER_LENGTH:
+                    st.warning(f"System number should be at least {directory.MIN_SYSTEM_NUMBER_LENGTH} characters long")
+                elif not check_system_number(st.session_state.department, st.session_state.tool, system_number):
+                    st.error(f"❌ The tool '{st.session_state.tool}' is not installed on system {system_number}. Please contact harpinder.singh@rvsolutions.in if you believe this is an error.")
+                else:
+                    system_number = get_directory().canonical_system_number(system_number)
+                    respondent = {
+                        'department': st.session_state.department,
+                        'tool': st.session_state.tool,
+                        'user': st.session_state.user,
+                        'system_number': system_number,
+                    }
+                    if get_duplicate_index().recently_submitted(respondent):
+                        st.error(f"❌ {st.session_state.user} has already submitted this survey for system {system_number}.")
                     else:
-                        response = {
-                            'department': st.session_state.department,
-                            'tool': st.session_state.tool,
-                            'user': st.session_state.user,
-                            'system_number': st.session_state.system_number,
-                            'usage_duration': usage_duration,
-                            'satisfaction': satisfaction,
-                            'valuable_features': ', '.join(features),
-                            'time_saved': time_saved,
-                            'automation_percentage': automation_percentage,
-                            'time_utilization': time_utilization,
-                            'error_reduction': error_reduction,
-                            'suggestions': suggestions,
-                            'job_satisfaction': job_satisfaction,
-                            'additional_feedback': additional_feedback,
-                            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        }
-                        st.session_state.responses.append(response)
-                        st.session_state.current_step = 6
+                        st.session_state.system_number = system_number
+                        st.session_state.current_step = 5
                         st.rerun()
+    
+        elif st.session_state.current_step == 5:
+            st.markdown("### 📋 Survey Questions")
+            st.markdown(
+                f'<div class="info-box">'
+                f'Department: {st.session_state.department} | '
+                f'Tool: {st.session_state.tool} | '
+                f'User: {st.session_state.user}'
+                f'</div>', 
+                unsafe_allow_html=True
+            )
 
-    if st.session_state.current_step == 6:
-        st.markdown("""
-            <div class='success-message'>
-                <h2>🎉 Thank you!</h2>
-                <p style='font-size: 1.2em; color: #2c3e50;'>
-                    Your survey has been submitted successfully.
-                </p>
-            </div>
-        """, unsafe_allow_html=True)
-        st.balloons()
-        
-        # Save response to CSV for persistence
-        save_responses_to_csv()
+            questionnaire = questionnaires.questionnaire_for_tool(st.session_state.tool)
+            # Identifies this survey across retries, so it is stored at most once
+            if 'submission_id' not in st.session_state:
+                st.session_state.submission_id = uuid.uuid4().hex
+            with st.form(f"{questionnaire.name}_form"):
+                answers = render_questionnaire(questionnaire)
+            
+                # Navigation buttons
+                col1, col2 = st.columns(2)
+                with col1:
+                    if st.form_submit_button("← Back"):
+                        st.session_state.current_step = 4
+                        st.rerun()
+                with col2:
+                    if st.form_submit_button("Submit"):
+                        with TIMINGS.phase('validation'):
+                            error = questionnaires.validate_answers(questionnaire, answers)
+                        if error:
+                            st.error(error)
+                        else:
+                            response = {
+                                'department': st.session_state.department,
+                                'tool': st.session_state.tool,
+                                'user': st.session_state.user,
+                                'system_number': st.session_state.system_number,
+                            }
+                            response.update(questionnaires.build_response(questionnaire, answers))
+                            response['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                            response['submission_id'] = st.session_state.submission_id
+                            if save_response(response):
+                                st.session_state.current_step = 6
+                                st.rerun()
+
+        if st.session_state.current_step == 6:
+            # Wait for the background writer to report the response as durable
+            submission = st.session_state.get('submission')
+            error = None
+            if submission is not None:
+                try:
+                    with TIMINGS.phase('durability_wait'):
+                        submission.result(timeout=DURABILITY_TIMEOUT)
+                except futures.TimeoutError:
+                    error = "Your response is taking longer than usual to save."
+                except Exception as exc:
+                    error = f"Your response could not be saved: {exc}"
+
+            if error is None:
+                st.markdown("""
+                    <div class='success-message'>
+                        <h2>🎉 Thank you!</h2>
+                        <p style='font-size: 1.2em; color: #2c3e50;'>
+                            Your survey has been submitted successfully.
+                        </p>
+                    </div>
+                """, unsafe_allow_html=True)
+                st.balloons()
+            else:
+                st.error(f"⚠️ {error} Please try again.")
+                if st.button("🔁 Try Again"):
+                    # A slow save may still complete; only resubmit one that failed
+                    if not submission.done() or save_response(st.session_state.submitted_response):
+                        st.rerun()
         
-        # Center the button
-        col1, col2, col3 = st.columns([1,2,1])
-        with col2:
-            if st.button("📜 Submit Another Response"):
-                show_spinner_with_message("Preparing new survey...")
-                reset_form()
-                st.rerun()
+            # Center the button
+            col1, col2, col3 = st.columns([1,2,1])
+            with col2:
+                if st.button("📜 Submit Another Response"):
+                    with show_spinner_with_message("Preparing new survey..."):
+                        reset_form()
+                    st.rerun()
 
     # Enhanced Admin view
     with st.expander("🔒 Admin View (Password Protected)"):
@@ -848,27 +924,53 @@ def main():
             """, unsafe_allow_html=True)
             
             if st.button("🚪 Logout", key="logout"):
-                show_spinner_with_message("Logging out...")
-                st.session_state.admin_authenticated = False
+                with show_spinner_with_message("Logging out..."):
+                    st.session_state.admin_authenticated = False
                 st.rerun()
             
-            if st.session_state.responses:
-                df = pd.DataFrame(st.session_state.responses)
-                st.dataframe(df)
-                
-                # Enhanced download button
-                col1, col2, col3 = st.columns([1,2,1])
-                with col2:
-                    csv = df.to_csv(index=False).encode('utf-8')
-                    st.download_button(
-                        "📅 Download Responses (CSV)",
-                        csv,
-                        "survey_responses.csv",
-                        "text/csv",
-                        key='download-csv'
-                    )
-            else:
-                st.info("📊 No responses collected yet.")
+            responses_tab, performance_tab = st.tabs(["📊 Responses", "⏱️ Performance"])
+            with responses_tab, TIMINGS.phase('admin'):
+                summary = get_aggregates().snapshot()
+                if summary['total']:
+                    render_dashboard(summary)
+                    with TIMINGS.phase('admin.kpis'):
+                        render_kpis(*get_kpis(get_store(), get_store().fingerprint()))
+                    render_trends(get_rollups())
+                    render_feedback_search(get_search_index())
+            
+                store = get_store()
+                total, filters = render_response_browser(store)
+                if total:
+                    # Export and maintenance actions
+                    col1, col2, col3 = st.columns([1,2,1])
+                    with col2:
+                        render_export(store, filters['questionnaire'])
+                        if st.button("🗜️ Compact Storage", key="compact-storage"):
+                            with st.spinner("Compacting stored responses..."):
+                                compacted = store.compact()
+                            st.success(f"Storage compacted ({compacted} pending responses merged)")
+                        if st.button("🔄 Rebuild Summary", key="rebuild-aggregates"):
+                            with st.spinner("Recounting stored responses..."):
+                                store.rebuild_listeners()
+                            st.rerun()
+
+                render_import(store)
+
+            with performance_tab:
+                render_performance()
+
+def record_trace():
+    """Add this rerun's phase timings to the session's trace of recent reruns"""
+    trace = TIMINGS.finish_trace()
+    if trace:
+        reruns = st.session_state.setdefault('rerun_trace', deque(maxlen=TRACE_RERUNS))
+        reruns.append({'time': datetime.now().strftime("%H:%M:%S"), **trace})
 
 if __name__ == "__main__":
-    main()
+    if TRACE_RERUNS:
+        TIMINGS.start_trace()
+    try:
+        main()
+    finally:
+        # Also after st.rerun(), which ends the run with an exception
+        record_trace()
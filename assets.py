@@ -0,0 +1,79 @@
+"""Static assets of the survey page, prepared once per process.
+
+Every rerun sends the whole page to the browser again, the custom CSS
+included, and ``st.image`` reads the logo from disk each time. The
+stylesheet and logo live in ``static/``; ``style_tag`` minifies the
+stylesheet once and ``scaled_image`` reads the logo once, already at its
+display width, so reruns reuse them from memory.
+
+With Streamlit's static file serving on (``enableStaticServing`` under
+``[server]`` in ``.streamlit/config.toml``), the page can link to images
+under ``app/static/`` instead, which browsers fetch once and cache.
+``static_url`` adds a hash of the file's contents, so browsers fetch a
+changed file. Streamlit serves only images with their own content type
+(anything else as ``text/plain``, which browsers will not apply as a
+stylesheet), so the stylesheet is always inlined.
+"""
+import hashlib
+import io
+import os
+import re
+
+from PIL import Image
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+# Where Streamlit serves STATIC_DIR, relative to the app's page
+STATIC_URL = 'app/static'
+
+STYLESHEET = 'survey.css'
+LOGO = 'logo.png'
+
+
+def static_path(name):
+    return os.path.join(STATIC_DIR, name)
+
+
+def read_static(name):
+    with open(static_path(name), 'rb') as f:
+        return f.read()
+
+
+def minify_css(css):
+    """Drop comments and the whitespace a browser does not need"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,])\s*', r'\1', css)
+    return css.replace(': ', ':').replace(';}', '}').strip()
+
+
+def compact_html(html):
+    """Drop the indentation and line breaks between tags"""
+    return re.sub(r'>\s+<', '><', re.sub(r'\s*\n\s*', ' ', html)).strip()
+
+
+def style_tag(name=STYLESHEET):
+    """Return a static stylesheet, minified, as an inline ``<style>`` element"""
+    return f"<style>{minify_css(read_static(name).decode('utf-8'))}</style>"
+
+
+def static_url(name):
+    """Return the URL Streamlit serves a static file at, versioned by its contents"""
+    digest = hashlib.sha256(read_static(name)).hexdigest()[:12]
+    return f'{STATIC_URL}/{name}?v={digest}'
+
+
+def scaled_image(name, width):
+    """Return a static image as PNG bytes at most ``width`` pixels wide
+
+    Narrower images are returned as they are, so Streamlit neither resizes
+    nor re-encodes them when they are shown at ``width``.
+    """
+    data = read_static(name)
+    image = Image.open(io.BytesIO(data))
+    if image.width <= width and image.format == 'PNG':
+        return data
+    if image.width > width:
+        image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+    scaled = io.BytesIO()
+    image.save(scaled, format='PNG', optimize=True)
+    return scaled.getvalue()
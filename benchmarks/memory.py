@@ -0,0 +1,71 @@
+"""Memory used by the loaded responses, before and after compact column types.
+
+Writes generated responses to a submission log in a temporary directory and
+reports the memory held by them as
+
+- a list of dicts, as read back from the log;
+- a DataFrame of object columns built from that list;
+- the frame ``ResponseStore.load`` returns, with the types of ``typed_frame``.
+
+Run from the repository root::
+
+    python benchmarks/memory.py [rows]
+"""
+import gc
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def traced(build):
+    """Return ``(result, bytes still allocated by build())``"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def main(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, storage.RESPONSES_LOG)
+        with open(log_path, 'w', encoding='utf-8') as f:
+            seq = 0
+            for chunk in synthetic.generate(rows):
+                for response in synthetic.responses(chunk):
+                    seq += 1
+                    f.write(json.dumps({**response, 'seq': seq}, ensure_ascii=False) + '\n')
+
+        records, records_bytes = traced(lambda: storage.read_log(log_path))
+        objects = pd.DataFrame(records)
+        objects_bytes = int(objects.memory_usage(deep=True).sum())
+        del records, objects
+
+        store = storage.LogStore(csv_path=os.path.join(tmp, storage.RESPONSES_CSV), log_path=log_path)
+        compact = store.load()
+        # Arrow string buffers live outside the Python allocator, so measure frames with pandas
+        compact_bytes = int(compact.memory_usage(deep=True).sum())
+
+    print(f"{rows} responses, {len(compact.columns)} columns")
+    print(f"{'representation':<24}{'MiB':>10}{'bytes/row':>12}{'vs compact':>12}")
+    for name, size in (('list of dicts', records_bytes), ('object DataFrame', objects_bytes),
+                       ('compact DataFrame', compact_bytes)):
+        print(f"{name:<24}{size / 2 ** 20:>10.1f}{size / rows:>12.0f}{size / compact_bytes:>11.1f}x")
+    print()
+    print(compact.dtypes.astype(str).value_counts().to_string())
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,101 @@
+"""Bytes the survey page sends and reads on every rerun.
+
+Reruns the first survey step of ``app.py`` through Streamlit's app-testing
+harness, with and without Streamlit's static file serving, and reports the
+mean per rerun of
+
+- the bytes of the page's elements as sent to the browser: their serialized
+  messages, the largest of them listed separately (files the browser
+  fetches by URL, like the logo, are not included);
+- the bytes the server read from files (``rchar`` in ``/proc/self/io``,
+  where the OS reports it);
+- the rerun time.
+
+The app runs from a copy in a temporary directory::
+
+    python benchmarks/page_payload.py --reruns 50
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from streamlit import config  # noqa: E402
+
+from survey_flow import ADMIN_PASSWORD, copy_app, new_app  # noqa: E402
+
+# Elements listed on their own
+LARGEST = 3
+
+
+def bytes_read():
+    """Return the bytes this process has read through read calls, if the OS reports it"""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def element_sizes(node):
+    """Yield ``(type, serialized bytes)`` for every element and block under ``node``"""
+    proto = getattr(node, 'proto', None)
+    if proto is not None:
+        yield node.type, proto.ByteSize()
+    for child in getattr(node, 'children', {}).values():
+        yield from element_sizes(child)
+
+
+def measure(reruns, static_serving):
+    """Return the mean bytes sent, bytes read and milliseconds per rerun"""
+    config.set_option('server.enableStaticServing', static_serving)
+    app = new_app({'general': {'admin_password': ADMIN_PASSWORD}}, timeout=60)
+    # The first run creates the process-wide caches; count the steady state
+    app.run()
+    sent, read, seconds = [], [], []
+    for _ in range(reruns):
+        before_read = bytes_read()
+        started = time.perf_counter()
+        app.run()
+        seconds.append(time.perf_counter() - started)
+        after_read = bytes_read()
+        if app.exception:
+            raise RuntimeError(app.exception[0].value)
+        sent.append(sorted(element_sizes(app._tree), key=lambda size: size[1], reverse=True))
+        if before_read is not None:
+            read.append(after_read - before_read)
+    return {
+        'sent_bytes': float(np.mean([sum(size for _, size in sizes) for sizes in sent])),
+        'largest': sent[-1][:LARGEST],
+        'read_bytes': float(np.mean(read)) if read else None,
+        'ms': float(np.median(seconds) * 1000),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--reruns', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='survey-payload-') as workdir:
+        copy_app(workdir)
+        os.chdir(workdir)
+        print(f"{'static serving':<16}{'sent B/rerun':>14}{'read B/rerun':>14}{'median ms':>11}  largest elements (B)")
+        for static_serving in (False, True):
+            figures = measure(args.reruns, static_serving)
+            read = '-' if figures['read_bytes'] is None else f"{figures['read_bytes']:.0f}"
+            largest = ', '.join(f'{name} {size}' for name, size in figures['largest'])
+            print(f"{'on' if static_serving else 'off':<16}{figures['sent_bytes']:>14.0f}{read:>14}"
+                  f"{figures['ms']:>11.2f}  {largest}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""Load, admin and export benchmarks over generated datasets.
+
+For every row count and storage backend, a dataset from ``synthetic.py`` is
+created (or reused from ``--data-dir``) and each measurement runs in a fresh
+process, so its time and peak RSS are its own:
+
+``legacy_load``
+    The old session-startup path, ``pd.read_csv(...).to_dict('records')``
+    (CSV-based backends only).
+``load``
+    ``ResponseStore.load()``: the whole dataset as a compact DataFrame.
+``page`` / ``filtered_page``
+    The admin browser's first page, unfiltered and filtered by department
+    and a 30-day range.
+``kpis``
+    The KPI summary over every response.
+``to_csv``
+    The old admin export path: the loaded frame through ``df.to_csv``.
+``export_csv``, ``export_csv_gz``, ``export_parquet``, ``export_xlsx``
+    Streamed exports from ``exports.get_export``, built from scratch.
+``admin_cold`` / ``admin``
+    The admin view through Streamlit's test harness: the first render after
+    logging in, with no derived data on disk (aggregates, rollups and search
+    index are rebuilt), then the median of warm reruns.
+
+::
+
+    python benchmarks/scale.py --rows 10000 100000 1000000 --output scale.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import aggregates  # noqa: E402
+import exports  # noqa: E402
+import rollups  # noqa: E402
+import search  # noqa: E402
+import storage  # noqa: E402
+
+MEASURES = (
+    'legacy_load', 'load', 'page', 'filtered_page', 'kpis', 'to_csv',
+    'export_csv', 'export_csv_gz', 'export_parquet', 'export_xlsx', 'admin_cold', 'admin',
+)
+
+# Measures that read the compacted CSV directly
+CSV_MEASURES = ('legacy_load',)
+CSV_BACKENDS = ('csv', 'segments')
+
+ADMIN_RERUNS = 3
+
+# Marks a finished dataset, so an interrupted one is regenerated
+READY = '.ready'
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+
+def measure(name, backend):
+    """Run one measurement in the current directory; returns its figures"""
+    import pandas as pd
+
+    import analytics
+
+    store = storage.create_store(backend)
+    # Imports alone take tens of MiB; report them so the measure's share is visible
+    figures = {'baseline_rss_mb': peak_rss_mb()}
+    started = time.perf_counter()
+    if name == 'legacy_load':
+        figures['rows'] = len(pd.read_csv(storage.RESPONSES_CSV).to_dict('records'))
+    elif name == 'load':
+        figures['rows'] = len(store.load())
+    elif name in ('page', 'filtered_page'):
+        filters = {}
+        if name == 'filtered_page':
+            first = store.query(limit=1)[1]
+            end = pd.Timestamp(first['timestamp'].iloc[0]).date()
+            filters = {'department': first['department'].iloc[0], 'start': end - pd.Timedelta(days=30), 'end': end}
+        figures['rows'], _ = store.query(filters, limit=100)
+    elif name == 'kpis':
+        figures['rows'] = analytics.compute_kpis(store.load(columns=analytics.kpi_columns()))['responses']
+    elif name == 'to_csv':
+        figures['bytes'] = len(store.load().to_csv(index=False))
+    elif name.startswith('export_'):
+        fmt = name.split('_')[1]
+        shutil.rmtree(exports.EXPORT_DIR, ignore_errors=True)
+        path = exports.get_export(store, fmt, compress=name.endswith('_gz'))
+        figures['bytes'] = os.path.getsize(path)
+    elif name in ('admin_cold', 'admin'):
+        first, reruns = measure_admin(backend, cold=name == 'admin_cold')
+        figures['seconds'] = first if name == 'admin_cold' else reruns
+    figures.setdefault('seconds', time.perf_counter() - started)
+    figures['peak_rss_mb'] = peak_rss_mb()
+    return figures
+
+
+def measure_admin(backend, cold):
+    """Return the seconds of the admin view's first render and its median warm rerun
+
+    With ``cold``, the derived data is removed first, so the first render
+    rebuilds it.
+    """
+    import numpy as np
+
+    from survey_flow import ADMIN_PASSWORD, button, copy_app, new_app, timed
+
+    if cold:
+        for path in (aggregates.AGGREGATES_DB, rollups.ROLLUPS_DB, search.SEARCH_DB):
+            if os.path.exists(path):
+                os.remove(path)
+    copy_app(os.getcwd())
+    secrets = {'general': {'admin_password': ADMIN_PASSWORD}, 'storage': {'backend': backend}}
+    app = new_app(secrets, timeout=24 * 3600)
+    app.run()
+    app.text_input[0].input(ADMIN_PASSWORD)
+    first = timed(button(app, 'Login').click().run)
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    return first, float(np.median([timed(app.run) for _ in range(ADMIN_RERUNS)]))
+
+
+def run_measure(name, backend, directory):
+    """Run a measurement in a child process; returns its figures or an error"""
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--measure', name, '--backends', backend],
+        cwd=directory, capture_output=True, text=True
+    )
+    if process.returncode:
+        return {'error': (process.stderr.strip().splitlines() or ['failed'])[-1]}
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def dataset(data_dir, backend, rows, seed):
+    """Return the directory of a generated dataset, creating it if needed"""
+    directory = os.path.join(data_dir, f'{backend}-{rows}-{seed}')
+    if not os.path.exists(os.path.join(directory, READY)):
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, os.path.join(HERE, 'synthetic.py'), str(rows), directory,
+             '--backend', backend, '--seed', str(seed)],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        print(f"generated {rows} rows for {backend} in {time.perf_counter() - started:.1f} s", flush=True)
+        open(os.path.join(directory, READY), 'w').close()
+    return directory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--backends', nargs='+', default=sorted(storage.BACKENDS))
+    parser.add_argument('--measures', nargs='+', default=list(MEASURES), choices=MEASURES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', help="keep generated datasets here and reuse them")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        # Child process: one measurement in the dataset directory
+        print(json.dumps(measure(args.measure, args.backends[0])))
+        return
+
+    data_dir = os.path.abspath(args.data_dir or tempfile.mkdtemp(prefix='survey-scale-'))
+    results = []
+    try:
+        for rows in args.rows:
+            for backend in args.backends:
+                directory = dataset(data_dir, backend, rows, args.seed)
+                for name in args.measures:
+                    if name in CSV_MEASURES and backend not in CSV_BACKENDS:
+                        continue
+                    if name == 'export_xlsx' and 'xlsx' not in exports.available_formats():
+                        continue
+                    figures = run_measure(name, backend, directory)
+                    results.append({'rows': rows, 'backend': backend, 'measure': name, **figures})
+                    shown = (f"{figures['seconds']:9.3f} s {figures['peak_rss_mb']:9.1f} MiB"
+                             if 'error' not in figures else f"error: {figures['error']}")
+                    print(f"{rows:>10} {backend:<9} {name:<15} {shown}", flush=True)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'config': {'rows': args.rows, 'backends': args.backends, 'seed': args.seed},
+                'environment': {
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'cpus': os.cpu_count(),
+                },
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
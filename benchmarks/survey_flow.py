@@ -0,0 +1,344 @@
+"""Headless load and latency benchmark for the survey flow.
+
+Drives ``app.py`` with Streamlit's app-testing harness through steps 1-6 of
+the survey, once per questionnaire (PTW, Inventory & OOW and general) in
+turn, from several concurrent sessions sharing one process, as sessions
+share a server. The harness runs one script at a time per process, so the
+sessions take turns rerun by rerun and the figures are those of a server
+whose requests queue up. The app runs from a copy in a temporary directory, so
+nothing is written next to the real responses.
+
+Reported, and written as JSON with ``--output``:
+
+- p50/p95/p99 latency of each rerun, per step and per questionnaire;
+- completed submissions per second;
+- bytes written per submission (from ``/proc/self/io`` where available)
+  and bytes of storage added per submission;
+- the admin view's rerun latency once the responses are stored.
+
+``--baseline`` compares the run with a saved result and exits with status 1
+if a latency or throughput figure is worse by more than ``--threshold``::
+
+    python benchmarks/survey_flow.py --sessions 8 --surveys 5 --output baseline.json
+    python benchmarks/survey_flow.py --sessions 8 --surveys 5 --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import streamlit  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from directory import load_directory  # noqa: E402
+from questionnaires import QUESTIONNAIRES, questionnaire_type  # noqa: E402
+
+# Reruns in survey order; "start" is the first page load, the others the
+# rerun a step's Next (or Submit) button triggers
+STEPS = ('start', 'department', 'tool', 'user', 'system', 'submit')
+ADMIN_STEP = 'admin'
+
+PERCENTILES = (50, 95, 99)
+
+ADMIN_PASSWORD = 'benchmark'
+
+# Files the app needs next to it, and its directory of static assets
+APP_FILES = ('.py', '.json', '.png')
+STATIC_DIR = 'static'
+
+
+class FlowError(Exception):
+    """A survey did not reach the expected step"""
+
+
+def respondents():
+    """Return one (department, tool, user, system number) per questionnaire"""
+    directory = load_directory()
+    found = {}
+    for department in directory.departments:
+        for tool in directory.tools(department):
+            name = questionnaire_type(tool)
+            users = directory.users(department, tool)
+            systems = sorted(directory.systems(department, tool))
+            if name not in found and users and systems:
+                found[name] = (department, tool, users[0], systems[0])
+    return found
+
+
+def copy_app(target):
+    """Copy the app into ``target``; returns the names of the copied files"""
+    copied = set()
+    for name in os.listdir(ROOT):
+        if name.endswith(APP_FILES):
+            shutil.copy(os.path.join(ROOT, name), os.path.join(target, name))
+            copied.add(name)
+    shutil.copytree(os.path.join(ROOT, STATIC_DIR), os.path.join(target, STATIC_DIR), dirs_exist_ok=True)
+    return copied
+
+
+def new_app(secrets, timeout):
+    app = AppTest.from_file(os.path.join(os.getcwd(), 'app.py'), default_timeout=timeout)
+    for section, values in secrets.items():
+        app.secrets[section] = values
+    return app
+
+
+def button(app, label):
+    for candidate in app.button:
+        if candidate.label == label:
+            return candidate
+    raise FlowError(f"No {label!r} button on step {app.session_state.current_step}")
+
+
+def timed(action):
+    """Return the seconds ``action()`` takes"""
+    start = time.perf_counter()
+    action()
+    return time.perf_counter() - start
+
+
+def expect_step(app, step):
+    if app.exception:
+        raise FlowError(app.exception[0].value)
+    if app.session_state.current_step != step:
+        errors = '; '.join(error.value for error in app.error)
+        raise FlowError(f"Stuck on step {app.session_state.current_step}: {errors}")
+
+
+def answer(app, questionnaire, rng):
+    for question in questionnaire.questions:
+        if question.widget == 'radio':
+            app.radio(key=question.key).set_value(rng.choice(question.options))
+        elif question.widget == 'multiselect':
+            app.multiselect(key=question.key).select(rng.choice(question.options))
+        else:
+            app.text_area(key=question.key).input(f'Benchmark answer {rng.randint(0, 10 ** 6)}')
+
+
+def survey(respondent, secrets, rng, timeout):
+    """Take one session through steps 1-6, yielding ``(step, seconds)`` after each rerun"""
+    department, tool, user, system_number = respondent
+    app = new_app(secrets, timeout)
+    yield 'start', timed(app.run)
+    expect_step(app, 1)
+    app.selectbox[0].select(department)
+    yield 'department', timed(button(app, 'Next →').click().run)
+    expect_step(app, 2)
+    app.selectbox[0].select(tool)
+    yield 'tool', timed(button(app, 'Next →').click().run)
+    expect_step(app, 3)
+    app.selectbox[0].select(user)
+    yield 'user', timed(button(app, 'Next').click().run)
+    expect_step(app, 4)
+    app.text_input[0].input(system_number)
+    yield 'system', timed(button(app, 'Next').click().run)
+    expect_step(app, 5)
+    answer(app, QUESTIONNAIRES[questionnaire_type(tool)], rng)
+    yield 'submit', timed(button(app, 'Submit').click().run)
+    expect_step(app, 6)
+    if app.error:
+        raise FlowError(app.error[0].value)
+
+
+def admin_reruns(secrets, runs, timeout):
+    """Return the seconds each of ``runs`` admin view reruns takes after logging in"""
+    app = new_app(secrets, timeout)
+    app.run()
+    app.text_input[0].input(ADMIN_PASSWORD)
+    button(app, 'Login').click().run()
+    if app.exception:
+        raise FlowError(app.exception[0].value)
+    return [timed(app.run) for _ in range(runs)]
+
+
+def bytes_written():
+    """Return the bytes this process has passed to write calls, if the OS reports it"""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def stored_bytes(directory, app_files):
+    """Return the size of every file under ``directory`` apart from the app's own"""
+    total = 0
+    for folder, _, files in os.walk(directory):
+        for name in files:
+            if folder != directory or name not in app_files:
+                total += os.path.getsize(os.path.join(folder, name))
+    return total
+
+
+def summarize(latencies):
+    values = np.asarray(latencies) * 1000
+    summary = {f'p{p}_ms': round(float(np.percentile(values, p)), 2) for p in PERCENTILES}
+    summary['mean_ms'] = round(float(values.mean()), 2)
+    summary['count'] = len(values)
+    return summary
+
+
+def benchmark(app_files, sessions, surveys, backend, admin_runs, timeout, seed):
+    targets = respondents()
+    missing = [name for name in QUESTIONNAIRES if name not in targets]
+    if missing:
+        raise SystemExit(f"No tool with users and systems for {', '.join(missing)}")
+    secrets = {
+        'general': {'admin_password': ADMIN_PASSWORD, 'duplicate_window_hours': 0},
+        'storage': {'backend': backend},
+    }
+    order = list(QUESTIONNAIRES)
+    samples = {name: [] for name in order}
+    errors = []
+
+    def session(index):
+        rng = random.Random(seed + index)
+        for i in range(surveys):
+            name = order[(index + i) % len(order)]
+            try:
+                for step, seconds in survey(targets[name], secrets, rng, timeout):
+                    yield name, step, seconds
+            except Exception as exc:
+                errors.append(f'{name}: {exc}')
+
+    # Warm up imports and cached resources so the first session is not an outlier
+    for _ in survey(targets[order[0]], secrets, random.Random(seed), timeout):
+        pass
+    written_before, stored_before = bytes_written(), stored_bytes(os.getcwd(), app_files)
+    started = time.perf_counter()
+    # The test harness keeps one runtime per process, so reruns cannot overlap:
+    # sessions take turns, one rerun at a time, as requests queue on a busy server
+    active = [session(i) for i in range(sessions)]
+    while active:
+        for running in list(active):
+            try:
+                name, step, seconds = next(running)
+            except StopIteration:
+                active.remove(running)
+            else:
+                samples[name].append((step, seconds))
+    elapsed = time.perf_counter() - started
+    written_after, stored_after = bytes_written(), stored_bytes(os.getcwd(), app_files)
+
+    submitted = sum(1 for name in order for step, _ in samples[name] if step == 'submit')
+    all_samples = [sample for name in order for sample in samples[name]]
+    result = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'config': {'sessions': sessions, 'surveys_per_session': surveys, 'backend': backend, 'seed': seed},
+        'environment': {
+            'python': platform.python_version(),
+            'streamlit': streamlit.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'elapsed_s': round(elapsed, 3),
+        'submissions': submitted,
+        'submissions_per_second': round(submitted / elapsed, 3) if elapsed else None,
+        'bytes_written_per_submission': (
+            round((written_after - written_before) / submitted) if submitted and written_before is not None else None
+        ),
+        'stored_bytes_per_submission': round((stored_after - stored_before) / submitted) if submitted else None,
+        'steps': {step: summarize([t for s, t in all_samples if s == step]) for step in STEPS
+                  if any(s == step for s, _ in all_samples)},
+        'questionnaires': {
+            name: {step: summarize([t for s, t in samples[name] if s == step]) for step in STEPS
+                   if any(s == step for s, _ in samples[name])}
+            for name in order
+        },
+        'errors': errors,
+    }
+    if admin_runs:
+        result['steps'][ADMIN_STEP] = summarize(admin_reruns(secrets, admin_runs, timeout))
+        # Plus the warm-up survey
+        result['steps'][ADMIN_STEP]['stored_responses'] = submitted + 1
+    return result
+
+
+def compare(result, baseline, threshold):
+    """Print each figure against the baseline; return the names of the regressions"""
+    rows = [('submissions_per_second', result.get('submissions_per_second'),
+             baseline.get('submissions_per_second'), False)]
+    for step in list(STEPS) + [ADMIN_STEP]:
+        for percentile in PERCENTILES:
+            key = f'p{percentile}_ms'
+            rows.append((f'{step} {key}', result['steps'].get(step, {}).get(key),
+                         baseline.get('steps', {}).get(step, {}).get(key), True))
+    rows.append(('bytes_written_per_submission', result.get('bytes_written_per_submission'),
+                 baseline.get('bytes_written_per_submission'), True))
+
+    if baseline.get('config') != result['config']:
+        print(f"Note: the baseline was run with {baseline.get('config')}")
+    regressions = []
+    print(f"{'metric':<32}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, current, previous, lower_is_better in rows:
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        worse = change > threshold if lower_is_better else change < -threshold
+        if worse:
+            regressions.append(name)
+        print(f"{name:<32}{previous:>12}{current:>12}{change:>+9.0%}{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sessions', type=int, default=4, help="concurrent sessions")
+    parser.add_argument('--surveys', type=int, default=3, help="surveys each session submits")
+    parser.add_argument('--backend', default='csv', help="storage backend")
+    parser.add_argument('--admin-runs', type=int, default=5, help="admin view reruns to time (0 to skip)")
+    parser.add_argument('--timeout', type=float, default=60, help="seconds one rerun may take")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="compare with the results in this JSON file")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='survey-benchmark-')
+    cwd = os.getcwd()
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    try:
+        app_files = copy_app(workdir)
+        os.chdir(workdir)
+        result = benchmark(app_files, args.sessions, args.surveys, args.backend, args.admin_runs, args.timeout, args.seed)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{result['submissions']} submissions from {args.sessions} sessions in {result['elapsed_s']} s "
+          f"({result['submissions_per_second']}/s), {result['bytes_written_per_submission']} bytes written "
+          f"and {result['stored_bytes_per_submission']} bytes stored per submission")
+    print(f"{'step':<12}" + ''.join(f"{f'p{p} ms':>10}" for p in PERCENTILES) + f"{'runs':>8}")
+    for step, summary in result['steps'].items():
+        print(f"{step:<12}" + ''.join(f"{summary[f'p{p}_ms']:>10}" for p in PERCENTILES) + f"{summary['count']:>8}")
+    for error in result['errors']:
+        print(f"error: {error}")
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+    if baseline:
+        with open(baseline, encoding='utf-8') as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
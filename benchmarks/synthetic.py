@@ -0,0 +1,197 @@
+"""Synthetic survey responses for benchmarks at scale.
+
+Responses are drawn from the directory (departments, tools, their users and
+the systems they are installed on) and the questionnaires' option lists,
+with a fixed seed, so the same arguments always give the same data. Answer
+distributions are skewed per question, free text is drawn from a pool of
+phrases and timestamps rise steadily over ``DAYS`` days. Rows are built a
+chunk at a time with NumPy, so 10M rows take minutes and bounded memory.
+
+Fill a directory with a store of generated responses::
+
+    python benchmarks/synthetic.py 1000000 data/1m --backend parquet
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+from directory import load_directory  # noqa: E402
+from questionnaires import BASE_COLUMNS, QUESTIONNAIRES, questionnaire_type  # noqa: E402
+
+CHUNK_SIZE = 100000
+START = '2024-01-01'
+DAYS = 730
+
+# Share of optional free-text questions that are answered
+OPTIONAL_TEXT_RATE = 0.3
+# Chance of ticking each multiselect option (at least one is always ticked)
+MULTISELECT_RATE = 0.35
+
+PHRASES = (
+    'The tool saves a lot of manual effort', 'Reports are generated much faster',
+    'Login is sometimes slow in the morning', 'Please add an export to Excel',
+    'The dashboard needs better filters', 'Data entry errors have gone down',
+    'Occasionally the page times out', 'Support team resolves issues quickly',
+    'It would help to get email alerts', 'Permit approvals are easier to track',
+    'Stock reconciliation takes minutes now', 'Training for new users would help',
+    'The screen layout could be simpler', 'Claims are updated without rework',
+    'Sync with Tally fails on large files', 'Works well on the office network',
+    'Need a mobile friendly version', 'Month end closing is much quicker',
+    'Some fields should be pre-filled', 'No major issues so far',
+)
+TEXT_POOL_SIZE = 500
+
+
+def columns():
+    """Return every response column: shared, each questionnaire's, then timestamp and id"""
+    names = list(BASE_COLUMNS[:4])
+    for questionnaire in QUESTIONNAIRES.values():
+        names.extend(q.column for q in questionnaire.questions if q.column not in names)
+    return names + ['timestamp', 'submission_id']
+
+
+def respondents():
+    """Return a frame of every (department, tool, user, system number) the directory allows"""
+    directory = load_directory()
+    rows = []
+    for department in directory.departments:
+        for tool in directory.tools(department):
+            systems = sorted(directory.systems(department, tool))
+            for user, system in itertools.product(directory.users(department, tool), systems):
+                rows.append((department, tool, user, directory.canonical_system_number(system)))
+    df = pd.DataFrame(rows, columns=list(BASE_COLUMNS[:4]))
+    df['questionnaire'] = df['tool'].map(questionnaire_type)
+    return df
+
+
+def _multiselect_labels(options):
+    """Return the stored answer for every subset of ``options``, indexed by bit mask"""
+    return np.array([', '.join(option for bit, option in enumerate(options) if mask >> bit & 1)
+                     for mask in range(2 ** len(options))], dtype=object)
+
+
+def generate(rows, seed=0, chunk_size=CHUNK_SIZE, start=START, days=DAYS):
+    """Yield ``rows`` responses as DataFrames of at most ``chunk_size`` rows, oldest first
+
+    Each frame has the ``columns()``; answers to other questionnaires'
+    questions are missing.
+    """
+    rng = np.random.default_rng(seed)
+    people = respondents()
+    people_weights = rng.dirichlet(np.full(len(people), 0.5))
+    # Fixed per question, so every chunk follows the same skewed distribution
+    weights = {
+        q.column: rng.dirichlet(np.full(len(q.options), 2.0))
+        for questionnaire in QUESTIONNAIRES.values() for q in questionnaire.questions if q.widget == 'radio'
+    }
+    labels = {
+        q.column: _multiselect_labels(q.options)
+        for questionnaire in QUESTIONNAIRES.values() for q in questionnaire.questions if q.widget == 'multiselect'
+    }
+    pool = np.array([
+        '. '.join(rng.choice(PHRASES, size=rng.integers(1, 4), replace=False)) + '.'
+        for _ in range(TEXT_POOL_SIZE)
+    ], dtype=object)
+    origin = pd.Timestamp(start)
+    span = days * 86400
+    names = columns()
+
+    for first in range(0, rows, chunk_size):
+        size = min(chunk_size, rows - first)
+        chosen = people.iloc[rng.choice(len(people), size=size, p=people_weights)].reset_index(drop=True)
+        chunk = {column: np.full(size, None, dtype=object) for column in names}
+        for column in BASE_COLUMNS[:4]:
+            chunk[column] = chosen[column].to_numpy(dtype=object)
+
+        for name, questionnaire in QUESTIONNAIRES.items():
+            rows_q = np.flatnonzero(chosen['questionnaire'].to_numpy() == name)
+            n = len(rows_q)
+            if not n:
+                continue
+            for question in questionnaire.questions:
+                if question.widget == 'radio':
+                    options = np.array(question.options, dtype=object)
+                    values = options[rng.choice(len(options), size=n, p=weights[question.column])]
+                elif question.widget == 'multiselect':
+                    ticked = rng.random((n, len(question.options))) < MULTISELECT_RATE
+                    # Required: tick one at random where nothing was ticked
+                    empty = ~ticked.any(axis=1)
+                    ticked[empty, rng.integers(0, len(question.options), size=int(empty.sum()))] = True
+                    masks = (ticked * (1 << np.arange(len(question.options)))).sum(axis=1)
+                    values = labels[question.column][masks]
+                else:
+                    values = pool[rng.integers(0, len(pool), size=n)]
+                    if not question.required:
+                        values = np.where(rng.random(n) < OPTIONAL_TEXT_RATE, values, '')
+                chunk[question.column][rows_q] = values
+
+        # Sorted offsets within this chunk's share of the span keep rows in time order
+        offsets = np.sort(rng.uniform(first, first + size, size=size)) * span / rows
+        chunk['timestamp'] = (origin + pd.to_timedelta(offsets.astype('int64'), unit='s')).strftime('%Y-%m-%d %H:%M:%S')
+        ids = rng.integers(0, 2 ** 63, size=(size, 2), dtype=np.int64)
+        chunk['submission_id'] = [f'{a:016x}{b:016x}' for a, b in ids]
+        yield pd.DataFrame(chunk, columns=names)
+
+
+def responses(chunk):
+    """Return a generated chunk as response dicts holding only their questionnaire's columns"""
+    kinds = chunk['tool'].map(questionnaire_type)
+    records = {}
+    for name, questionnaire in QUESTIONNAIRES.items():
+        names = list(BASE_COLUMNS[:4]) + [q.column for q in questionnaire.questions] + ['timestamp', 'submission_id']
+        selected = chunk.loc[kinds == name, names]
+        records.update(zip(selected.index, (dict(zip(names, row))
+                                            for row in selected.itertuples(index=False, name=None))))
+    return [records[i] for i in sorted(records)]
+
+
+def write_snapshot(chunks, path):
+    """Write generated chunks as the compacted CSV of the log-based backends"""
+    seq = 0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for chunk in chunks:
+            chunk = chunk.assign(seq=np.arange(seq + 1, seq + len(chunk) + 1))
+            seq += len(chunk)
+            chunk.to_csv(f, index=False, header=f.tell() == 0)
+    return seq
+
+
+def populate(rows, backend='csv', seed=0, chunk_size=CHUNK_SIZE):
+    """Store ``rows`` generated responses in the current directory with the named backend"""
+    chunks = generate(rows, seed, chunk_size)
+    if backend in ('csv', 'segments'):
+        # Folding them in through the log would rewrite the CSV once per chunk
+        return write_snapshot(chunks, storage.RESPONSES_CSV)
+    store = storage.create_store(backend)
+    for chunk in chunks:
+        store.append_many(responses(chunk))
+        store.compact()
+    return store.last_seq()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('rows', type=int)
+    parser.add_argument('directory', help="directory to create the store in")
+    parser.add_argument('--backend', default='csv', choices=sorted(storage.BACKENDS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    os.chdir(args.directory)
+    started = time.perf_counter()
+    stored = populate(args.rows, args.backend, args.seed, args.chunk_size)
+    print(f"Stored {stored} responses ({args.backend}) in {args.directory} in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
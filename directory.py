@@ -0,0 +1,133 @@
+"""Department, tool, user and system directory.
+
+The organisation data lives in ``directory.json``, keyed by department and
+then tool, each tool listing its users and the system numbers it is installed
+on. An optional ``shared`` list names the placeholder users and system numbers
+("Partner", "NA", "Not Installed") that stand for many people rather than
+one. It is loaded into precomputed lookups so that validating a system number
+is a set membership test, and ``DirectorySource`` reloads it when the file's
+modification time changes, so edits take effect without a restart.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+DIRECTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'directory.json')
+
+# Shortest system number, once normalized, the survey accepts
+MIN_SYSTEM_NUMBER_LENGTH = 5
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_system_number(system_number):
+    """Return the lookup form of a system number, ignoring case and whitespace"""
+    return ''.join(str(system_number).split()).casefold()
+
+
+class Directory:
+    """Immutable, indexed snapshot of the directory file"""
+
+    def __init__(self, data, mtime=None):
+        self.mtime = mtime
+        self._tools = {}
+        self._users = {}
+        self._systems = {}
+        self._canonical = {}
+        self._shared = {}
+        tools_by_system = {}
+        for department, tools in data.items():
+            if not isinstance(tools, dict):
+                raise ValueError(f"{department}: expected a mapping of tools")
+            self._tools[department] = tuple(tools)
+            for tool, entry in tools.items():
+                if not isinstance(entry, dict):
+                    raise ValueError(f"{department} / {tool}: expected 'users' and 'systems'")
+                users = entry.get('users', [])
+                systems = entry.get('systems', [])
+                shared = entry.get('shared', [])
+                if not isinstance(users, list) or not isinstance(systems, list) or not isinstance(shared, list):
+                    raise ValueError(f"{department} / {tool}: 'users', 'systems' and 'shared' must be lists")
+                self._users[department, tool] = tuple(users)
+                if shared:
+                    self._shared[department, tool] = (
+                        frozenset(shared), frozenset(normalize_system_number(s) for s in shared)
+                    )
+                normalized = frozenset(normalize_system_number(s) for s in systems)
+                self._systems[department, tool] = normalized
+                for system in systems:
+                    key = normalize_system_number(system)
+                    self._canonical.setdefault(key, system)
+                    tools_by_system.setdefault(key, set()).add((department, tool))
+        self._tools_by_system = {key: frozenset(pairs) for key, pairs in tools_by_system.items()}
+        self.departments = tuple(self._tools)
+
+    def tools(self, department):
+        """Return the tools used in a department, in file order"""
+        return self._tools.get(department, ())
+
+    def users(self, department, tool):
+        """Return the users of a department's tool, in file order"""
+        return self._users.get((department, tool), ())
+
+    def systems(self, department, tool):
+        """Return the normalized system numbers a department's tool is installed on"""
+        return self._systems.get((department, tool), frozenset())
+
+    def has_system(self, department, tool, system_number):
+        """Check if the tool is installed on the system number"""
+        return normalize_system_number(system_number) in self._systems.get((department, tool), ())
+
+    def is_shared(self, department, tool, user, system_number):
+        """Check if the user or system number is a placeholder many people answer as"""
+        users, systems = self._shared.get((department, tool), ((), ()))
+        return user in users or normalize_system_number(system_number) in systems
+
+    def tools_for_system(self, system_number):
+        """Return the (department, tool) pairs installed on a system number"""
+        return self._tools_by_system.get(normalize_system_number(system_number), frozenset())
+
+    def canonical_system_number(self, system_number):
+        """Return the system number as spelled in the directory, if it is listed"""
+        return self._canonical.get(normalize_system_number(system_number), system_number)
+
+
+def load_directory(path=DIRECTORY_FILE):
+    """Read and index the directory file"""
+    mtime = os.stat(path).st_mtime_ns
+    with open(path, encoding='utf-8') as f:
+        return Directory(json.load(f), mtime=mtime)
+
+
+class DirectorySource:
+    """Serve the current directory, reloading it when the file changes
+
+    The file's mtime is checked at most once every ``check_interval``
+    seconds. If a changed file fails to load, the previous directory stays in
+    use and the error is logged.
+    """
+
+    def __init__(self, path=DIRECTORY_FILE, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._directory = load_directory(path)
+        self._checked_at = time.monotonic()
+
+    def get(self):
+        """Return the current directory snapshot"""
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            with self._lock:
+                self._refresh()
+        return self._directory
+
+    def _refresh(self):
+        self._checked_at = time.monotonic()
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime != self._directory.mtime:
+                self._directory = load_directory(self.path)
+        except (OSError, ValueError) as exc:
+            logger.warning("Keeping the previous directory; could not reload %s: %s", self.path, exc)
@@ -0,0 +1,161 @@
+"""Duplicate-submission detection.
+
+``DuplicateIndex`` remembers when each (department, tool, user, system
+number) last submitted and which submission tokens it has stored, so Submit
+can turn away a repeat in constant time instead of scanning the stored
+responses. It is rebuilt from the store at startup and kept current by a
+store listener.
+
+Every survey a session starts carries a ``submission_id`` token. Sending the
+same token again - a double-click, or Try Again after a slow save - is
+recognised as the same submission rather than a new one.
+"""
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from directory import normalize_system_number
+
+DUPLICATE_WINDOW_HOURS = 24
+
+# Tokens are remembered at least this long, even with no duplicate window
+TOKEN_RETENTION = timedelta(hours=1)
+
+# Outcomes of DuplicateIndex.claim
+ACCEPTED = 'accepted'
+DUPLICATE = 'duplicate'
+ALREADY_SUBMITTED = 'already_submitted'
+
+
+def submission_key(response):
+    """Return the fields that identify one person's survey of one tool on one system"""
+    return (
+        response.get('department'),
+        response.get('tool'),
+        response.get('user'),
+        normalize_system_number(response.get('system_number') or ''),
+    )
+
+
+class DuplicateIndex:
+    """Latest submission time per submission key, plus recent tokens
+
+    A response is a duplicate when its key was stored less than ``window``
+    ago; a zero window turns that check off. So does ``is_shared(response)``
+    for responses from placeholder identities (the directory's ``shared``
+    users and systems), which many people submit under. Tokens are kept for the window
+    (or ``TOKEN_RETENTION`` if longer), oldest first, so memory is bounded by
+    the submissions inside it.
+    """
+
+    def __init__(self, window=timedelta(hours=DUPLICATE_WINDOW_HOURS), is_shared=None):
+        self.window = window
+        self.is_shared = is_shared or (lambda response: False)
+        self.horizon = max(window, TOKEN_RETENTION)
+        self._lock = threading.Lock()
+        self._last = {}
+        self._tokens = {}
+        # Claimed but not yet committed
+        self._pending_keys = set()
+        self._pending_tokens = set()
+
+    def claim(self, response, now=None):
+        """Reserve a response before it is written
+
+        Returns ``ACCEPTED`` if it should be written, ``DUPLICATE`` if the same
+        key was submitted within the window, or ``ALREADY_SUBMITTED`` if its
+        token is stored or being written.
+        """
+        now = now or datetime.now()
+        key = submission_key(response)
+        token = response.get('submission_id')
+        windowed = self._windowed(response)
+        with self._lock:
+            self._expire(now)
+            if token and (token in self._tokens or token in self._pending_tokens):
+                return ALREADY_SUBMITTED
+            if windowed:
+                last = self._last.get(key)
+                if key in self._pending_keys or (last is not None and now - last < self.window):
+                    return DUPLICATE
+                self._pending_keys.add(key)
+            if token:
+                self._pending_tokens.add(token)
+            return ACCEPTED
+
+    def recently_submitted(self, response, now=None):
+        """Check, without claiming, whether the response's key is inside the window"""
+        if not self._windowed(response):
+            return False
+        key = submission_key(response)
+        with self._lock:
+            last = self._last.get(key)
+            return key in self._pending_keys or (last is not None and (now or datetime.now()) - last < self.window)
+
+    def _windowed(self, response):
+        """Check if the duplicate window applies to the response"""
+        return bool(self.window) and not self.is_shared(response)
+
+    def release(self, response):
+        """Drop the claim on a response whose write failed"""
+        with self._lock:
+            self._pending_keys.discard(submission_key(response))
+            self._pending_tokens.discard(response.get('submission_id'))
+
+    def update(self, responses):
+        """Record a batch of committed responses"""
+        with self._lock:
+            for response in responses:
+                key = submission_key(response)
+                self._pending_keys.discard(key)
+                self._pending_tokens.discard(response.get('submission_id'))
+                try:
+                    submitted = datetime.fromisoformat(str(response.get('timestamp')))
+                except ValueError:
+                    submitted = datetime.now()
+                self._add(key, submitted, response.get('submission_id'))
+
+    def rebuild(self, store, chunk_size=10000, now=None):
+        """Reload the index from the responses stored within the window"""
+        since = pd.Timestamp((now or datetime.now()) - self.horizon)
+        with self._lock:
+            self._last = {}
+            self._tokens = {}
+            recent = []
+            for chunk in store.iter_chunks(chunk_size=chunk_size):
+                if chunk.empty:
+                    continue
+                chunk = chunk.assign(timestamp=pd.to_datetime(chunk['timestamp'], errors='coerce'))
+                chunk = chunk[chunk['timestamp'] >= since]
+                if 'submission_id' not in chunk.columns:
+                    chunk = chunk.assign(submission_id=None)
+                columns = ['department', 'tool', 'user', 'system_number', 'timestamp', 'submission_id']
+                recent.extend(chunk[columns].itertuples(index=False, name=None))
+            # Tokens expire oldest first, so insert them in time order
+            recent.sort(key=lambda row: row[4])
+            for department, tool, user, system_number, timestamp, token in recent:
+                key = (department, tool, user, normalize_system_number(system_number or ''))
+                self._add(key, timestamp.to_pydatetime(), token if isinstance(token, str) else None)
+
+    def _add(self, key, submitted, token):
+        if key not in self._last or self._last[key] < submitted:
+            self._last[key] = submitted
+        if token:
+            self._tokens[token] = submitted
+
+    def _expire(self, now):
+        cutoff = now - self.horizon
+        while self._tokens:
+            token, submitted = next(iter(self._tokens.items()))
+            if submitted >= cutoff:
+                break
+            del self._tokens[token]
+
+
+def attach(store, window_hours=DUPLICATE_WINDOW_HOURS, is_shared=None):
+    """Build the index from the store and keep it in sync with new commits"""
+    index = DuplicateIndex(timedelta(hours=window_hours), is_shared)
+    index.rebuild(store)
+    store.add_listener(index.update)
+    return index
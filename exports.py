@@ -0,0 +1,227 @@
+"""Export artifacts for the admin download.
+
+Exports are only built when an admin asks for one. They are streamed from
+the store chunk by chunk, so peak memory is bounded by the chunk size rather
+than the dataset, and written to ``EXPORT_DIR`` under a name derived from the
+store's fingerprint. Asking again for the same data is then just a file read,
+and a new submission produces a new name.
+
+Delta exports hold only the responses numbered after a cursor, so a consumer
+that pulls regularly pays for the new rows rather than the whole history.
+``ExportCursors`` remembers, per named consumer, the last ``seq`` it has been
+given.
+"""
+import glob
+import gzip
+import hashlib
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from questionnaires import BASE_COLUMNS, QUESTIONNAIRES
+
+EXPORT_DIR = 'exports'
+CURSORS_FILE = 'export_cursors.json'
+CHUNK_SIZE = 10000
+
+# Export format -> (file extension, MIME type)
+FORMATS = {
+    'csv': ('.csv', 'text/csv'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'xlsx': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+def available_formats():
+    """Return the export formats whose optional dependencies are installed"""
+    formats = ['csv', 'parquet']
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        formats.append('xlsx')
+    return formats
+
+
+def export_columns(questionnaire=None):
+    """Return the export header: shared columns, then each question's column"""
+    names = [questionnaire] if questionnaire else list(QUESTIONNAIRES)
+    columns = list(BASE_COLUMNS[:4])
+    for name in names:
+        columns.extend(q.column for q in QUESTIONNAIRES[name].questions if q.column not in columns)
+    columns.extend(['timestamp', 'seq'])
+    return columns
+
+
+def export_filename(fmt, questionnaire=None, compress=False):
+    """Return the download name for an export"""
+    extension, _ = FORMATS[fmt]
+    name = f'survey_responses_{questionnaire}' if questionnaire else 'survey_responses'
+    return name + extension + ('.gz' if compress else '')
+
+
+def delta_filename(fmt, after, upto, compress=False):
+    """Return the download name for the responses numbered after ``after`` up to ``upto``"""
+    extension, _ = FORMATS[fmt]
+    span = f'through_{upto}' if after is None else f'{after + 1}-{upto}'
+    return f'survey_responses_{span}' + extension + ('.gz' if compress else '')
+
+
+def mime_type(fmt, compress=False):
+    """Return the MIME type of an export"""
+    return 'application/gzip' if compress else FORMATS[fmt][1]
+
+
+def _chunks(store, questionnaire, columns, chunk_size, after=None, upto=None):
+    for chunk in store.iter_chunks(questionnaire=questionnaire, chunk_size=chunk_size, after=after):
+        if upto is not None and 'seq' in chunk.columns:
+            # Responses committed while the export runs belong to the next delta
+            chunk = chunk[~(chunk['seq'] > upto)]
+        if not chunk.empty:
+            chunk = chunk.reindex(columns=columns)
+            chunk['seq'] = chunk['seq'].astype('Int64')
+            yield chunk
+
+
+def write_csv(chunks, path, columns, compress=False):
+    opener = gzip.open if compress else open
+    with opener(path, 'wt', encoding='utf-8', newline='') as f:
+        f.write(','.join(columns) + '\n')
+        for chunk in chunks:
+            chunk.to_csv(f, index=False, header=False)
+
+
+def write_parquet(chunks, path, columns):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column, pa.string()) for column in columns])
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        for chunk in chunks:
+            chunk = chunk.astype('string')
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def write_xlsx(chunks, path, columns):
+    from openpyxl import Workbook
+
+    # Write-only mode streams rows to disk instead of building the sheet in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Responses')
+    sheet.append(columns)
+    for chunk in chunks:
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            sheet.append([None if value is None else str(value) for value in row])
+    workbook.save(path)
+
+
+def get_export(store, fmt='csv', questionnaire=None, compress=False,
+               export_dir=EXPORT_DIR, chunk_size=CHUNK_SIZE):
+    """Return the path of an export of the current data, building it if needed"""
+    if fmt not in available_formats():
+        raise ValueError(f"Export format {fmt!r} is not available; expected one of {available_formats()}")
+    compress = compress and fmt == 'csv'
+    filename = export_filename(fmt, questionnaire, compress)
+    version = hashlib.sha1(store.fingerprint().encode('utf-8')).hexdigest()[:12]
+    path = os.path.join(export_dir, f'{version}-{filename}')
+    if os.path.exists(path):
+        return path
+
+    columns = export_columns(questionnaire)
+    _write(_chunks(store, questionnaire, columns, chunk_size), path, fmt, columns, compress)
+    _remove_stale(os.path.join(export_dir, f'*-{filename}'), path)
+    return path
+
+
+def get_delta_export(store, after=None, fmt='csv', compress=False,
+                     export_dir=EXPORT_DIR, chunk_size=CHUNK_SIZE):
+    """Export the responses numbered after ``after`` and return ``(path, upto)``
+
+    ``upto`` is the last sequence number included, to be saved as the
+    consumer's new cursor. ``path`` is None when there is nothing new. With
+    ``after=None`` every response is included, even ones stored before
+    numbering. Deltas always cover every questionnaire, since a cursor is a
+    position in the one sequence they share.
+    """
+    if fmt not in available_formats():
+        raise ValueError(f"Export format {fmt!r} is not available; expected one of {available_formats()}")
+    compress = compress and fmt == 'csv'
+    upto = store.last_seq()
+    if after is not None and upto <= after:
+        return None, after
+    # A range of sequence numbers never changes, so its file can be reused as is
+    path = os.path.join(export_dir, 'delta-' + delta_filename(fmt, after, upto, compress))
+    if not os.path.exists(path):
+        columns = export_columns()
+        _write(_chunks(store, None, columns, chunk_size, after, upto), path, fmt, columns, compress)
+        _remove_stale(os.path.join(export_dir, 'delta-*'), path)
+    return path, upto
+
+
+def _write(chunks, path, fmt, columns, compress):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    if fmt == 'csv':
+        write_csv(chunks, tmp_path, columns, compress)
+    elif fmt == 'parquet':
+        write_parquet(chunks, tmp_path, columns)
+    else:
+        write_xlsx(chunks, tmp_path, columns)
+    os.replace(tmp_path, path)
+
+
+def _remove_stale(pattern, keep):
+    for old_path in glob.glob(pattern):
+        if old_path != keep and not old_path.endswith('.tmp'):
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+
+class ExportCursors:
+    """Named consumers and the last sequence number each has exported"""
+
+    def __init__(self, path=CURSORS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def all(self):
+        """Return every consumer's cursor as ``{name: {'seq', 'updated'}}``"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, consumer):
+        """Return the last ``seq`` exported to ``consumer``, or None if it is new"""
+        cursor = self.all().get(consumer)
+        return cursor['seq'] if cursor else None
+
+    def advance(self, consumer, seq):
+        """Record that ``consumer`` has every response up to ``seq``"""
+        with self._lock:
+            cursors = self.all()
+            current = cursors.get(consumer, {}).get('seq')
+            if current is not None and current >= seq:
+                return
+            cursors[consumer] = {'seq': seq, 'updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+            self._save(cursors)
+
+    def reset(self, consumer):
+        """Forget a consumer, so its next delta is a full export"""
+        with self._lock:
+            cursors = self.all()
+            if cursors.pop(consumer, None) is not None:
+                self._save(cursors)
+
+    def _save(self, cursors):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cursors, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
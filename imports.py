@@ -0,0 +1,182 @@
+"""Bulk import of responses collected offline.
+
+Sites that fill in paper or spreadsheet copies of the survey upload them as
+CSV or XLSX files with the export's column names. A whole file is checked
+column by column against the directory and the questionnaires, instead of
+row by row through the survey steps, and the valid rows are stored with one
+``append_many`` call, so they land in a single commit. Rejected rows come
+back with the reasons they were turned away.
+
+Every imported row gets a ``submission_id`` derived from its contents, so
+uploading the same file again does not store its rows twice.
+"""
+import re
+from datetime import datetime
+
+import pandas as pd
+
+from directory import MIN_SYSTEM_NUMBER_LENGTH, normalize_system_number
+from exports import export_columns
+from questionnaires import (
+    BASE_COLUMNS, DEFAULT_QUESTIONNAIRE, QUESTIONNAIRES, TOOL_QUESTIONNAIRES,
+)
+
+# Columns every imported file must have
+REQUIRED_COLUMNS = BASE_COLUMNS[:4]
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+WHOLE_NUMBER = re.compile(r'^(\d+)\.0*$')
+
+
+def available_formats():
+    """Return the file formats that can be imported with the installed packages"""
+    formats = ['csv']
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        formats.append('xlsx')
+    return formats
+
+
+def template_columns():
+    """Return the header of an import file: the export's columns without ``seq``"""
+    return [column for column in export_columns() if column != 'seq'] + ['submission_id']
+
+
+def read_upload(file, fmt='csv'):
+    """Read an import file into a frame of stripped strings, empty cells as ''"""
+    if fmt == 'xlsx':
+        df = pd.read_excel(file, dtype=str, keep_default_na=False)
+    elif fmt == 'csv':
+        df = pd.read_csv(file, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+    else:
+        raise ValueError(f"Cannot import {fmt!r} files; expected one of {available_formats()}")
+    df.columns = [str(column).strip() for column in df.columns]
+    return df.fillna('').apply(lambda column: _map_unique(column.astype(str), str.strip))
+
+
+def _map_unique(values, function):
+    """Apply ``function`` once per distinct value rather than once per row"""
+    codes, uniques = pd.factorize(values)
+    return pd.Series(pd.Index(uniques).map(function).to_numpy()[codes], index=values.index)
+
+
+def _pairs_in(frame, allowed):
+    """Mark the rows whose tuple of column values is in ``allowed``"""
+    return pd.Series(pd.MultiIndex.from_frame(frame).isin(list(allowed)), index=frame.index)
+
+
+def _content_ids(df, columns):
+    """Return a submission id per row, hashed from the row's values"""
+    hashes = pd.util.hash_pandas_object(df[columns], index=False)
+    return 'import-' + pd.Series(hashes.to_numpy(), index=df.index).map('{:016x}'.format)
+
+
+def validate(df, directory, stored_ids=(), now=None):
+    """Check a frame read by ``read_upload`` and turn its valid rows into responses
+
+    ``stored_ids`` are the submission ids already in the store. Returns
+    ``(responses, rejected)``: the response dicts to store, in file order,
+    and a frame of the rejected rows with their file ``row`` number and the
+    ``errors`` found in them.
+    """
+    missing = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f"The file has no {', '.join(missing)} column")
+    upload, df = df, df.copy()
+    errors = pd.Series('', index=df.index)
+
+    def reject(mask, message):
+        nonlocal errors
+        if mask.any():
+            errors = errors.mask(mask, errors + message + '; ')
+
+    # Directory membership, each a set lookup over whole columns
+    pairs = {(department, tool) for department in directory.departments for tool in directory.tools(department)}
+    known_department = df['department'].isin(directory.departments)
+    known_tool = _pairs_in(df[['department', 'tool']], pairs)
+    known_user = _pairs_in(df[['department', 'tool', 'user']], {
+        (department, tool, user) for department, tool in pairs for user in directory.users(department, tool)
+    })
+    reject(~known_department, "unknown department")
+    reject(known_department & ~known_tool, "tool is not used in this department")
+    reject(known_tool & ~known_user, "user is not listed for this tool")
+
+    normalized = _map_unique(df['system_number'], normalize_system_number)
+    long_enough = normalized.str.len() >= MIN_SYSTEM_NUMBER_LENGTH
+    installed = _pairs_in(df[['department', 'tool']].assign(system_number=normalized), {
+        (department, tool, system) for department, tool in pairs for system in directory.systems(department, tool)
+    })
+    reject(~long_enough, f"system number is shorter than {MIN_SYSTEM_NUMBER_LENGTH} characters")
+    reject(known_tool & long_enough & ~installed, "tool is not installed on this system number")
+    df['system_number'] = _map_unique(df['system_number'], directory.canonical_system_number)
+
+    if 'timestamp' not in df.columns:
+        df['timestamp'] = ''
+    if 'submission_id' not in df.columns:
+        df['submission_id'] = ''
+
+    # Answers, checked per questionnaire against its own questions
+    kinds = df['tool'].map(TOOL_QUESTIONNAIRES).fillna(DEFAULT_QUESTIONNAIRE)
+    columns = {}
+    for name, questionnaire in QUESTIONNAIRES.items():
+        rows = kinds == name
+        columns[name] = list(REQUIRED_COLUMNS) + [q.column for q in questionnaire.questions] + ['timestamp']
+        if not rows.any():
+            continue
+        for question in questionnaire.questions:
+            if question.column not in df.columns:
+                df[question.column] = ''
+            values = df[question.column]
+            if question.value_type == 'int':
+                # Spreadsheets turn 4 into 4.0
+                values = df[question.column] = _map_unique(values, lambda value: WHOLE_NUMBER.sub(r'\1', value))
+            answered = rows & (values != '')
+            if question.required:
+                reject(rows & ~answered, f"{question.column} is required")
+            if question.widget == 'radio':
+                reject(answered & ~values.isin(question.options), f"{question.column} is not one of its options")
+            elif question.widget == 'multiselect':
+                choices = values[answered].str.split(', ').explode()
+                invalid = (~choices.isin(question.options)).groupby(level=0).any()
+                reject(invalid.reindex(df.index, fill_value=False).astype(bool),
+                       f"{question.column} has an unknown option")
+        unnamed = rows & (df['submission_id'] == '')
+        df.loc[unnamed, 'submission_id'] = _content_ids(df.loc[unnamed], columns[name])
+    reject(df['submission_id'].isin(stored_ids), "already imported")
+    reject(df['submission_id'].duplicated(), "repeats an earlier row of the file")
+
+    given = df['timestamp'] != ''
+    parsed = pd.to_datetime(df['timestamp'].where(given), format='ISO8601', errors='coerce')
+    reject(given & parsed.isna(), "timestamp is not a date and time (YYYY-MM-DD HH:MM:SS)")
+    # Undated rows are stamped with the import time
+    now = (now or datetime.now()).strftime(TIMESTAMP_FORMAT)
+    df['timestamp'] = parsed.dt.strftime(TIMESTAMP_FORMAT).fillna(now)
+
+    valid = errors == ''
+    responses = {}
+    for name in QUESTIONNAIRES:
+        names = columns[name] + ['submission_id']
+        selected = df.loc[valid & (kinds == name), names]
+        responses.update(zip(selected.index, (dict(zip(names, row))
+                                              for row in selected.itertuples(index=False, name=None))))
+    rejected = upload.loc[~valid].copy()
+    rejected.insert(0, 'errors', errors[~valid].str[:-2])
+    rejected.insert(0, 'row', rejected.index + 2)
+    return [responses[i] for i in sorted(responses)], rejected.reset_index(drop=True)
+
+
+def import_responses(store, df, directory, now=None):
+    """Validate an import frame and store its valid rows in one commit
+
+    Returns ``(imported, rejected)`` as the number of responses stored and
+    the frame of rejected rows from ``validate``.
+    """
+    stored = store.load(columns=['submission_id'])
+    stored_ids = stored['submission_id'].dropna() if 'submission_id' in stored.columns else ()
+    responses, rejected = validate(df, directory, stored_ids, now)
+    store.append_many(responses)
+    return len(responses), rejected
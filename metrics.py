@@ -0,0 +1,263 @@
+"""Prometheus metrics for alerting on the survey.
+
+A ``Registry`` holds counters and gauges, optionally labelled, and renders
+them in the Prometheus text exposition format. Values kept elsewhere are
+read when the registry is rendered: gauges can be backed by a function (the
+stored row count, the store's size on disk) and collectors turn the phase
+timings into histograms, so nothing is polled between scrapes.
+
+The text is exposed by ``MetricsServer``, a small HTTP endpoint on a
+background thread, or ``TextfileWriter``, which rewrites a ``.prom`` file
+for node exporter's textfile collector every few seconds. Both use only the
+standard library. Counters start from zero in every server process, so give
+each process its own port or file.
+"""
+import collections
+import logging
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from timings import Histogram
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+METRICS_PATH = '/metrics'
+TEXTFILE_INTERVAL_S = 15
+
+# A metric family as rendered: samples are (name, labels, value)
+Family = collections.namedtuple('Family', 'name type help samples')
+
+
+def _escape(value, quote=True):
+    value = str(value).replace('\\', '\\\\').replace('\n', '\\n')
+    return value.replace('"', '\\"') if quote else value
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        if value.is_integer():
+            return str(int(value))
+        return repr(value)
+    return str(value)
+
+
+def render(families):
+    """Return metric families in the Prometheus text format"""
+    lines = []
+    for family in families:
+        lines.append(f'# HELP {family.name} {_escape(family.help, quote=False)}')
+        lines.append(f'# TYPE {family.name} {family.type}')
+        for name, labels, value in family.samples:
+            if labels:
+                name += '{' + ','.join(f'{key}="{_escape(label)}"' for key, label in labels.items()) + '}'
+            lines.append(f'{name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+class Counter:
+    """A count that only goes up, per combination of label values"""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        if not self.labels:
+            self._values[()] = 0
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return Family(self.name, self.type, self.help,
+                      [(self.name, dict(zip(self.labels, key)), value) for key, value in values])
+
+
+class Gauge(Counter):
+    """A value that goes up and down, set directly or read from ``function`` on collection"""
+
+    type = 'gauge'
+
+    def __init__(self, name, help, labels=(), function=None):
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def set(self, value, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+    def collect(self):
+        if self.function is not None:
+            self.set(self.function())
+        return super().collect()
+
+
+class Registry:
+    """The metrics of this process, rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), function=None):
+        return self._register(Gauge(name, help, labels, function))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name!r} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def __getitem__(self, name):
+        return self._metrics[name]
+
+    def add_collector(self, collect):
+        """Call ``collect()`` on every rendering for more ``Family`` values"""
+        self._collectors.append(collect)
+
+    def collect(self):
+        families = []
+        for metric in list(self._metrics.values()):
+            try:
+                families.append(metric.collect())
+            except Exception:
+                # One failing gauge must not take down the whole scrape
+                logger.exception("Collecting metric %s failed", metric.name)
+        for collect in self._collectors:
+            try:
+                families.extend(collect())
+            except Exception:
+                logger.exception("Metrics collector %r failed", collect)
+        return families
+
+    def exposition(self):
+        """Return every metric in the Prometheus text format"""
+        return render(self.collect())
+
+
+def histogram_family(name, help, histogram):
+    """Return a ``timings.Histogram`` as a Prometheus histogram in seconds"""
+    samples = []
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        samples.append((f'{name}_bucket', {'le': _format_value(bound / 1000)}, cumulative))
+    samples.append((f'{name}_bucket', {'le': '+Inf'}, histogram.count))
+    samples.append((f'{name}_sum', {}, histogram.total / 1000))
+    samples.append((f'{name}_count', {}, histogram.count))
+    return Family(name, 'histogram', help, samples)
+
+
+def timings_collector(timings, phases):
+    """Return a collector exposing timed phases as histograms
+
+    ``phases`` maps each phase name in ``timings`` to the ``(name, help)``
+    of its metric. Phases not timed yet are exposed as empty histograms.
+    """
+    def collect():
+        histograms = timings.histograms()
+        return [histogram_family(name, help, histograms.get(phase) or Histogram())
+                for phase, (name, help) in phases.items()]
+    return collect
+
+
+def attach(store, registry, aggregates):
+    """Count the store's commits in ``registry`` and expose its size
+
+    The number of stored responses is read from the running ``aggregates``,
+    which count every process's commits.
+    """
+    submissions = registry.counter(
+        'survey_submissions_total', "Responses stored by this process", ('department', 'tool')
+    )
+    last_submission = registry.gauge(
+        'survey_last_submission_timestamp_seconds', "Unix time of the last response stored by this process"
+    )
+
+    def update(records):
+        counts = collections.Counter((record['department'], record['tool']) for record in records)
+        for (department, tool), n in counts.items():
+            submissions.inc(n, department=department, tool=tool)
+        last_submission.set(time.time())
+
+    store.add_listener(update)
+    registry.gauge('survey_stored_responses', "Responses in the store", function=aggregates.total)
+    registry.gauge('survey_store_size_bytes', "Bytes the stored responses take on disk", function=store.disk_usage)
+    return registry
+
+
+class MetricsServer:
+    """Serve the registry at ``/metrics`` over HTTP on a background thread"""
+
+    def __init__(self, registry, host='127.0.0.1', port=9108):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != METRICS_PATH:
+                    self.send_error(404)
+                    return
+                body = registry.exposition().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes every few seconds would flood the server log
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name='survey-metrics', daemon=True)
+        self._thread.start()
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+
+class TextfileWriter:
+    """Rewrite the registry to ``path`` every ``interval`` seconds on a background thread
+
+    The file is replaced atomically, so the textfile collector never reads
+    half of it; its name should end in ``.prom``.
+    """
+
+    def __init__(self, registry, path, interval=TEXTFILE_INTERVAL_S):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.write()
+        self._thread = threading.Thread(target=self._run, name='survey-metrics-textfile', daemon=True)
+        self._thread.start()
+
+    def write(self):
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.registry.exposition())
+        os.replace(tmp_path, self.path)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except Exception:
+                logger.exception("Writing metrics to %s failed", self.path)
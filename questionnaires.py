@@ -0,0 +1,183 @@
+"""Declarative step-5 questionnaires.
+
+The questionnaires are defined as data in ``questionnaires.json``: sections of
+questions, each with its widget, options, required flag and the response
+column it is stored under, plus a numeric value per option for questions that
+feed a survey KPI. The file is parsed and validated once, when this
+module is first imported, into immutable ``Questionnaire`` tuples. The app
+renders and validates every questionnaire from those with a single loop, so
+adding a survey for a new tool is a data change.
+"""
+import json
+import os
+from collections import namedtuple
+
+QUESTIONNAIRES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'questionnaires.json')
+
+# Columns every response carries, in the order they are stored
+BASE_COLUMNS = ('department', 'tool', 'user', 'system_number', 'timestamp')
+
+WIDGETS = ('radio', 'multiselect', 'text_area')
+VALUE_TYPES = ('str', 'int')
+
+# Survey KPIs a radio question can feed; see analytics.py
+KPIS = ('satisfaction', 'hours_saved', 'error_reduction', 'recommendation')
+
+MISSING_ANSWERS_MESSAGE = "Please answer all required questions marked with *"
+
+Question = namedtuple('Question', [
+    'column', 'key', 'widget', 'text', 'label', 'options', 'placeholder',
+    'required', 'value_type', 'missing_message', 'kpi', 'values',
+])
+Section = namedtuple('Section', ['title', 'questions'])
+Questionnaire = namedtuple('Questionnaire', ['name', 'label', 'tools', 'sections', 'questions'])
+
+
+def compile_question(definition, where):
+    """Validate one question definition and return it as a ``Question``"""
+    for field in ('column', 'key', 'widget', 'text'):
+        if not definition.get(field):
+            raise ValueError(f"{where}: missing '{field}'")
+    widget = definition['widget']
+    if widget not in WIDGETS:
+        raise ValueError(f"{where}: unknown widget {widget!r}; expected one of {WIDGETS}")
+    options = tuple(definition.get('options', ()))
+    if widget != 'text_area' and not options:
+        raise ValueError(f"{where}: a {widget} needs options")
+    if len(set(options)) != len(options):
+        raise ValueError(f"{where}: duplicate options")
+    value_type = definition.get('value_type', 'str')
+    if value_type not in VALUE_TYPES:
+        raise ValueError(f"{where}: unknown value_type {value_type!r}; expected one of {VALUE_TYPES}")
+    kpi = definition.get('kpi')
+    if kpi is not None and kpi not in KPIS:
+        raise ValueError(f"{where}: unknown kpi {kpi!r}; expected one of {KPIS}")
+    if kpi is not None and widget != 'radio':
+        raise ValueError(f"{where}: only a radio question can feed a kpi")
+    values = definition.get('values')
+    if values is None and value_type == 'int':
+        values = [int(option) for option in options]
+    if values is not None:
+        if len(values) != len(options) or not all(isinstance(v, (int, float)) for v in values):
+            raise ValueError(f"{where}: 'values' must give a number for each option")
+        values = tuple(float(v) for v in values)
+    if kpi is not None and values is None:
+        raise ValueError(f"{where}: a kpi question needs 'values' for its options")
+    required = bool(definition.get('required', False))
+    text = definition['text']
+    return Question(
+        column=definition['column'],
+        key=definition['key'],
+        widget=widget,
+        text=text,
+        label=f'{text} *' if required else text,
+        options=options,
+        placeholder=definition.get('placeholder', ''),
+        required=required,
+        value_type=value_type,
+        missing_message=definition.get('missing_message'),
+        kpi=kpi,
+        values=values,
+    )
+
+
+def compile_questionnaire(name, definition):
+    """Validate one questionnaire definition and return it as a ``Questionnaire``"""
+    sections = []
+    columns, keys = set(BASE_COLUMNS), set()
+    for i, section in enumerate(definition.get('sections', [])):
+        questions = []
+        for j, question in enumerate(section.get('questions', [])):
+            question = compile_question(question, f"{name}: section {i + 1}, question {j + 1}")
+            if question.column in columns:
+                raise ValueError(f"{name}: column {question.column!r} is used twice")
+            if question.key in keys:
+                raise ValueError(f"{name}: widget key {question.key!r} is used twice")
+            columns.add(question.column)
+            keys.add(question.key)
+            questions.append(question)
+        sections.append(Section(section.get('title', ''), tuple(questions)))
+    if not keys:
+        raise ValueError(f"{name}: no questions defined")
+    return Questionnaire(
+        name=name,
+        label=definition.get('label', name),
+        tools=tuple(definition.get('tools', ())),
+        sections=tuple(sections),
+        questions=tuple(q for section in sections for q in section.questions),
+    )
+
+
+def compile_questionnaires(definitions):
+    """Compile every questionnaire and work out which tools use which
+
+    Returns ``(questionnaires, tool_questionnaires, default)``.
+    """
+    questionnaires = {}
+    tool_questionnaires = {}
+    defaults = []
+    for name, definition in definitions.items():
+        questionnaire = compile_questionnaire(name, definition)
+        for tool in questionnaire.tools:
+            if tool in tool_questionnaires:
+                raise ValueError(f"{name}: tool {tool!r} already uses {tool_questionnaires[tool]!r}")
+            tool_questionnaires[tool] = name
+        if definition.get('default'):
+            defaults.append(name)
+        questionnaires[name] = questionnaire
+    if len(defaults) != 1:
+        raise ValueError(f"Exactly one questionnaire must be the default, found {defaults}")
+    return questionnaires, tool_questionnaires, defaults[0]
+
+
+def load_questionnaires(path=QUESTIONNAIRES_FILE):
+    """Parse and compile the questionnaire definitions file"""
+    with open(path, encoding='utf-8') as f:
+        return compile_questionnaires(json.load(f))
+
+
+QUESTIONNAIRES, TOOL_QUESTIONNAIRES, DEFAULT_QUESTIONNAIRE = load_questionnaires()
+
+# Free-text answers across all questionnaires
+FREE_TEXT_COLUMNS = tuple(
+    q.column for questionnaire in QUESTIONNAIRES.values()
+    for q in questionnaire.questions if q.widget == 'text_area'
+)
+
+# Answers that are stored as small integers rather than strings
+INTEGER_COLUMNS = tuple(
+    q.column for questionnaire in QUESTIONNAIRES.values()
+    for q in questionnaire.questions if q.value_type == 'int'
+)
+
+
+def questionnaire_type(tool):
+    """Return the name of the questionnaire a tool's respondents answer"""
+    return TOOL_QUESTIONNAIRES.get(tool, DEFAULT_QUESTIONNAIRE)
+
+
+def questionnaire_for_tool(tool):
+    """Return the compiled questionnaire a tool's respondents answer"""
+    return QUESTIONNAIRES[questionnaire_type(tool)]
+
+
+def validate_answers(questionnaire, answers):
+    """Return an error message if a required question is unanswered, else None"""
+    missing = [q for q in questionnaire.questions if q.required and not answers.get(q.column)]
+    if not missing:
+        return None
+    for question in missing:
+        if question.missing_message:
+            return question.missing_message
+    return MISSING_ANSWERS_MESSAGE
+
+
+def build_response(questionnaire, answers):
+    """Return the answers as stored response columns, in question order"""
+    response = {}
+    for question in questionnaire.questions:
+        value = answers.get(question.column)
+        if question.widget == 'multiselect':
+            value = ', '.join(value or [])
+        response[question.column] = value
+    return response
@@ -0,0 +1,234 @@
+"""Time-series rollups behind the admin trend charts.
+
+Responses are counted per hour, day and week and per department and tool,
+together with the sum and count of every score answer, in a small SQLite
+table. A store listener adds each committed batch with one upsert, so a trend
+chart reads a few hundred rollup rows instead of parsing every stored
+timestamp. ``backfill`` recomputes the table from the stored responses; run
+this module to do it once for existing data::
+
+    python rollups.py [backend]
+
+Buckets are keyed by the epoch seconds of their start, read on the same wall
+clock the survey timestamps are recorded in. Weeks start on Monday.
+"""
+import calendar
+import sys
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from questionnaires import INTEGER_COLUMNS
+from storage import connect_shared, create_store, swap_table, transaction
+
+ROLLUPS_DB = 'survey_rollups.db'
+
+GRANULARITIES = ('hour', 'day', 'week')
+
+# Metric holding the number of responses; the others are score columns
+RESPONSES = 'responses'
+
+# Batches at least this large (bulk imports) are grouped in pandas
+FRAME_BATCH = 1000
+
+# How far back a trend chart looks from the latest bucket, in seconds
+TREND_SPANS = {
+    'hour': 7 * 24 * 3600,
+    'day': 90 * 24 * 3600,
+    'week': 52 * 7 * 24 * 3600,
+}
+
+# Both take the table name, so a backfill can build a staging table
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        granularity TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        department TEXT NOT NULL,
+        tool TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        total REAL NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (granularity, metric, bucket, department, tool)
+    ) WITHOUT ROWID;
+"""
+
+UPSERT = """
+    INSERT INTO {table} (granularity, bucket, department, tool, metric, total, count)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (granularity, metric, bucket, department, tool) DO UPDATE SET
+        total = total + excluded.total,
+        count = count + excluded.count
+"""
+
+
+def bucket_start(moment, granularity):
+    """Return the epoch seconds of the bucket a datetime falls in"""
+    if granularity == 'hour':
+        moment = moment.replace(minute=0, second=0, microsecond=0)
+    else:
+        moment = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        if granularity == 'week':
+            moment -= timedelta(days=moment.weekday())
+    return calendar.timegm(moment.timetuple())
+
+
+def bucket_starts(timestamps, granularity):
+    """Vectorized ``bucket_start`` over a datetime Series"""
+    if granularity == 'hour':
+        starts = timestamps.dt.floor('h')
+    else:
+        starts = timestamps.dt.normalize()
+        if granularity == 'week':
+            starts = starts - pd.to_timedelta(starts.dt.weekday, unit='D')
+    return (starts - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+
+
+def score(value):
+    """Return a score answer as an int, or None if it is missing"""
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def rollup_records(records):
+    """Return upsert rows for a batch of response dicts"""
+    sums = {}
+    for record in records:
+        try:
+            moment = datetime.fromisoformat(str(record.get('timestamp')))
+        except ValueError:
+            continue
+        metrics = [(RESPONSES, 1)]
+        metrics.extend((column, score(record.get(column))) for column in INTEGER_COLUMNS)
+        for granularity in GRANULARITIES:
+            bucket = bucket_start(moment, granularity)
+            for metric, value in metrics:
+                if value is None:
+                    continue
+                key = (granularity, bucket, str(record.get('department')), str(record.get('tool')), metric)
+                total, count = sums.get(key, (0, 0))
+                sums[key] = (total + value, count + 1)
+    return [key + value for key, value in sums.items()]
+
+
+def rollup_frame(df):
+    """Return upsert rows for a frame of responses, grouped in pandas"""
+    timestamps = pd.to_datetime(df['timestamp'], errors='coerce')
+    df = df[timestamps.notna()]
+    timestamps = timestamps[timestamps.notna()]
+    rows = []
+    for granularity in GRANULARITIES:
+        keys = pd.DataFrame({
+            'bucket': bucket_starts(timestamps, granularity),
+            'department': df['department'].astype(str),
+            'tool': df['tool'].astype(str),
+        })
+        counts = keys.groupby(['bucket', 'department', 'tool']).size()
+        rows.extend((granularity, int(bucket), department, tool, RESPONSES, int(n), int(n))
+                    for (bucket, department, tool), n in counts.items())
+        for column in INTEGER_COLUMNS:
+            if column not in df.columns:
+                continue
+            values = pd.to_numeric(df[column], errors='coerce')
+            scored = keys.assign(value=values).dropna(subset=['value'])
+            grouped = scored.groupby(['bucket', 'department', 'tool'])['value'].agg(['sum', 'count'])
+            rows.extend((granularity, int(bucket), department, tool, column, float(total), int(n))
+                        for (bucket, department, tool), total, n
+                        in zip(grouped.index, grouped['sum'], grouped['count']))
+    return rows
+
+
+class Rollups:
+    """Hourly, daily and weekly counts and score sums in SQLite"""
+
+    def __init__(self, path=ROLLUPS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect_shared(path)
+        self._conn.executescript(SCHEMA.format(table='rollups'))
+
+    def update(self, responses):
+        """Add a batch of committed responses"""
+        if len(responses) >= FRAME_BATCH:
+            rows = rollup_frame(pd.DataFrame(responses))
+        else:
+            rows = rollup_records(responses)
+        with self._lock, transaction(self._conn):
+            self._conn.executemany(UPSERT.format(table='rollups'), rows)
+
+    def backfill(self, store, chunk_size=10000):
+        """Recompute every rollup from the stored responses
+
+        The rollups are built in a staging table, one short transaction per
+        chunk, and swapped in at the end, so other processes' updates never
+        wait for the whole scan. Returns the number of responses read.
+        """
+        staging = f'rollups_{uuid.uuid4().hex}'
+        read = 0
+        with self._lock:
+            self._conn.executescript(SCHEMA.format(table=staging))
+        try:
+            for chunk in store.iter_chunks(chunk_size=chunk_size):
+                if chunk.empty:
+                    continue
+                rows = rollup_frame(chunk)
+                with self._lock, transaction(self._conn):
+                    self._conn.executemany(UPSERT.format(table=staging), rows)
+                read += len(chunk)
+            with self._lock:
+                swap_table(self._conn, 'rollups', staging)
+        except BaseException:
+            with self._lock:
+                self._conn.execute(f'DROP TABLE IF EXISTS {staging}')
+            raise
+        return read
+
+    def is_empty(self):
+        """Check whether nothing has been rolled up yet"""
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM rollups LIMIT 1').fetchone() is None
+
+    def trend(self, granularity='day', metric=RESPONSES, by='tool'):
+        """Return a frame indexed by bucket start with one column per department or tool
+
+        Values are response counts, or mean scores for a score metric. Only
+        the last ``TREND_SPANS[granularity]`` seconds before the latest
+        bucket are included.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity {granularity!r}; expected one of {GRANULARITIES}")
+        if by not in ('department', 'tool'):
+            raise ValueError(f"Cannot group trends by {by!r}; expected 'department' or 'tool'")
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT bucket, {by}, SUM(total), SUM(count) FROM rollups '
+                'WHERE granularity = ? AND metric = ? AND bucket >= ('
+                '    SELECT MAX(bucket) FROM rollups WHERE granularity = ? AND metric = ?'
+                ') - ? '
+                f'GROUP BY bucket, {by}',
+                (granularity, metric, granularity, metric, TREND_SPANS[granularity])
+            ).fetchall()
+        if not rows:
+            return pd.DataFrame()
+        df = pd.DataFrame(rows, columns=['bucket', by, 'total', 'count'])
+        df['value'] = df['total'] if metric == RESPONSES else df['total'] / df['count']
+        df['bucket'] = pd.to_datetime(df['bucket'], unit='s')
+        return df.pivot(index='bucket', columns=by, values='value').sort_index()
+
+
+def attach(store, path=ROLLUPS_DB):
+    """Open the rollups (backfilling them if empty) and keep them in sync with the store"""
+    rollups = Rollups(path)
+    if rollups.is_empty():
+        rollups.backfill(store)
+    store.add_listener(rollups.update, rebuild=rollups.backfill)
+    return rollups
+
+
+if __name__ == '__main__':
+    backend = sys.argv[1] if len(sys.argv) > 1 else 'csv'
+    count = Rollups().backfill(create_store(backend))
+    print(f"Rolled up {count} responses into {ROLLUPS_DB}")
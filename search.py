@@ -0,0 +1,165 @@
+"""Full-text search over the free-text answers.
+
+Every non-empty free-text answer is a row in an SQLite FTS5 table, with the
+department, tool, user, question column and submission time stored beside
+it. A store listener indexes each committed batch, so the index is always
+current, and searches are answered from the inverted index with BM25
+ranking and highlighted snippets instead of a scan of the stored responses.
+"""
+import hashlib
+import re
+import threading
+import uuid
+
+from questionnaires import FREE_TEXT_COLUMNS
+from storage import connect_shared, frame_records, swap_table, transaction
+
+SEARCH_DB = 'survey_search.db'
+
+# Markers around matched terms in snippets; control characters cannot occur
+# in submitted text
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+# The department and tool are also indexed as opaque facet tokens, so filters
+# intersect posting lists instead of checking every matching row
+# Both take the table name, so a rebuild can build a staging index
+SCHEMA = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(
+        answer,
+        facets,
+        department UNINDEXED,
+        tool UNINDEXED,
+        user UNINDEXED,
+        question UNINDEXED,
+        timestamp UNINDEXED,
+        tokenize = 'porter unicode61'
+    );
+"""
+
+INSERT = ('INSERT INTO {table} (answer, facets, department, tool, user, question, timestamp) '
+          'VALUES (?, ?, ?, ?, ?, ?, ?)')
+
+_TERM = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def match_query(text):
+    """Turn a search box entry into an FTS5 query
+
+    Words must all appear (in any form the stemmer folds together), "quoted
+    words" must appear as a phrase and a trailing ``*`` matches a prefix.
+    Everything else is quoted, so user input cannot inject FTS5 syntax.
+    """
+    terms = []
+    for phrase, word in _TERM.findall(text):
+        term = phrase or word
+        prefix = not phrase and term.endswith('*')
+        term = term.rstrip('*').replace('"', '""').strip()
+        if term:
+            terms.append(f'"{term}"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+
+def facet(kind, value):
+    """Return the single token a department or tool is indexed under"""
+    return kind + hashlib.sha1(str(value).encode('utf-8')).hexdigest()[:16]
+
+
+def answer_rows(records):
+    """Return index rows for the free-text answers in a batch of response dicts"""
+    rows = []
+    for record in records:
+        for column in FREE_TEXT_COLUMNS:
+            answer = record.get(column)
+            if isinstance(answer, str) and answer.strip():
+                department, tool = record.get('department'), record.get('tool')
+                rows.append((answer, f"{facet('d', department)} {facet('t', tool)}", department, tool,
+                             record.get('user'), column, str(record.get('timestamp'))))
+    return rows
+
+
+class FeedbackIndex:
+    """FTS5 index of free-text answers"""
+
+    def __init__(self, path=SEARCH_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect_shared(path)
+        self._conn.executescript(SCHEMA.format(table='feedback'))
+
+    def update(self, responses):
+        """Index the free-text answers of a batch of committed responses"""
+        rows = answer_rows(responses)
+        if not rows:
+            return
+        with self._lock, transaction(self._conn):
+            self._conn.executemany(INSERT.format(table='feedback'), rows)
+
+    def rebuild(self, store, chunk_size=10000):
+        """Re-index every stored response; returns the number of answers indexed
+
+        The index is built in a staging table, one short transaction per
+        chunk, and swapped in at the end, so other processes' updates never
+        wait for the whole scan.
+        """
+        staging = f'feedback_{uuid.uuid4().hex}'
+        indexed = 0
+        with self._lock:
+            self._conn.executescript(SCHEMA.format(table=staging))
+        try:
+            for chunk in store.iter_chunks(chunk_size=chunk_size):
+                if chunk.empty:
+                    continue
+                rows = answer_rows(frame_records(chunk))
+                with self._lock, transaction(self._conn):
+                    self._conn.executemany(INSERT.format(table=staging), rows)
+                indexed += len(rows)
+            with self._lock:
+                self._conn.execute(f"INSERT INTO {staging} ({staging}) VALUES ('optimize')")
+                swap_table(self._conn, 'feedback', staging)
+        except BaseException:
+            with self._lock:
+                self._conn.execute(f'DROP TABLE IF EXISTS {staging}')
+            raise
+        return indexed
+
+    def is_empty(self):
+        """Check whether nothing has been indexed yet"""
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM feedback LIMIT 1').fetchone() is None
+
+    def search(self, text, department=None, tool=None, limit=20):
+        """Return ``(total, results)`` for the answers matching a search box entry
+
+        ``results`` are the ``limit`` best matches by BM25 rank, as dicts with
+        the response fields, the ``question`` column and a ``snippet`` whose
+        matched terms are wrapped in ``HIGHLIGHT_START`` / ``HIGHLIGHT_END``.
+        """
+        query = match_query(text)
+        if not query:
+            return 0, []
+        query = f'answer : ({query})'
+        if department:
+            query += f" AND facets : {facet('d', department)}"
+        if tool:
+            query += f" AND facets : {facet('t', tool)}"
+        where, params = 'feedback MATCH ?', [query]
+        with self._lock:
+            total = self._conn.execute(f'SELECT COUNT(*) FROM feedback WHERE {where}', params).fetchone()[0]
+            rows = self._conn.execute(
+                'SELECT department, tool, user, question, timestamp, '
+                f"snippet(feedback, 0, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 16) "
+                f'FROM feedback WHERE {where} ORDER BY rank LIMIT ?',
+                params + [limit]
+            ).fetchall()
+        columns = ('department', 'tool', 'user', 'question', 'timestamp', 'snippet')
+        return total, [dict(zip(columns, row)) for row in rows]
+
+
+def attach(store, path=SEARCH_DB):
+    """Open the index (building it if empty) and keep it in sync with the store"""
+    index = FeedbackIndex(path)
+    if index.is_empty():
+        index.rebuild(store)
+    store.add_listener(index.update, rebuild=index.rebuild)
+    return index
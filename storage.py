@@ -0,0 +1,1229 @@
+"""Persistence for survey responses.
+
+Responses go through a ``ResponseStore``. The backend is picked by name with
+``create_store``:
+
+``csv``
+    Submissions are appended one record at a time to a JSON-lines log, so the
+    cost of saving a response does not depend on how many responses are
+    already stored. The log is folded back into ``survey_responses.csv`` only
+    by an explicit compaction step.
+
+``sqlite``
+    Submissions are inserted into an indexed SQLite database running in WAL
+    mode, which is safe for concurrent writers.
+
+``parquet``
+    Submissions are appended to the same JSON-lines log as ``csv``; compaction
+    moves them into Parquet files partitioned by questionnaire and month,
+    with typed and dictionary-encoded columns, so readers only open the
+    partitions and columns they ask for.
+
+``segments``
+    For several server processes sharing a host or volume. Each process
+    appends to its own JSON-lines segment and readers merge the segments
+    with the compacted CSV, coordinated by advisory file locks.
+
+A single store is meant to be shared by every session in the process; its
+``version`` counter changes whenever the stored data does, so readers can
+tell when a cached copy is stale. Every stored response gets a ``seq``
+number, increasing in commit order, so consumers can ask for only the
+responses after the last one they saw. ``GroupCommitWriter`` sits in front of a
+store so submissions are persisted by a background thread in batches.
+"""
+import collections
+import glob
+import json
+import logging
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import timedelta
+
+import pandas as pd
+
+import timings
+from questionnaires import (
+    BASE_COLUMNS, DEFAULT_QUESTIONNAIRE, FREE_TEXT_COLUMNS, INTEGER_COLUMNS,
+    QUESTIONNAIRES, TOOL_QUESTIONNAIRES, questionnaire_type,
+)
+
+RESPONSES_CSV = 'survey_responses.csv'
+RESPONSES_LOG = 'survey_responses.jsonl'
+RESPONSES_DB = 'survey_responses.db'
+RESPONSES_DIR = 'survey_responses'
+RESPONSES_SEGMENTS = 'survey_responses.d'
+
+# Columns that hold a different value in every row, so categories would not help
+UNIQUE_COLUMNS = ('submission_id',)
+
+# Arrow-backed strings keep text in one buffer instead of a Python object per row
+TEXT_DTYPE = 'string[pyarrow]'
+
+# How long a write to a SQLite file shared by several processes waits for
+# another process's write, in seconds
+SHARED_DB_TIMEOUT_S = 30
+
+# Frames ``load`` keeps per version: an admin rerun asks for every response,
+# the KPI columns and the submission ids
+LOAD_CACHE_SIZE = 4
+
+logger = logging.getLogger(__name__)
+
+
+def select_responses(df, questionnaire=None, columns=None):
+    """Narrow a frame of responses to one questionnaire and/or a set of columns"""
+    if df.empty:
+        return df
+    if questionnaire is not None:
+        df = df[df['tool'].map(questionnaire_type) == questionnaire]
+        # Drop the other questionnaires' columns, which are empty for these rows
+        df = df.dropna(axis=1, how='all')
+    if columns is not None:
+        df = df[[column for column in columns if column in df.columns]]
+    return df.reset_index(drop=True)
+
+
+def date_bounds(start=None, end=None):
+    """Return ISO strings for an inclusive date range as [start, end + 1 day)"""
+    lower = start.strftime('%Y-%m-%d') if start else None
+    upper = (end + timedelta(days=1)).strftime('%Y-%m-%d') if end else None
+    return lower, upper
+
+
+def filter_responses(df, filters):
+    """Apply ``ResponseStore.query`` filters to a frame of responses in memory"""
+    if df.empty:
+        return df
+    mask = pd.Series(True, index=df.index)
+    for column in ('department', 'tool', 'user'):
+        if filters.get(column):
+            mask &= df[column] == filters[column]
+    if filters.get('questionnaire'):
+        mask &= df['tool'].map(questionnaire_type) == filters['questionnaire']
+    lower, upper = date_bounds(filters.get('start'), filters.get('end'))
+    if lower or upper:
+        timestamps = pd.to_datetime(df['timestamp'])
+        if lower:
+            mask &= timestamps >= pd.Timestamp(lower)
+        if upper:
+            mask &= timestamps < pd.Timestamp(upper)
+    return df[mask]
+
+
+def after_seq(df, after=None):
+    """Keep the rows numbered after ``after``; rows stored before numbering have no ``seq``"""
+    if after is None or df.empty:
+        return df
+    if 'seq' not in df.columns:
+        return df.iloc[0:0]
+    return df[df['seq'] > after]
+
+
+def sort_responses(df, sort, descending):
+    """Order a frame of responses by one column, keeping ties in stored order"""
+    if df.empty:
+        return df
+    return df.sort_values(sort, ascending=not descending, kind='stable')
+
+
+def cut_page(df, limit, offset):
+    """Cut one page out of a sorted frame"""
+    if df.empty:
+        return df
+    # Only show the questionnaire columns the rows on this page use
+    page = df.iloc[offset:offset + limit].dropna(axis=1, how='all')
+    return page.reset_index(drop=True)
+
+
+def not_compacted(records, compacted):
+    """Drop the logged records numbered up to ``compacted``, which a snapshot already holds"""
+    if not compacted:
+        return records
+    return [record for record in records if record.get('seq') is None or record['seq'] > compacted]
+
+
+def file_signature(path):
+    """Return a cheap signature of a file's size and modification time"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return '-'
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def iter_log_chunks(log_path, chunk_size, questionnaire=None, after=None):
+    """Yield the submission log as DataFrames of at most ``chunk_size`` rows"""
+    if not os.path.exists(log_path):
+        return
+    records = []
+    with open(log_path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+            if len(records) == chunk_size:
+                yield select_responses(after_seq(pd.DataFrame(records), after), questionnaire)
+                records = []
+    if records:
+        yield select_responses(after_seq(pd.DataFrame(records), after), questionnaire)
+
+
+def read_log(log_path=RESPONSES_LOG, size=None):
+    """Return the records in the submission log, skipping a torn last line
+
+    ``size`` limits the read to the first ``size`` bytes of the file.
+    """
+    records = []
+    if not os.path.exists(log_path):
+        return records
+    with open(log_path, 'rb') as f:
+        data = f.read() if size is None else f.read(size)
+    for line in data.decode('utf-8', errors='replace').splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            # A crash mid-write can only leave the final line incomplete
+            break
+    return records
+
+
+class ResponseStore:
+    """Base class for response storage backends"""
+
+    def __init__(self):
+        self.version = 0
+        # Serializes writes against compaction and cache updates
+        self._lock = threading.Lock()
+        # Serializes full reads against compaction; writes never wait for it
+        self._read_lock = threading.Lock()
+        # Frames returned by load, most recently used last
+        self._frames = collections.OrderedDict()
+        # The sorted matches of the last query, for paging without rereading
+        self._matches = None
+        self._matches_key = None
+        self._listeners = []
+        self._rebuilds = []
+        self._last_seq = None
+
+    def add_listener(self, listener, rebuild=None):
+        """Call ``listener(responses)`` with every batch after it is committed
+
+        Listeners keep derived data (aggregates, indexes) up to date and run
+        under the store's write lock, so they see batches in commit order.
+        ``rebuild(store)``, if given, recomputes the listener's data from
+        scratch for ``rebuild_listeners``.
+        """
+        self._listeners.append(listener)
+        if rebuild is not None:
+            self._rebuilds.append(rebuild)
+
+    def rebuild_listeners(self):
+        """Recompute the derived data of every listener added with a ``rebuild``
+
+        Writes wait until the rebuilds are done, so no batch is missed or
+        counted twice; with the ``segments`` backend, so do other processes'.
+        The write lock is held throughout, so a rebuild must read through
+        ``iter_chunks``, not ``load``.
+        """
+        with self._lock:
+            for rebuild in self._rebuilds:
+                rebuild(self)
+
+    def append(self, response):
+        """Durably store a single response"""
+        self.append_many([response])
+
+    def append_many(self, responses):
+        """Durably store a batch of responses with a single commit"""
+        if not responses:
+            return
+        with self._lock:
+            records = self._append_many(responses)
+            self.version += 1
+            for listener in self._listeners:
+                try:
+                    listener(records)
+                except Exception:
+                    # The batch is already durable; derived data can be rebuilt
+                    logger.exception("Response listener %r failed", listener)
+
+    def load(self, questionnaire=None, columns=None):
+        """Return stored responses as a DataFrame, cached per version
+
+        ``questionnaire`` limits the result to one questionnaire by name and
+        ``columns`` to the named columns. Columns have the compact types of
+        ``typed_frame``; use ``frame_records`` to get plain response dicts.
+        """
+        key = (self._data_version(), questionnaire, tuple(columns) if columns else None)
+        frame = self._cached_frame(key)
+        if frame is not None:
+            return frame
+        with self._read_lock:
+            # Another reader may have loaded it while this one waited
+            frame = self._cached_frame(key)
+            if frame is not None:
+                return frame
+            # Read without the write lock, so submissions are not held up
+            frame = typed_frame(self._read(questionnaire, columns))
+            with self._lock:
+                # A frame read while a batch was committed may lack it
+                if self._data_version() == key[0]:
+                    self._cache_frame(key, frame)
+        return frame
+
+    def _cached_frame(self, key):
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+            return frame
+
+    def _cache_frame(self, key, frame):
+        """Keep a loaded frame, dropping frames of older versions; call with the write lock held"""
+        for stale in [cached for cached in self._frames if cached[0] != key[0]]:
+            del self._frames[stale]
+        self._frames[key] = frame
+        while len(self._frames) > LOAD_CACHE_SIZE:
+            self._frames.popitem(last=False)
+
+    def query(self, filters=None, sort='timestamp', descending=True, limit=100, offset=0):
+        """Return ``(total, page)`` for the responses matching ``filters``
+
+        ``filters`` may hold ``department``, ``tool``, ``user`` and
+        ``questionnaire`` names plus ``start`` and ``end`` dates (inclusive).
+        ``page`` is the DataFrame of at most ``limit`` matching responses
+        after skipping ``offset``, ordered by the ``sort`` column.
+
+        Only the ``sqlite`` backend answers from indexes, in time independent
+        of the number of stored responses. The others filter and sort every
+        response once per data version and filters, and cut later pages
+        from those sorted matches.
+        """
+        filters = {key: value for key, value in (filters or {}).items() if value}
+        if sort not in BASE_COLUMNS:
+            raise ValueError(f"Cannot sort by {sort!r}; expected one of {BASE_COLUMNS}")
+        return self._query(filters, sort, descending, limit, offset)
+
+    def compact(self):
+        """Fold pending writes into the main store
+
+        Returns the number of pending records that were folded in.
+        """
+        with self._read_lock, self._lock:
+            compacted = self._compact()
+            if compacted:
+                self.version += 1
+            return compacted
+
+    def iter_chunks(self, questionnaire=None, chunk_size=10000, after=None):
+        """Yield stored responses as DataFrames of at most ``chunk_size`` rows
+
+        Only one chunk is held in memory at a time, so callers that stream
+        (exports) are bounded by the chunk size rather than the dataset.
+        With ``after``, only responses whose ``seq`` is greater are yielded.
+        """
+        raise NotImplementedError
+
+    def last_seq(self):
+        """Return the highest sequence number stored so far (0 if none)"""
+        with self._lock:
+            if self._last_seq is None:
+                self._last_seq = self._read_last_seq()
+            return self._last_seq
+
+    def fingerprint(self):
+        """Return a string that changes whenever the stored data does, across restarts"""
+        raise NotImplementedError
+
+    def disk_usage(self):
+        """Return the bytes the stored responses take on disk, pending writes included"""
+        total = 0
+        for path in self._paths():
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def _data_version(self):
+        """Return a value that changes whenever the data ``load`` would see does"""
+        return self.version
+
+    def _append_many(self, responses):
+        """Store the batch and return the stored records, ``seq`` included"""
+        raise NotImplementedError
+
+    def _sequenced(self, responses):
+        """Return copies of the responses numbered after the last stored one"""
+        if self._last_seq is None:
+            self._last_seq = self._read_last_seq()
+        records = []
+        for response in responses:
+            self._last_seq += 1
+            records.append({**response, 'seq': self._last_seq})
+        return records
+
+    def _read_last_seq(self):
+        raise NotImplementedError
+
+    def _read(self, questionnaire, columns):
+        return select_responses(self._read_all(), questionnaire, columns)
+
+    def _query(self, filters, sort, descending, limit, offset):
+        # No index to use: admin reruns and page changes repeat the query, so
+        # only new data or other filters filter and sort the responses again
+        key = (self.fingerprint(), tuple(sorted(filters.items())), sort, descending)
+        with self._lock:
+            matches = self._matches if self._matches_key == key else None
+        if matches is None:
+            # Read without the write lock, so submissions are not held up
+            matches = sort_responses(self._read_matches(filters), sort, descending)
+            with self._lock:
+                if self.fingerprint() == key[0]:
+                    self._matches = matches
+                    self._matches_key = key
+        return len(matches), cut_page(matches, limit, offset)
+
+    def _read_matches(self, filters):
+        """Return the stored responses matching ``filters``"""
+        return filter_responses(self.load(), filters)
+
+    def _read_all(self):
+        raise NotImplementedError
+
+    def _compact(self):
+        return 0
+
+    def _paths(self):
+        """Return the files holding the stored responses"""
+        return []
+
+
+class LogStore(ResponseStore):
+    """Append-only response log plus a compacted CSV snapshot"""
+
+    def __init__(self, csv_path=RESPONSES_CSV, log_path=RESPONSES_LOG):
+        super().__init__()
+        self.csv_path = csv_path
+        self.log_path = log_path
+        self._snapshot_seq = None
+
+    def _append_many(self, responses):
+        records = self._sequenced(responses)
+        lines = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        return records
+
+    def iter_chunks(self, questionnaire=None, chunk_size=10000, after=None):
+        compacted = self._snapshot_last_seq() if os.path.exists(self.csv_path) else 0
+        # The snapshot holds the lowest numbers, so a delta can often skip it
+        if os.path.exists(self.csv_path) and (after is None or compacted > after):
+            for chunk in pd.read_csv(self.csv_path, chunksize=chunk_size):
+                yield select_responses(after_seq(chunk, after), questionnaire)
+        if compacted:
+            after = max(after or 0, compacted)
+        yield from iter_log_chunks(self.log_path, chunk_size, questionnaire, after)
+
+    def _pending(self):
+        """Return the logged records not yet in the snapshot
+
+        Compaction replaces the snapshot before it empties the log, so a crash
+        in between leaves records in both; the copies in the log are skipped
+        by ``seq``.
+        """
+        return not_compacted(read_log(self.log_path), self._snapshot_last_seq())
+
+    def _snapshot_last_seq(self):
+        """Return the highest ``seq`` in the CSV snapshot, cached per file version"""
+        signature = file_signature(self.csv_path)
+        if self._snapshot_seq is None or self._snapshot_seq[0] != signature:
+            last = 0
+            if os.path.exists(self.csv_path) and 'seq' in pd.read_csv(self.csv_path, nrows=0).columns:
+                seqs = pd.read_csv(self.csv_path, usecols=['seq'])['seq']
+                if seqs.notna().any():
+                    last = int(seqs.max())
+            self._snapshot_seq = (signature, last)
+        return self._snapshot_seq[1]
+
+    def _read_last_seq(self):
+        last = self._snapshot_last_seq()
+        for record in read_log(self.log_path):
+            if record.get('seq') is not None:
+                last = max(last, record['seq'])
+        return last
+
+    def fingerprint(self):
+        return f'{file_signature(self.csv_path)}/{file_signature(self.log_path)}'
+
+    def _paths(self):
+        return [path for path in (self.csv_path, self.log_path) if path]
+
+    def _read_all(self):
+        frames = []
+        if os.path.exists(self.csv_path):
+            frames.append(pd.read_csv(self.csv_path))
+        pending = self._pending()
+        if pending:
+            frames.append(pd.DataFrame(pending))
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def _compact(self):
+        if not os.path.exists(self.log_path) or not os.path.getsize(self.log_path):
+            return 0
+        pending = self._pending()
+        if pending:
+            df = self._read_all()
+            if 'seq' in df.columns:
+                # Rows stored before numbering would otherwise turn the column into floats
+                df['seq'] = df['seq'].astype('Int64')
+
+            tmp_path = self.csv_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+                df.to_csv(f, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.csv_path)
+
+        # Also when a crash left only records the snapshot already holds
+        self._empty_log()
+        return len(pending)
+
+    def _empty_log(self):
+        with open(self.log_path, 'w', encoding='utf-8') as f:
+            f.flush()
+            os.fsync(f.fileno())
+
+
+@contextmanager
+def transaction(conn):
+    """Run the block in one SQLite transaction on an autocommit connection"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def connect_shared(path):
+    """Open a SQLite file that every server process writes to, in autocommit mode
+
+    Each process's writes are short transactions, so a writer waits up to
+    ``SHARED_DB_TIMEOUT_S`` for another's instead of failing at once.
+    """
+    conn = sqlite3.connect(path, timeout=SHARED_DB_TIMEOUT_S, check_same_thread=False,
+                           isolation_level=None)
+    # Readers do not wait for writers
+    conn.execute('PRAGMA journal_mode=WAL')
+    return conn
+
+
+def swap_table(conn, table, staging):
+    """Replace ``table`` with a fully built ``staging`` table in one short transaction"""
+    with transaction(conn):
+        conn.execute(f'DROP TABLE {table}')
+        conn.execute(f'ALTER TABLE {staging} RENAME TO {table}')
+
+
+class SqliteStore(ResponseStore):
+    """Responses in a WAL-mode SQLite database
+
+    The columns shared by every questionnaire are real, indexed columns; the
+    questionnaire-specific answers are kept as a JSON object. Connections are
+    pooled and handed out to one thread at a time, since Streamlit runs every
+    rerun on a fresh script thread.
+
+    Commits are synced with ``synchronous=FULL``: in WAL mode, ``NORMAL``
+    can lose the last commits to a power failure or OS crash, after the
+    submitter was told the response was saved. Group commits share one sync
+    per batch, as the log backends share one fsync.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            department TEXT NOT NULL,
+            tool TEXT NOT NULL,
+            user TEXT,
+            system_number TEXT,
+            timestamp TEXT NOT NULL,
+            answers TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_responses_department ON responses (department);
+        CREATE INDEX IF NOT EXISTS idx_responses_tool ON responses (tool);
+        CREATE INDEX IF NOT EXISTS idx_responses_user ON responses (user);
+        CREATE INDEX IF NOT EXISTS idx_responses_system_number ON responses (system_number);
+        CREATE INDEX IF NOT EXISTS idx_responses_timestamp ON responses (timestamp);
+    """
+
+    # The row id doubles as the response's sequence number
+    COLUMNS = 'department, tool, user, system_number, timestamp, answers, id'
+
+    def __init__(self, db_path=RESPONSES_DB, pool_size=4, synchronous='FULL'):
+        super().__init__()
+        self.db_path = db_path
+        self.synchronous = synchronous
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        with self.connection() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False,
+                               isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection for the duration of the block"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def _append_many(self, responses):
+        rows = []
+        for response in responses:
+            row = [response.get(column) for column in BASE_COLUMNS]
+            answers = {k: v for k, v in response.items() if k not in BASE_COLUMNS and k != 'seq'}
+            row.append(json.dumps(answers, ensure_ascii=False))
+            rows.append(row)
+        with self.connection() as conn:
+            with transaction(conn):
+                conn.executemany(
+                    'INSERT INTO responses (department, tool, user, system_number, timestamp, answers) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    rows
+                )
+                # The write lock is held, so the batch got consecutive ids
+                last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        first_id = last_id - len(responses) + 1
+        self._last_seq = last_id
+        return [{**response, 'seq': first_id + i} for i, response in enumerate(responses)]
+
+    def _where(self, filters):
+        """Build a WHERE clause over the indexed columns from query filters"""
+        clauses, params = [], []
+        for column in ('department', 'tool', 'user'):
+            if filters.get(column):
+                clauses.append(f'{column} = ?')
+                params.append(filters[column])
+        questionnaire = filters.get('questionnaire')
+        if questionnaire == DEFAULT_QUESTIONNAIRE:
+            tools = list(TOOL_QUESTIONNAIRES)
+            clauses.append(f"tool NOT IN ({', '.join('?' * len(tools))})")
+            params.extend(tools)
+        elif questionnaire:
+            tools = list(QUESTIONNAIRES[questionnaire].tools)
+            clauses.append(f"tool IN ({', '.join('?' * len(tools))})")
+            params.extend(tools)
+        lower, upper = date_bounds(filters.get('start'), filters.get('end'))
+        if lower:
+            clauses.append('timestamp >= ?')
+            params.append(lower)
+        if upper:
+            clauses.append('timestamp < ?')
+            params.append(upper)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        return where, params
+
+    def _read(self, questionnaire, columns):
+        where, params = self._where({'questionnaire': questionnaire})
+        df = self._read_all(where, params)
+        return select_responses(df, questionnaire, columns)
+
+    def _query(self, filters, sort, descending, limit, offset):
+        where, params = self._where(filters)
+        order = 'DESC' if descending else 'ASC'
+        with self.connection() as conn:
+            total = conn.execute(f'SELECT COUNT(*) FROM responses {where}', params).fetchone()[0]
+            rows = conn.execute(
+                f'SELECT {self.COLUMNS} '
+                f'FROM responses {where} ORDER BY {sort} {order}, id {order} LIMIT ? OFFSET ?',
+                params + [limit, offset]
+            ).fetchall()
+        return total, self._to_frame(rows)
+
+    def iter_chunks(self, questionnaire=None, chunk_size=10000, after=None):
+        where, params = self._where({'questionnaire': questionnaire})
+        where = f'{where} AND id > ?' if where else 'WHERE id > ?'
+        last_id = after or 0
+        while True:
+            with self.connection() as conn:
+                rows = conn.execute(
+                    f'SELECT {self.COLUMNS} '
+                    f'FROM responses {where} ORDER BY id LIMIT ?',
+                    params + [last_id, chunk_size]
+                ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][6]
+            yield self._to_frame(rows)
+
+    def fingerprint(self):
+        with self.connection() as conn:
+            count, last_id = conn.execute('SELECT COUNT(*), MAX(id) FROM responses').fetchone()
+        return f'{count}:{last_id}'
+
+    def _paths(self):
+        # Committed pages not yet checkpointed live in the write-ahead log
+        return [self.db_path, self.db_path + '-wal']
+
+    def last_seq(self):
+        # Always ask the database, which other connections may have written to
+        return self._read_last_seq()
+
+    def _read_last_seq(self):
+        with self.connection() as conn:
+            return conn.execute('SELECT COALESCE(MAX(id), 0) FROM responses').fetchone()[0]
+
+    def _read_all(self, where='', params=()):
+        with self.connection() as conn:
+            rows = conn.execute(
+                f'SELECT {self.COLUMNS} '
+                f'FROM responses {where} ORDER BY id',
+                params
+            ).fetchall()
+        return self._to_frame(rows)
+
+    def _to_frame(self, rows):
+        records = []
+        for row in rows:
+            record = dict(zip(BASE_COLUMNS[:4], row[:4]))
+            record.update(json.loads(row[5]))
+            record['timestamp'] = row[4]
+            record['seq'] = row[6]
+            records.append(record)
+        return pd.DataFrame(records)
+
+    def _compact(self):
+        with self.connection() as conn:
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return 0
+
+
+def typed_frame(df):
+    """Convert string answers to compact column types
+
+    Closed-choice answers and identifiers become categoricals, whose rows
+    are small integer codes into one copy of each distinct string; scores
+    become ``Int8`` and free text Arrow-backed strings. Parquet partitions
+    are written with these types and ``ResponseStore.load`` returns them.
+    Columns that already have their type are left alone.
+    """
+    converted = {}
+    for column in df.columns:
+        values = df[column]
+        if column == 'timestamp':
+            if not pd.api.types.is_datetime64_any_dtype(values.dtype):
+                converted[column] = pd.to_datetime(values)
+        elif column == 'seq':
+            if values.dtype != 'Int64':
+                converted[column] = pd.to_numeric(values).astype('Int64')
+        elif column in INTEGER_COLUMNS:
+            if values.dtype != 'Int8':
+                converted[column] = pd.to_numeric(values, errors='coerce').astype('Int8')
+        elif column in FREE_TEXT_COLUMNS or column in UNIQUE_COLUMNS:
+            if values.dtype != TEXT_DTYPE:
+                converted[column] = values.astype(TEXT_DTYPE)
+        elif not isinstance(values.dtype, pd.CategoricalDtype):
+            # Closed-choice answers and identifiers repeat heavily
+            converted[column] = values.astype('string').astype('category')
+    return df.assign(**converted) if converted else df
+
+
+def frame_records(df):
+    """Return a frame's rows as response dicts, with missing values as None"""
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+class PartitionedStore(LogStore):
+    """Append-only log compacted into per-questionnaire, per-month Parquet files
+
+    Partitions live at ``<data_dir>/<questionnaire>/<YYYY-MM>.parquet`` and
+    each holds only the columns its questionnaire uses.
+    """
+
+    def __init__(self, data_dir=RESPONSES_DIR, log_path=RESPONSES_LOG, compression='zstd'):
+        super().__init__(csv_path=None, log_path=log_path)
+        self.data_dir = data_dir
+        self.compression = compression
+
+    def partition_path(self, questionnaire, month):
+        return os.path.join(self.data_dir, questionnaire, f'{month}.parquet')
+
+    def partitions(self, questionnaire=None):
+        """Return the (questionnaire, month) pairs that have data on disk"""
+        found = []
+        for name in [questionnaire] if questionnaire else QUESTIONNAIRES:
+            for path in sorted(glob.glob(os.path.join(self.data_dir, name, '*.parquet'))):
+                found.append((name, os.path.basename(path)[:-len('.parquet')]))
+        return found
+
+    def read_partition(self, questionnaire, month, columns=None, filters=None):
+        """Read one partition, limited to the requested columns it has
+
+        ``filters`` are pyarrow row filters, applied while reading.
+        """
+        import pyarrow.parquet as pq
+
+        path = self.partition_path(questionnaire, month)
+        if columns is not None:
+            present = set(pq.read_schema(path).names)
+            columns = [column for column in columns if column in present]
+        return pq.read_table(path, columns=columns, filters=filters).to_pandas()
+
+    def partition_last_seq(self, questionnaire, month):
+        """Return the highest ``seq`` in a partition from its footer statistics"""
+        import pyarrow.parquet as pq
+
+        metadata = pq.read_metadata(self.partition_path(questionnaire, month))
+        names = metadata.schema.names
+        if 'seq' not in names:
+            return 0
+        index = names.index('seq')
+        last = 0
+        for i in range(metadata.num_row_groups):
+            statistics = metadata.row_group(i).column(index).statistics
+            if statistics is not None and statistics.has_min_max:
+                last = max(last, statistics.max)
+        return last
+
+    def iter_chunks(self, questionnaire=None, chunk_size=10000, after=None):
+        import pyarrow.parquet as pq
+
+        for name, month in self.partitions(questionnaire):
+            # Partitions entirely at or before the cursor are skipped unopened
+            if after is not None and self.partition_last_seq(name, month) <= after:
+                continue
+            parquet_file = pq.ParquetFile(self.partition_path(name, month))
+            for batch in parquet_file.iter_batches(batch_size=chunk_size):
+                yield after_seq(batch.to_pandas(), after)
+        pending = self._pending()
+        for start in range(0, len(pending), chunk_size):
+            chunk = pd.DataFrame(pending[start:start + chunk_size])
+            yield select_responses(after_seq(chunk, after), questionnaire)
+
+    def _pending(self):
+        """Return the logged records not yet in their partition
+
+        Compaction replaces the partitions before it empties the log, so a
+        crash in between leaves records in both. A partition holds every
+        record of its questionnaire and month up to its highest ``seq``, so
+        the copies in the log are skipped per partition.
+        """
+        compacted = {}
+        pending = []
+        for record in read_log(self.log_path):
+            partition = (questionnaire_type(record.get('tool')), str(record.get('timestamp'))[:7])
+            if partition not in compacted:
+                exists = os.path.exists(self.partition_path(*partition))
+                compacted[partition] = self.partition_last_seq(*partition) if exists else 0
+            if record.get('seq') is None or record['seq'] > compacted[partition]:
+                pending.append(record)
+        return pending
+
+    def _snapshot_last_seq(self):
+        return max([self.partition_last_seq(name, month) for name, month in self.partitions()], default=0)
+
+    def fingerprint(self):
+        signatures = [file_signature(self.partition_path(name, month))
+                      for name, month in self.partitions()]
+        signatures.append(file_signature(self.log_path))
+        return '/'.join(signatures)
+
+    def _paths(self):
+        return [self.partition_path(name, month) for name, month in self.partitions()] + [self.log_path]
+
+    def _read_matches(self, filters):
+        """Read the responses matching ``filters`` from the partitions and the log"""
+        lower, upper = date_bounds(filters.get('start'), filters.get('end'))
+        row_filters = [(column, '=', filters[column])
+                       for column in ('department', 'tool', 'user') if filters.get(column)]
+        if lower:
+            row_filters.append(('timestamp', '>=', pd.Timestamp(lower)))
+        if upper:
+            row_filters.append(('timestamp', '<', pd.Timestamp(upper)))
+
+        with self._read_lock:
+            frames = []
+            for name, month in self.partitions(filters.get('questionnaire')):
+                # Skip whole months outside the date range
+                if (lower and month < lower[:7]) or (upper and month > upper[:7]):
+                    continue
+                frames.append(self.read_partition(name, month, filters=row_filters or None))
+            pending = self._pending()
+        if pending:
+            frames.append(filter_responses(pd.DataFrame(pending), filters))
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame()
+        return typed_frame(pd.concat(frames, ignore_index=True))
+
+    def _read(self, questionnaire, columns):
+        frames = [self.read_partition(name, month, columns)
+                  for name, month in self.partitions(questionnaire)]
+        pending = self._pending()
+        if pending:
+            frames.append(select_responses(pd.DataFrame(pending), questionnaire, columns))
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame()
+        return typed_frame(pd.concat(frames, ignore_index=True))
+
+    def _read_all(self):
+        return self._read(None, None)
+
+    def _compact(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not os.path.exists(self.log_path) or not os.path.getsize(self.log_path):
+            return 0
+        pending = self._pending()
+        if not pending:
+            # A crash left only records the partitions already hold
+            self._empty_log()
+            return 0
+        df = pd.DataFrame(pending)
+        df['_questionnaire'] = df['tool'].map(questionnaire_type)
+        df['_month'] = df['timestamp'].str[:7]
+
+        # Rewrite each touched partition as one file: cost is bounded by the
+        # partition (one questionnaire-month), not the whole dataset
+        written = []
+        for (questionnaire, month), group in df.groupby(['_questionnaire', '_month']):
+            group = group.drop(columns=['_questionnaire', '_month']).dropna(axis=1, how='all')
+            path = self.partition_path(questionnaire, month)
+            if os.path.exists(path):
+                group = pd.concat([pq.read_table(path).to_pandas(), group], ignore_index=True)
+            table = pa.Table.from_pandas(typed_frame(group), preserve_index=False)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+            pq.write_table(table, tmp_path, compression=self.compression)
+            written.append((tmp_path, path))
+
+        for tmp_path, path in written:
+            os.replace(tmp_path, path)
+        self._empty_log()
+        return len(pending)
+
+
+@contextmanager
+def file_lock(path, exclusive=True):
+    """Hold an advisory ``flock`` on ``path`` for the duration of the block
+
+    Each call opens its own file description, so the lock also excludes
+    other threads of the same process.
+    """
+    import fcntl
+
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class SegmentStore(LogStore):
+    """Per-process append-only segments merged with a compacted CSV on read
+
+    Every process appends to ``<segment_dir>/<host>-<pid>.jsonl``, so
+    writers never share a file. Three advisory locks in the segment directory
+    coordinate them:
+
+    ``write.lock``
+        Held exclusively for the moment a batch is numbered and written (its
+        fsync happens after release, so processes fsync in parallel) and
+        shared by readers while they note each segment's length.
+    ``compact.lock``
+        Held exclusively by compaction and shared by readers for the whole
+        read, so a reader never sees a segment both in the CSV and on its own.
+    ``commit.lock``
+        Shared by a writer from numbering a batch until its listeners have
+        run, and held exclusively by ``rebuild_listeners``, so a rebuild sees
+        exactly the batches every process's derived data already counts.
+
+    Compaction seals the current segments, merges them into the CSV and
+    deletes them; writers start fresh segments on their next batch. Sealed
+    records already in the CSV are skipped by ``seq``, so a crash between
+    replacing the CSV and deleting the segments loses or repeats nothing.
+    """
+
+    def __init__(self, csv_path=RESPONSES_CSV, segment_dir=RESPONSES_SEGMENTS):
+        super().__init__(csv_path=csv_path, log_path=None)
+        self.segment_dir = segment_dir
+        os.makedirs(segment_dir, exist_ok=True)
+        self.segment_path = os.path.join(segment_dir, f'{socket.gethostname()}-{os.getpid()}.jsonl')
+        self.write_lock_path = os.path.join(segment_dir, 'write.lock')
+        self.compact_lock_path = os.path.join(segment_dir, 'compact.lock')
+        self.commit_lock_path = os.path.join(segment_dir, 'commit.lock')
+        self.seq_path = os.path.join(segment_dir, 'seq')
+
+    def append_many(self, responses):
+        with file_lock(self.commit_lock_path, exclusive=False):
+            super().append_many(responses)
+
+    def rebuild_listeners(self):
+        # Other processes' writers wait too, and so do the listeners of any
+        # batch they committed before the rebuild started
+        with file_lock(self.commit_lock_path):
+            super().rebuild_listeners()
+
+    def _append_many(self, responses):
+        with file_lock(self.write_lock_path):
+            first = self._read_counter() + 1
+            records = [{**response, 'seq': first + i} for i, response in enumerate(responses)]
+            lines = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+            # Opened per batch, so a segment sealed by compaction is not written to again
+            f = open(self.segment_path, 'a', encoding='utf-8')
+            try:
+                f.write(lines)
+                f.flush()
+                self._write_counter(records[-1]['seq'])
+            except BaseException:
+                f.close()
+                raise
+        try:
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        self._last_seq = records[-1]['seq']
+        return records
+
+    def compact(self):
+        # The file locks order compaction against every process's writers, so
+        # this process's writers are not held up by the in-process lock
+        return self._compact()
+
+    def _read_counter(self):
+        try:
+            with open(self.seq_path, encoding='utf-8') as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            # First write, or the counter was lost: recount from the data
+            last = self._snapshot_last_seq()
+            for path, size in self._segment_sizes():
+                for record in read_log(path, size):
+                    last = max(last, record.get('seq') or 0)
+            return last
+
+    def _write_counter(self, seq):
+        tmp_path = self.seq_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(str(seq))
+        os.replace(tmp_path, self.seq_path)
+
+    def _segment_sizes(self):
+        paths = glob.glob(os.path.join(self.segment_dir, '*.jsonl'))
+        paths += glob.glob(os.path.join(self.segment_dir, '*.sealed'))
+        sizes = []
+        for path in sorted(paths):
+            try:
+                sizes.append((path, os.path.getsize(path)))
+            except OSError:
+                pass
+        return sizes
+
+    def _pending(self):
+        """Return the segment records not yet in the CSV, in ``seq`` order
+
+        Call with ``compact.lock`` held.
+        """
+        with file_lock(self.write_lock_path, exclusive=False):
+            sizes = self._segment_sizes()
+        compacted = self._snapshot_last_seq()
+        records = []
+        for path, size in sizes:
+            records.extend(r for r in read_log(path, size) if (r.get('seq') or 0) > compacted)
+        records.sort(key=lambda record: record['seq'])
+        return records
+
+    def last_seq(self):
+        # Other processes write too, so ask the shared counter every time
+        with file_lock(self.write_lock_path, exclusive=False):
+            return self._read_counter()
+
+    def _read_last_seq(self):
+        return self.last_seq()
+
+    def fingerprint(self):
+        with file_lock(self.write_lock_path, exclusive=False):
+            sizes = self._segment_sizes()
+        signatures = [file_signature(self.csv_path)]
+        signatures.extend(f'{os.path.basename(path)}:{size}' for path, size in sizes)
+        return '/'.join(signatures)
+
+    def _paths(self):
+        return [self.csv_path] + [path for path, _ in self._segment_sizes()]
+
+    def _data_version(self):
+        return self.fingerprint()
+
+    def iter_chunks(self, questionnaire=None, chunk_size=10000, after=None):
+        with file_lock(self.compact_lock_path, exclusive=False):
+            if os.path.exists(self.csv_path) and (after is None or self._snapshot_last_seq() > after):
+                for chunk in pd.read_csv(self.csv_path, chunksize=chunk_size):
+                    yield select_responses(after_seq(chunk, after), questionnaire)
+            pending = self._pending()
+            for start in range(0, len(pending), chunk_size):
+                chunk = pd.DataFrame(pending[start:start + chunk_size])
+                yield select_responses(after_seq(chunk, after), questionnaire)
+
+    def _read_all(self):
+        with file_lock(self.compact_lock_path, exclusive=False):
+            frames = []
+            if os.path.exists(self.csv_path):
+                frames.append(pd.read_csv(self.csv_path))
+            pending = self._pending()
+            if pending:
+                frames.append(pd.DataFrame(pending))
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def _compact(self):
+        with file_lock(self.compact_lock_path):
+            with file_lock(self.write_lock_path):
+                # Writers reopen their segment per batch, so later batches go to new files
+                for path in glob.glob(os.path.join(self.segment_dir, '*.jsonl')):
+                    os.replace(path, f'{path}.{uuid.uuid4().hex}.sealed')
+            sealed = glob.glob(os.path.join(self.segment_dir, '*.sealed'))
+            pending = self._pending()
+            if pending:
+                frames = [pd.DataFrame(pending)]
+                if os.path.exists(self.csv_path):
+                    frames.insert(0, pd.read_csv(self.csv_path))
+                df = pd.concat(frames, ignore_index=True)
+                df['seq'] = df['seq'].astype('Int64')
+                tmp_path = f'{self.csv_path}.{uuid.uuid4().hex}.tmp'
+                with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+                    df.to_csv(f, index=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.csv_path)
+            for path in sealed:
+                os.remove(path)
+        return len(pending)
+
+
+class PeriodicCompactor:
+    """Call ``store.compact()`` every ``interval`` seconds on a background thread"""
+
+    def __init__(self, store, interval):
+        self.store = store
+        self.interval = interval
+        self._thread = threading.Thread(target=self._run, name='survey-compactor', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.store.compact()
+            except Exception:
+                logger.exception("Periodic compaction of %r failed", self.store)
+
+
+class GroupCommitWriter:
+    """Persist submissions on a background thread in batched group commits
+
+    ``submit`` queues a response and returns a ``Future`` that resolves once
+    the batch containing it has been durably committed. The writer waits up
+    to ``commit_interval`` seconds after the first pending submission to
+    gather more into the same commit. When ``max_pending`` submissions are
+    already queued, ``submit`` blocks, raising ``queue.Full`` after
+    ``timeout`` seconds. Each commit is timed as ``commit`` in ``timings``.
+    """
+
+    def __init__(self, store, max_pending=1000, max_batch=256, commit_interval=0.005, timings=timings.DISABLED):
+        self.store = store
+        self.timings = timings
+        self.max_batch = max_batch
+        self.commit_interval = commit_interval
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name='survey-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, response, timeout=None):
+        """Queue a response for the next group commit"""
+        future = Future()
+        self._queue.put((response, future), timeout=timeout)
+        return future
+
+    def pending(self):
+        """Return the number of submissions waiting to be committed"""
+        return self._queue.qsize()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.commit_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                with self.timings.phase('commit'):
+                    self.store.append_many([response for response, _ in batch])
+            except Exception as exc:
+                for _, future in batch:
+                    future.set_exception(exc)
+            else:
+                for _, future in batch:
+                    future.set_result(len(batch))
+
+
+BACKENDS = {
+    'csv': LogStore,
+    'sqlite': SqliteStore,
+    'parquet': PartitionedStore,
+    'segments': SegmentStore,
+}
+
+
+def create_store(backend='csv', **options):
+    """Create the response store for the named backend"""
+    try:
+        store_class = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown storage backend {backend!r}; expected one of {sorted(BACKENDS)}")
+    return store_class(**options)
@@ -0,0 +1,44 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage  # noqa: E402
+
+BACKENDS = ('csv', 'sqlite', 'parquet', 'segments')
+
+
+def response(**answers):
+    """Return a submitted response with the shared columns filled in"""
+    return {
+        'department': 'TSG',
+        'tool': 'RV PermitFlow (PTW App)',
+        'user': 'Richa Babbar',
+        'system_number': 'RV-0001',
+        'timestamp': '2026-03-02 09:30:00',
+        'submission_id': uuid.uuid4().hex,
+        **answers,
+    }
+
+
+def open_store(backend, directory):
+    """Open a store of the named backend with every file under ``directory``"""
+    directory = str(directory)
+    paths = {
+        'csv': dict(csv_path=os.path.join(directory, 'responses.csv'),
+                    log_path=os.path.join(directory, 'responses.jsonl')),
+        'sqlite': dict(db_path=os.path.join(directory, 'responses.db')),
+        'parquet': dict(data_dir=os.path.join(directory, 'responses'),
+                        log_path=os.path.join(directory, 'responses.jsonl')),
+        'segments': dict(csv_path=os.path.join(directory, 'responses.csv'),
+                         segment_dir=os.path.join(directory, 'responses.d')),
+    }
+    return storage.create_store(backend, **paths[backend])
+
+
+@pytest.fixture(params=BACKENDS)
+def store(request, tmp_path):
+    return open_store(request.param, tmp_path)
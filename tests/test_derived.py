@@ -0,0 +1,79 @@
+import re
+import threading
+import time
+
+import pytest
+
+import aggregates
+import rollups
+import search
+from conftest import open_store, response
+
+# Each kind of derived data and the name of its full rebuild
+DERIVED = [
+    (aggregates.RunningAggregates, 'rebuild'),
+    (rollups.Rollups, 'backfill'),
+    (search.FeedbackIndex, 'rebuild'),
+]
+
+
+@pytest.mark.parametrize('derived_class, rebuild', DERIVED)
+def test_other_process_updates_during_rebuild(derived_class, rebuild, tmp_path, monkeypatch):
+    store = open_store('csv', tmp_path)
+    store.append_many([response(suggestions=f'Faster permits {i}') for i in range(30)])
+    path = str(tmp_path / 'derived.db')
+    rebuilding, other = derived_class(path), derived_class(path)
+
+    chunks = store.iter_chunks
+    scanning = threading.Event()
+
+    def slow_chunks(**options):
+        for chunk in chunks(**options):
+            scanning.set()
+            time.sleep(0.2)
+            yield chunk
+
+    monkeypatch.setattr(store, 'iter_chunks', slow_chunks)
+    rebuilder = threading.Thread(target=getattr(rebuilding, rebuild), args=(store,), kwargs={'chunk_size': 10})
+    rebuilder.start()
+    assert scanning.wait(5)
+    started = time.monotonic()
+    # Another process's listener must not wait for the whole scan
+    other.update([response(suggestions='Offline mode')])
+    assert time.monotonic() - started < 0.2
+    rebuilder.join()
+
+    # The staging table was swapped in, not left behind
+    tables = rebuilding._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+    assert not [name for name, in tables if re.search('_[0-9a-f]{32}', name)]
+    assert not rebuilding.is_empty()
+
+
+def test_rebuild_while_another_process_commits(tmp_path, monkeypatch):
+    # Two stores on one segment directory stand in for two server processes
+    rebuilding, committing = open_store('segments', tmp_path), open_store('segments', tmp_path)
+    path = str(tmp_path / 'aggregates.db')
+    counts = aggregates.attach(rebuilding, path)
+    aggregates.attach(committing, path)
+    rebuilding.append_many([response() for _ in range(40)])
+
+    chunks = rebuilding.iter_chunks
+
+    def slow_chunks(**options):
+        for chunk in chunks(**{**options, 'chunk_size': 10}):
+            time.sleep(0.05)
+            yield chunk
+
+    monkeypatch.setattr(rebuilding, 'iter_chunks', slow_chunks)
+    def commit():
+        for _ in range(30):
+            committing.append(response())
+            time.sleep(0.01)
+
+    committer = threading.Thread(target=commit)
+    committer.start()
+    while committer.is_alive():
+        rebuilding.rebuild_listeners()
+        time.sleep(0.05)
+    committer.join()
+    assert counts.total() == len(rebuilding.load())
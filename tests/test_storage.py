@@ -0,0 +1,127 @@
+import os
+import threading
+
+import pytest
+
+import storage
+from conftest import open_store, response
+
+
+def test_submit_completes_during_slow_load(store, monkeypatch):
+    store.append(response())
+    reading, release = threading.Event(), threading.Event()
+    read = store._read
+
+    def slow_read(questionnaire, columns):
+        reading.set()
+        release.wait(10)
+        return read(questionnaire, columns)
+
+    monkeypatch.setattr(store, '_read', slow_read)
+    loader = threading.Thread(target=store.load)
+    loader.start()
+    try:
+        assert reading.wait(5)
+        writer = storage.GroupCommitWriter(store)
+        # Well under the app's durability timeout, although the load is still reading
+        writer.submit(response()).result(timeout=2)
+    finally:
+        release.set()
+        loader.join()
+    assert len(store.load()) == 2
+
+
+def test_query_pages_match_sorted_responses(store):
+    store.append_many([response(user=f'User {i % 3}', timestamp=f'2026-03-{i + 1:02d} 09:30:00')
+                       for i in range(8)])
+    total, first = store.query({'user': 'User 1'}, sort='timestamp', limit=2)
+    _, second = store.query({'user': 'User 1'}, sort='timestamp', limit=2, offset=2)
+    assert total == 3
+    assert list(first['timestamp'].astype(str)) == ['2026-03-08 09:30:00', '2026-03-05 09:30:00']
+    assert list(second['timestamp'].astype(str)) == ['2026-03-02 09:30:00']
+    # A commit after the matches were cached shows up in the next query
+    store.append(response(user='User 1', timestamp='2026-03-09 09:30:00'))
+    total, first = store.query({'user': 'User 1'}, sort='timestamp', limit=1)
+    assert total == 4
+    assert str(first['timestamp'].iloc[0]) == '2026-03-09 09:30:00'
+
+
+def test_query_commits_during_slow_read(store, monkeypatch):
+    store.append(response())
+    if isinstance(store, storage.SqliteStore):
+        pytest.skip("sqlite answers queries from its indexes")
+    reading, release = threading.Event(), threading.Event()
+    read_matches = store._read_matches
+
+    def slow_read_matches(filters):
+        reading.set()
+        release.wait(10)
+        return read_matches(filters)
+
+    monkeypatch.setattr(store, '_read_matches', slow_read_matches)
+    querier = threading.Thread(target=store.query)
+    querier.start()
+    try:
+        assert reading.wait(5)
+        storage.GroupCommitWriter(store).submit(response()).result(timeout=2)
+    finally:
+        release.set()
+        querier.join()
+    assert store.query()[0] == 2
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.mark.parametrize('backend', ['csv', 'parquet'])
+def test_compaction_crash_before_emptying_log(backend, tmp_path, monkeypatch):
+    store = open_store(backend, tmp_path)
+    store.append_many([response() for _ in range(3)])
+    store.compact()
+    store.append_many([response() for _ in range(2)])
+
+    replace = os.replace
+
+    def crash_after_replace(src, dst):
+        replace(src, dst)
+        raise Crash()
+
+    # Die after the compacted data is in place, before the log is emptied
+    monkeypatch.setattr(storage.os, 'replace', crash_after_replace)
+    with pytest.raises(Crash):
+        store.compact()
+    monkeypatch.undo()
+
+    reopened = open_store(backend, tmp_path)
+    assert sorted(reopened.load()['seq']) == [1, 2, 3, 4, 5]
+    assert sorted(seq for chunk in reopened.iter_chunks() for seq in chunk['seq']) == [1, 2, 3, 4, 5]
+    assert reopened.compact() == 0
+    reopened.append(response())
+    assert reopened.compact() == 1
+    assert sorted(reopened.load()['seq']) == [1, 2, 3, 4, 5, 6]
+
+
+def test_partition_compaction_crash_between_partitions(tmp_path, monkeypatch):
+    store = open_store('parquet', tmp_path)
+    store.append_many([response(timestamp='2026-02-10 09:30:00'), response(timestamp='2026-03-10 09:30:00')])
+    store.compact()
+    store.append_many([response(timestamp='2026-03-11 09:30:00'), response(timestamp='2026-02-11 09:30:00')])
+
+    replace = os.replace
+
+    def crash_after_first_partition(src, dst):
+        replace(src, dst)
+        raise Crash()
+
+    # Die with one touched partition replaced and the other still old
+    monkeypatch.setattr(storage.os, 'replace', crash_after_first_partition)
+    with pytest.raises(Crash):
+        store.compact()
+    monkeypatch.undo()
+
+    reopened = open_store('parquet', tmp_path)
+    assert sorted(reopened.load()['seq']) == [1, 2, 3, 4]
+    assert reopened.compact() == 1
+    assert sorted(reopened.load()['seq']) == [1, 2, 3, 4]
+    assert sorted(reopened.query()[1]['seq']) == [1, 2, 3, 4]
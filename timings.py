@@ -0,0 +1,161 @@
+"""Timings of the app's hot paths, counted in process-wide histograms.
+
+Code is timed with ``Timings.phase`` (a context manager) or ``Timings.timed``
+(a decorator). Each duration lands in its name's histogram of fixed
+millisecond buckets, so memory stays constant however long the server runs.
+While a rerun is traced, its durations are also collected for that rerun, so
+the admin can see where the time of one session's recent reruns went.
+
+Disabled timings hand back the undecorated function from ``timed`` and a
+shared do-nothing context from ``phase``, so switched-off instrumentation
+adds no clock reads, locking or bookkeeping.
+"""
+import bisect
+import threading
+import time
+from contextlib import nullcontext
+from functools import wraps
+
+# Upper bounds of the histogram buckets in milliseconds; one more bucket
+# counts everything slower
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+PERCENTILES = (50, 95, 99)
+
+_NO_PHASE = nullcontext()
+
+
+class Histogram:
+    """Counts of durations per bucket, with their count, sum and maximum"""
+
+    def __init__(self, bounds=BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, p):
+        """Estimate the ``p``-th percentile in ms, interpolating within its bucket"""
+        if not self.count:
+            return None
+        rank = self.count * p / 100
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+
+class _Phase:
+    """Times one block; a plain class, as it is cheaper to enter than a generator"""
+
+    __slots__ = ('timings', 'name', 'started')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        # Also when the block ends with st.rerun() or an error
+        self.timings.observe(self.name, time.perf_counter() - self.started)
+
+
+class Timings:
+    """Histograms of named durations, shared by every thread in the process"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._histograms = {}
+        self._lock = threading.Lock()
+        # Durations of the rerun being traced on each script thread
+        self._local = threading.local()
+
+    def observe(self, name, seconds):
+        """Count a duration under ``name`` and add it to the current trace"""
+        ms = seconds * 1000
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(ms)
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace[name] = trace.get(name, 0.0) + ms
+
+    def phase(self, name):
+        """Return a context manager that times its block under ``name``"""
+        if not self.enabled:
+            return _NO_PHASE
+        return _Phase(self, name)
+
+    def timed(self, name):
+        """Decorate a function so each call is timed under ``name``"""
+        def decorate(function):
+            if not self.enabled:
+                return function
+
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - started)
+            return wrapper
+        return decorate
+
+    def start_trace(self):
+        """Start collecting this thread's durations, by name, until ``finish_trace``"""
+        if self.enabled:
+            self._local.trace = {}
+
+    def finish_trace(self):
+        """Stop tracing this thread; return the traced ms by name, or None"""
+        trace = getattr(self._local, 'trace', None)
+        self._local.trace = None
+        return trace
+
+    def histograms(self):
+        """Return a copy of every histogram by name"""
+        with self._lock:
+            copies = {}
+            for name, histogram in self._histograms.items():
+                copy = copies[name] = Histogram(histogram.bounds)
+                copy.counts = list(histogram.counts)
+                copy.count, copy.total, copy.max = histogram.count, histogram.total, histogram.max
+            return copies
+
+    def summary(self):
+        """Return a row per name: count, mean, percentiles and maximum in ms, slowest total first"""
+        rows = []
+        for name, histogram in self.histograms().items():
+            row = {'phase': name, 'count': histogram.count, 'total_ms': histogram.total,
+                   'mean_ms': histogram.total / histogram.count}
+            for p in PERCENTILES:
+                row[f'p{p}_ms'] = histogram.percentile(p)
+            row['max_ms'] = histogram.max
+            rows.append(row)
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+    def reset(self):
+        """Forget every recorded duration"""
+        with self._lock:
+            self._histograms.clear()
+
+
+# For code that takes optional timings
+DISABLED = Timings(enabled=False)